@@ -1,5 +1,6 @@
 import streamlit as st
-from PIL import Image
+
+from utils.warmup import schedule, scheduler
 
 st.set_page_config(
     page_title='Home',
@@ -10,6 +11,14 @@ st.sidebar.markdown( '# Curry Company' )
 st.sidebar.markdown( '## Fastest Delivery in Town' )
 st.sidebar.markdown( """---""" )
 
+# Pré-cálculo das métricas de todas as páginas, mesmo antes de serem abertas
+schedule()
+
+# Andamento do pré-cálculo das métricas em segundo plano
+progress = scheduler.progress
+if progress['running'] and progress['total']:
+    st.sidebar.progress( progress['done'] / progress['total'], text='Pré-calculando métricas' )
+
 st.write( '# Curry Company Growth Dashboard' )
          
 st.markdown(
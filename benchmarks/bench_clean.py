@@ -0,0 +1,124 @@
+# ================================
+# Benchmark da limpeza dos dados
+# ================================
+#
+# Compara a limpeza original (read_csv + clean_code com uma máscara por
+# coluna) com a leitura tipada do utils.data, sobre o train.csv replicado
+# N vezes. Cada variante roda em um processo separado para que o pico de
+# memória (ru_maxrss) de uma não contamine a outra.
+#
+# Uso: python benchmarks/bench_clean.py [--scale 100]
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from utils.data import DATA_PATH, clean_code, read_data
+
+
+def legacy_clean_code( df1 ):
+    """
+        Versão original da limpeza, mantida apenas como referência
+        
+        Input: Dataframe lido com pd.read_csv sem tipos
+        Output: Dataframe
+    """
+    df1.loc[ : , 'ID'] = df1.loc[ : , 'ID'].str.strip()
+    df1.loc[ : , 'Road_traffic_density'] = df1.loc[ : , 'Road_traffic_density'].str.strip()
+    df1.loc[ : , 'Type_of_order'] = df1.loc[ : , 'Type_of_order'].str.strip()
+    df1.loc[ : , 'Type_of_vehicle'] = df1.loc[ : , 'Type_of_vehicle'].str.strip()
+    df1.loc[ : , 'City'] = df1.loc[ : , 'City'].str.strip()
+    df1.loc[ : , 'Festival'] = df1.loc[ : , 'Festival'].str.strip()
+
+    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, : ]
+    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :]
+    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN'
+    df1 = df1.loc[linhas_selecionadas, :]
+    linhas_selecionadas = df1['City'] != 'NaN'
+    df1 = df1.loc[linhas_selecionadas, :]
+    linhas_selecionadas = df1['Festival'] != 'NaN'
+    df1 = df1.loc[linhas_selecionadas, :]
+    linhas_selecionadas = df1['Time_taken(min)'] != 'NaN'
+    df1 = df1.loc[linhas_selecionadas, :]
+    df1 = df1[df1['Time_taken(min)'].notnull()]
+
+    df1 = df1.reset_index( drop=True )
+
+    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype( int )
+    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype( float )
+    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype( int )
+    df1['Order_Date'] = pd.to_datetime( df1['Order_Date'], format='%d-%m-%Y' )
+    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply( lambda x: x.split( '(min) ')[1] )
+    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype( int )
+
+    return df1
+
+def scale_csv( path, scale ):
+    """
+        Gera um CSV com as linhas do train.csv repetidas scale vezes
+        
+        Input: caminho de destino, fator de escala
+        Output: caminho do arquivo gerado
+    """
+    with open( DATA_PATH ) as f:
+        header = f.readline()
+        body = f.read()
+
+    # A última linha do train.csv não termina com quebra de linha
+    if not body.endswith( '\n' ):
+        body += '\n'
+
+    with open( path, 'w' ) as f:
+        f.write( header )
+        for _ in range( scale ):
+            f.write( body )
+
+    return path
+
+def run_variant( variant, path ):
+    inicio = time.perf_counter()
+    if variant == 'legacy':
+        df1 = legacy_clean_code( pd.read_csv( path ) )
+    else:
+        df1 = clean_code( read_data( path ) )
+    tempo = time.perf_counter() - inicio
+
+    # ru_maxrss vem em KB no Linux
+    pico = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024
+    memoria = df1.memory_usage( deep=True ).sum() / 2**20
+    print( f'{variant};{len(df1)};{tempo:.3f};{pico:.1f};{memoria:.1f}' )
+
+def main():
+    parser = argparse.ArgumentParser( description="Benchmark da limpeza dos dados" )
+    parser.add_argument( '--scale', type=int, default=100 )
+    parser.add_argument( '--run', choices=['legacy', 'schema'] )
+    parser.add_argument( '--path' )
+    args = parser.parse_args()
+
+    if args.run:
+        run_variant( args.run, args.path )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = scale_csv( os.path.join( tmp, 'train.csv' ), args.scale )
+
+        print( f'train.csv x{args.scale}' )
+        print( f'{"variante":<10}{"linhas":>12}{"tempo (s)":>12}{"pico RSS (MB)":>16}{"dataframe (MB)":>16}' )
+        for variant in ['legacy', 'schema']:
+            saida = subprocess.run( [sys.executable, __file__, '--run', variant, '--path', path],
+                                    capture_output=True, text=True, check=True ).stdout
+            nome, linhas, tempo, pico, memoria = saida.strip().split( ';' )
+            print( f'{nome:<10}{linhas:>12}{tempo:>12}{pico:>16}{memoria:>16}' )
+
+if __name__ == '__main__':
+    main()
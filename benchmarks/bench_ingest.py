@@ -0,0 +1,101 @@
+# ================================
+# Benchmark da ingestão incremental
+# ================================
+#
+# Copia metade do train.csv (replicado N vezes) para um arquivo temporário,
+# carrega o dataframe e o cubo, e acrescenta o restante das linhas em lotes.
+# A cada lote mede o tempo da atualização incremental e confere que o
+# dataframe é idêntico ao de uma limpeza completa do arquivo, e que os
+# agregados do cubo são os mesmos.
+#
+# Uso: python benchmarks/bench_ingest.py [--scale 1] [--batches 5]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from benchmarks.bench_clean import scale_csv
+from utils import data
+from utils.cube import build_cube, load_cube
+
+# Agrupamentos conferidos entre o cubo incremental e o reconstruído
+ROLLUPS = [[], 'Order_Date', 'week_of_year', ['City', 'Road_traffic_density'], ['City', 'Type_of_order']]
+
+
+def compare_cubes( incremental, full ):
+    """
+        Confere os agregados dos dois cubos
+
+        Contagens, entregadores distintos e tempos médios por entregador (somas
+        de minutos inteiros) devem ser iguais. As médias e desvios do rollup
+        vêm da combinação dos acumuladores de Welford, que depende da ordem em
+        que os blocos foram somados, e são comparados com tolerância relativa
+        de 1e-9.
+    """
+    for by in ROLLUPS:
+        a, b = incremental.rollup( by ), full.rollup( by )
+        for col in a.columns:
+            if a[col].dtype.kind == 'f':
+                ok = np.allclose( a[col], b[col], rtol=1e-9, equal_nan=True )
+            else:
+                ok = ( a[col].astype( str ) == b[col].astype( str ) ).all()
+            assert ok, f'cubo diferente em {by} / {col}'
+
+    a = incremental.courier_rollup( ['City', 'Delivery_person_ID'] )
+    b = full.courier_rollup( ['City', 'Delivery_person_ID'] )
+    assert ( a['orders'].to_numpy() == b['orders'].to_numpy() ).all(), 'pedidos por entregador diferentes'
+    assert np.array_equal( a['time_mean'], b['time_mean'], equal_nan=True ), 'tempo médio por entregador diferente'
+
+def run( scale, batches ):
+    with tempfile.TemporaryDirectory() as tmp:
+        with open( scale_csv( os.path.join( tmp, 'source.csv' ), scale ), 'rb' ) as f:
+            header = f.readline()
+            linhas = f.readlines()
+
+        inicial = len( linhas ) // 2
+        lotes = np.array_split( np.arange( inicial, len( linhas ) ), batches )
+
+        path = os.path.join( tmp, 'train.csv' )
+        with open( path, 'wb' ) as f:
+            f.write( header + b''.join( linhas[:inicial] ) )
+
+        data.load_data( path )
+        load_cube( path, max_memory_mb=None )
+
+        for i, lote in enumerate( lotes, 1 ):
+            with open( path, 'ab' ) as f:
+                f.write( b''.join( linhas[j] for j in lote ) )
+
+            t = time.perf_counter()
+            df1 = data.load_data( path )
+            cube = load_cube( path, max_memory_mb=None )
+            incremental = time.perf_counter() - t
+
+            t = time.perf_counter()
+            df_full = data._build( path, use_snapshot=False )[0]
+            cube_full = build_cube( df_full )
+            completo = time.perf_counter() - t
+
+            pd.testing.assert_frame_equal( df1, df_full )
+            compare_cubes( cube, cube_full )
+
+            print( f'lote {i}: +{len( lote )} linhas, {len( df1 )} pedidos, '
+                   f'incremental {incremental:.3f}s, completo {completo:.3f}s' )
+
+        print( f"atualizações incrementais: {data.cache_stats['appends']}" )
+        data.clear_cache()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Compara a ingestão incremental com a reconstrução completa' )
+    parser.add_argument( '--scale', type=int, default=1, help='quantas vezes o train.csv é replicado' )
+    parser.add_argument( '--batches', type=int, default=5 )
+    args = parser.parse_args()
+
+    run( args.scale, args.batches )
@@ -0,0 +1,295 @@
+# ================================
+# Suíte de benchmarks
+# ================================
+#
+# Mede tempo e pico de memória de cada etapa do dashboard sobre arquivos
+# sintéticos (benchmarks/synthetic.py) de vários tamanhos:
+#
+# - ingestão (read_data) e limpeza (clean_code)
+# - estruturas derivadas: cubo, estatísticas, FilterIndex, índices espaciais
+#   e ranking de entregadores
+# - cada métrica das três páginas (utils.metrics), no estado padrão dos filtros
+# - execução completa dos scripts (Home e páginas) com o Streamlit, a frio e
+#   a quente
+#
+# Cada tamanho roda em um processo separado, para que o pico de RSS de um não
+# contamine o outro. O tempo é o menor de --repeat execuções; o pico de
+# memória vem de uma execução extra com tracemalloc (alocações do Python e do
+# NumPy) e o RSS máximo do processo vem de ru_maxrss.
+#
+# Os resultados são gravados em benchmarks/results/<data>_<commit>.json e
+# podem ser comparados com os de outro commit:
+#
+#   python benchmarks/bench_suite.py --sizes 10k,1M
+#   python benchmarks/bench_suite.py --sizes 10k,1M --compare benchmarks/results/<anterior>.json
+#
+# Os CSVs sintéticos ficam em benchmarks/data e são reaproveitados.
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path.insert( 0, ROOT )
+
+from benchmarks.synthetic import generate, parse_rows
+
+DATA_DIR = os.path.join( ROOT, 'benchmarks', 'data' )
+RESULTS_DIR = os.path.join( ROOT, 'benchmarks', 'results' )
+PAGES = ['Home.py', 'pages/1_visao_empresa.py', 'pages/2_visao_entregadores.py', 'pages/3_visao_restaurantes.py']
+
+# Variação a partir da qual uma etapa é marcada como regressão
+THRESHOLD = 0.2
+
+
+def measure( func, repeat ):
+    """
+        Esta função tem a responsabilidade de medir uma etapa
+
+        Input: função sem argumentos, quantidade de repetições
+        Output: (resultado, { seconds, peak_mb })
+    """
+    tempos = []
+    for _ in range( repeat ):
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append( time.perf_counter() - inicio )
+
+    # Execução separada para a memória: o tracemalloc deixa o código mais lento
+    gc.collect()
+    tracemalloc.start()
+    func()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return resultado, { 'seconds': min( tempos ), 'peak_mb': pico / 2**20 }
+
+def max_rss_mb():
+    # ru_maxrss vem em KB no Linux
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024
+
+def run_steps( path, repeat ):
+    """
+        Ingestão, limpeza, estruturas derivadas e métricas, no processo atual
+    """
+    from utils.cache import results
+    from utils.couriers import CourierTable
+    from utils.cube import build_cube
+    from utils.data import clean_code, read_data
+    from utils.eta import EtaModel, OrderEta
+    from utils.filters import FilterIndex
+    from utils.leaderboard import Leaderboard
+    from utils.metrics import DEFAULT_DATE, DEFAULT_TRAFFIC, METRICS, FilterContext
+    from utils.spatial import OrderLocations
+    from utils.stats import StatsEngine
+
+    steps = {}
+    df_raw, steps['read_data'] = measure( lambda: read_data( path ), repeat )
+    df1, steps['clean_code'] = measure( lambda: clean_code( df_raw.copy() ), repeat )
+    del df_raw
+
+    cube, steps['build_cube'] = measure( lambda: build_cube( df1 ), repeat )
+    _, steps['filter_cube'] = measure( lambda: cube.filter( DEFAULT_DATE, DEFAULT_TRAFFIC ), repeat )
+    # StatsEngine novo a cada vez: o do cubo guarda o resultado por estado
+    _, steps['stats'] = measure( lambda: StatsEngine( cube ).get( DEFAULT_DATE, DEFAULT_TRAFFIC ), repeat )
+    filter_index, steps['filter_index'] = measure( lambda: FilterIndex( df1 ), repeat )
+    # Interseção de três dimensões além da data e do tráfego
+    _, steps['filter_rows'] = measure( lambda: filter_index.rows( DEFAULT_DATE, ['Low', 'Jam'],
+                                                                  { 'City': ['Urban'], 'Festival': ['No'],
+                                                                    'Type_of_vehicle': ['motorcycle'] } ), repeat )
+    locations, steps['locations'] = measure( lambda: OrderLocations( df1 ), repeat )
+    couriers, steps['couriers'] = measure( lambda: CourierTable( df1 ), repeat )
+    _, steps['leaderboard'] = measure( lambda: Leaderboard.from_cube( cube.filter( DEFAULT_DATE, DEFAULT_TRAFFIC ) ),
+                                       repeat )
+    _, steps['eta_fit'] = measure( lambda: EtaModel().fit( df1 ), repeat )
+    eta = OrderEta( df1, path )
+    # Cenário: todos os pedidos previstos com tráfego 'Jam'
+    _, steps['eta_scenario'] = measure( lambda: eta.predict( Road_traffic_density='Jam' ), repeat )
+
+    # Fontes do estado padrão prontas, para medir apenas cada métrica
+    context = FilterContext( DEFAULT_DATE, DEFAULT_TRAFFIC, path )
+    context._sources.update( cube=cube.filter( DEFAULT_DATE, DEFAULT_TRAFFIC ),
+                             stats=cube.stats.get( DEFAULT_DATE, DEFAULT_TRAFFIC ),
+                             rows=filter_index.rows( DEFAULT_DATE, DEFAULT_TRAFFIC ),
+                             locations=locations, couriers=couriers, eta=eta )
+    context.source( 'leaderboard' )
+
+    for name in METRICS:
+        def compute():
+            results.clear()
+            return context.query( name )
+        _, steps[f'metric:{name}'] = measure( compute, repeat )
+
+    return { 'rows': len( df1 ), 'steps': steps, 'max_rss_mb': max_rss_mb() }
+
+def run_pages( path, repeat ):
+    """
+        Execução completa dos scripts com o Streamlit: a primeira vez de cada
+        página (a primeira paga a leitura e as estruturas derivadas) e a
+        menor das execuções seguintes
+    """
+    from streamlit.testing.v1 import AppTest
+
+    from utils.eta import model_path_for
+    from utils.snapshot import snapshot_dir_for
+
+    # Sem snapshot nem modelo de uma execução anterior, para que a frio seja a frio
+    shutil.rmtree( snapshot_dir_for( path ), ignore_errors=True )
+    if os.path.exists( model_path_for( path ) ):
+        os.remove( model_path_for( path ) )
+
+    steps = {}
+    for page in PAGES:
+        def script():
+            at = AppTest.from_file( os.path.join( ROOT, page ), default_timeout=3600 ).run()
+            if at.exception:
+                raise RuntimeError( f'{page}: {at.exception[0].value}' )
+
+        inicio = time.perf_counter()
+        script()
+        steps[f'script_cold:{page}'] = { 'seconds': time.perf_counter() - inicio }
+
+        tempos = []
+        for _ in range( repeat ):
+            inicio = time.perf_counter()
+            script()
+            tempos.append( time.perf_counter() - inicio )
+        steps[f'script_warm:{page}'] = { 'seconds': min( tempos ) }
+
+    return { 'steps': steps, 'max_rss_mb': max_rss_mb() }
+
+def subprocess_run( mode, path, repeat ):
+    # CURRY_DATA precisa estar definido antes de importar utils.data; os
+    # modelos de previsão dos arquivos sintéticos ficam junto deles
+    env = dict( os.environ, CURRY_DATA=path, CURRY_WARMUP='0', CURRY_MODEL_DIR=os.path.join( DATA_DIR, 'models' ) )
+    saida = subprocess.run( [sys.executable, __file__, '--run', mode, '--path', path, '--repeat', str( repeat )],
+                            capture_output=True, text=True, env=env, cwd=ROOT )
+    if saida.returncode != 0:
+        raise RuntimeError( saida.stderr )
+    return json.loads( saida.stdout.strip().splitlines()[-1] )
+
+def dataset( label, seed ):
+    """
+        CSV sintético do tamanho pedido, gerado na primeira vez
+    """
+    os.makedirs( DATA_DIR, exist_ok=True )
+    path = os.path.join( DATA_DIR, f'synthetic_{label}_seed{seed}.csv' )
+    if not os.path.exists( path ):
+        print( f'gerando {path}...', file=sys.stderr )
+        generate( path + '.tmp', parse_rows( label ), seed )
+        os.replace( path + '.tmp', path )
+    return path
+
+def git_commit():
+    try:
+        commit = subprocess.run( ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                 cwd=ROOT, check=True ).stdout.strip()
+        sujo = subprocess.run( ['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=ROOT ).stdout.strip()
+        return commit + ( '-dirty' if sujo else '' )
+    except ( OSError, subprocess.CalledProcessError ):
+        return 'unknown'
+
+def compare( atual, anterior, threshold=THRESHOLD ):
+    """
+        Esta função tem a responsabilidade de comparar dois resultados
+
+        Input: resultado atual, resultado anterior, variação tolerada
+        Output: lista de (tamanho, etapa, medida, antes, depois) das regressões
+    """
+    import pandas as pd
+    import numpy as np
+
+    linhas = []
+    for label, medidas in atual['sizes'].items():
+        antes = anterior['sizes'].get( label, {} ).get( 'steps', {} )
+        for step, valores in medidas['steps'].items():
+            for medida in ['seconds', 'peak_mb']:
+                if medida in valores and medida in antes.get( step, {} ):
+                    linhas.append( ( label, step, medida, antes[step][medida], valores[medida] ) )
+
+    df = pd.DataFrame( linhas, columns=['size', 'step', 'measure', 'before', 'after'] )
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        df['change'] = df['after'] / df['before'] - 1
+    # Diferenças muito pequenas em valores absolutos são ruído
+    minimo = np.where( df['measure'] == 'seconds', 0.005, 1.0 )
+    df['regression'] = ( df['change'] > threshold ) & ( df['after'] - df['before'] > minimo )
+
+    print( f"\ncomparação com {anterior['commit']} ({anterior['date']})" )
+    with pd.option_context( 'display.max_rows', None, 'display.width', 160 ):
+        print( df.assign( change=( df['change'] * 100 ).round( 1 ).astype( str ) + '%' )
+                 .to_string( index=False, float_format='{:.4f}'.format ) )
+
+    return df.loc[df['regression'], ['size', 'step', 'measure', 'before', 'after']].itertuples( index=False,
+                                                                                               name=None )
+
+def print_result( label, medidas ):
+    print( f"\n{label}: {medidas.get( 'rows', '?' )} pedidos limpos, RSS máximo {medidas['max_rss_mb']:.0f} MB "
+           f"(páginas: {medidas.get( 'pages_max_rss_mb', 0 ):.0f} MB)" )
+    print( f'{"etapa":<48}{"tempo (s)":>12}{"pico (MB)":>12}' )
+    for step, valores in medidas['steps'].items():
+        pico = f"{valores['peak_mb']:.1f}" if 'peak_mb' in valores else '-'
+        print( f"{step:<48}{valores['seconds']:>12.4f}{pico:>12}" )
+
+def main():
+    parser = argparse.ArgumentParser( description='Suíte de benchmarks do dashboard' )
+    parser.add_argument( '--sizes', default='10k,1M', help='tamanhos dos arquivos sintéticos (10k,1M,50M)' )
+    parser.add_argument( '--repeat', type=int, default=3 )
+    parser.add_argument( '--seed', type=int, default=0 )
+    parser.add_argument( '--no-pages', action='store_true', help='não executa os scripts do Streamlit' )
+    parser.add_argument( '--output', help='arquivo de resultado (padrão: benchmarks/results/<data>_<commit>.json)' )
+    parser.add_argument( '--compare', help='resultado anterior para comparação' )
+    parser.add_argument( '--threshold', type=float, default=THRESHOLD )
+    parser.add_argument( '--run', choices=['steps', 'pages'], help=argparse.SUPPRESS )
+    parser.add_argument( '--path', help=argparse.SUPPRESS )
+    args = parser.parse_args()
+
+    if args.run:
+        medidas = run_steps( args.path, args.repeat ) if args.run == 'steps' else run_pages( args.path, args.repeat )
+        print( json.dumps( medidas ) )
+        return 0
+
+    import numpy as np
+    import pandas as pd
+
+    resultado = { 'commit': git_commit(), 'date': datetime.datetime.now().isoformat( timespec='seconds' ),
+                  'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                  'machine': platform.machine(), 'cpus': os.cpu_count(), 'repeat': args.repeat, 'sizes': {} }
+
+    for label in [s.strip() for s in args.sizes.split( ',' ) if s.strip()]:
+        path = dataset( label, args.seed )
+        medidas = subprocess_run( 'steps', path, args.repeat )
+        if not args.no_pages:
+            paginas = subprocess_run( 'pages', path, args.repeat )
+            medidas['steps'].update( paginas['steps'] )
+            medidas['pages_max_rss_mb'] = paginas['max_rss_mb']
+        resultado['sizes'][label] = medidas
+        print_result( label, medidas )
+
+    output = args.output or os.path.join( RESULTS_DIR, f"{resultado['date'][:10]}_{resultado['commit']}.json" )
+    os.makedirs( os.path.dirname( os.path.abspath( output ) ), exist_ok=True )
+    with open( output, 'w' ) as f:
+        json.dump( resultado, f, indent=1 )
+    print( f'\nresultado gravado em {output}' )
+
+    if args.compare:
+        with open( args.compare ) as f:
+            regressoes = list( compare( resultado, json.load( f ), args.threshold ) )
+        for label, step, medida, antes, depois in regressoes:
+            print( f'REGRESSÃO {label} {step} {medida}: {antes:.4f} -> {depois:.4f}' )
+        return 1 if regressoes else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
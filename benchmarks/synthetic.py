@@ -0,0 +1,230 @@
+# ================================
+# Gerador de dados sintéticos
+# ================================
+#
+# Gera arquivos no formato do train.csv com qualquer número de linhas, a
+# partir das distribuições do arquivo real:
+#
+# - cada restaurante do train.csv é um modelo (prefixo e coordenadas);
+#   acima da quantidade real são criados restaurantes novos perto dos
+#   originais, com 3 entregadores cada (DEL01 a DEL03), como no arquivo real
+# - idade e avaliação são fixas por entregador
+# - datas, horários, clima, tráfego, cidade, veículo, tipo de pedido,
+#   festival e entregas múltiplas seguem as frequências reais
+# - os 'NaN ' são sorteados por linha como um padrão conjunto (quais colunas
+#   estão vazias), porque no arquivo real eles aparecem juntos
+# - o local de entrega é o restaurante mais um deslocamento real e o tempo
+#   de entrega ('(min) N') segue a distribuição real do tipo de tráfego
+#
+# O arquivo é escrito em blocos, então 50 milhões de linhas não precisam
+# caber na memória.
+#
+# Uso: python benchmarks/synthetic.py 1M dataset/synthetic_1M.csv [--seed 0]
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from utils.data import DATA_PATH
+
+COURIERS_PER_RESTAURANT = 3
+CHUNK_ROWS = 1_000_000
+
+# Colunas sorteadas linha a linha com a frequência do arquivo real
+ROW_COLUMNS = ['Order_Date', 'Time_Orderd', 'Weatherconditions', 'Road_traffic_density', 'Vehicle_condition',
+               'Type_of_order', 'Type_of_vehicle', 'multiple_deliveries', 'Festival', 'City']
+
+# Colunas com valores vazios e o texto usado no train.csv
+SENTINELS = {
+    'Delivery_person_Age': 'NaN ', 'Delivery_person_Ratings': 'NaN ', 'Time_Orderd': 'NaN ',
+    'Weatherconditions': 'conditions NaN', 'Road_traffic_density': 'NaN ', 'multiple_deliveries': 'NaN ',
+    'Festival': 'NaN ', 'City': 'NaN ',
+}
+
+
+def parse_rows( text ):
+    """
+        Quantidade de linhas a partir de textos como 10k, 1M ou 50M
+    """
+    text = str( text ).strip().upper()
+    fator = { 'K': 10**3, 'M': 10**6, 'G': 10**9 }.get( text[-1:], 1 )
+    return int( float( text.rstrip( 'KMG' ) ) * fator )
+
+def default_couriers( rows, real ):
+    """
+        Entregadores distintos para um arquivo de rows linhas: os do arquivo
+        real até 60 mil linhas e, acima disso, um a cada 50 pedidos, até 200 mil
+    """
+    return int( np.clip( rows // 50, real, 200_000 ) )
+
+def frequencies( serie ):
+    contagem = serie.value_counts()
+    return contagem.index.to_numpy( dtype=object ), ( contagem / contagem.sum() ).to_numpy()
+
+
+class Profile:
+    """
+        Distribuições do train.csv usadas pelo gerador
+
+        Input: caminho do train.csv
+    """
+
+    def __init__( self, path=DATA_PATH ):
+        df = pd.read_csv( path, dtype=str, keep_default_na=False, na_values=[''] )
+        # A última linha do train.csv está incompleta
+        df = df.dropna()
+
+        self.columns = df.columns.tolist()
+        vazios = pd.DataFrame( { col: df[col] == texto for col, texto in SENTINELS.items() } )
+
+        # Valores preenchidos de cada coluna e os padrões de colunas vazias
+        self.row_values = { col: frequencies( df.loc[~vazios[col], col] if col in SENTINELS else df[col] )
+                            for col in ROW_COLUMNS }
+        self.courier_values = { col: frequencies( df.loc[~vazios[col], col] )
+                                for col in ['Delivery_person_Age', 'Delivery_person_Ratings'] }
+        padroes = vazios.value_counts( normalize=True )
+        self.nan_patterns = ( padroes.index.to_frame( index=False ).to_numpy( dtype=bool ), padroes.to_numpy() )
+        self.picked = frequencies( df['Time_Order_picked'] )
+
+        # Restaurantes: um por coordenada, com o prefixo mais comum
+        df['restaurant'] = df['Delivery_person_ID'].str.split( 'DEL' ).str[0]
+        grupos = df.groupby( ['Restaurant_latitude', 'Restaurant_longitude'], sort=True )
+        self.restaurants = grupos.agg( restaurant=( 'restaurant', lambda s: s.mode().iloc[0] ) ).reset_index()
+        self.real_couriers = df['Delivery_person_ID'].nunique()
+
+        # Deslocamento do local de entrega e tempo de entrega por tráfego
+        rest = df[['Restaurant_latitude', 'Restaurant_longitude']].astype( float ).to_numpy()
+        entrega = df[['Delivery_location_latitude', 'Delivery_location_longitude']].astype( float ).to_numpy()
+        self.offsets = np.round( entrega - rest, 6 )
+        self.time_taken = { traffic: frequencies( grupo ) for traffic, grupo
+                            in df.groupby( 'Road_traffic_density' )['Time_taken(min)'] }
+
+
+def sample( rng, values, n ):
+    valores, probs = values
+    return valores[rng.choice( len( valores ), size=n, p=probs )]
+
+def couriers_table( profile, n_couriers, rng ):
+    """
+        Esta função tem a responsabilidade de montar os entregadores e seus
+        restaurantes
+
+        Input: Profile, quantidade de entregadores, gerador aleatório
+        Output: Dataframe com um entregador por linha
+    """
+    # Todos os restaurantes reais aparecem, mesmo com poucos entregadores
+    n_rest = max( -( -n_couriers // COURIERS_PER_RESTAURANT ), len( profile.restaurants ) )
+    modelos = profile.restaurants
+    copia, modelo = np.divmod( np.arange( n_rest ), len( modelos ) )
+    base = modelos.iloc[modelo].reset_index( drop=True )
+
+    # Restaurantes além dos reais: prefixo com outro número, perto do original
+    lat = base['Restaurant_latitude'].astype( float ).to_numpy()
+    lon = base['Restaurant_longitude'].astype( float ).to_numpy()
+    jitter = np.where( copia[:, None] > 0, rng.uniform( -0.05, 0.05, size=( n_rest, 2 ) ), 0 )
+    codigo = base['restaurant'].str.extract( r'^(.*RES)(\d+)$' )
+    numero = codigo[1].astype( int ).to_numpy() + 100 * copia
+    restaurantes = pd.DataFrame( {
+        'prefix': ( codigo[0] + pd.Series( numero ).map( '{:02d}'.format ) ).to_numpy(),
+        'Restaurant_latitude': np.where( copia > 0, np.char.mod( '%.6f', lat + jitter[:, 0] ),
+                                         base['Restaurant_latitude'] ),
+        'Restaurant_longitude': np.where( copia > 0, np.char.mod( '%.6f', lon + jitter[:, 1] ),
+                                          base['Restaurant_longitude'] ),
+    } )
+
+    rest, entregador = np.divmod( np.arange( n_couriers ), n_rest )[::-1]
+    couriers = restaurantes.iloc[rest].reset_index( drop=True )
+    couriers['Delivery_person_ID'] = ( couriers['prefix'] + 'DEL'
+                                       + pd.Series( entregador + 1 ).map( '{:02d} '.format ) )
+    for col, values in profile.courier_values.items():
+        couriers[col] = sample( rng, values, n_couriers )
+
+    return couriers
+
+# Horários 'HH:MM:00' de cada minuto do dia
+CLOCK = np.array( [f'{m // 60:02d}:{m % 60:02d}:00' for m in range( 1440 )], dtype=object )
+
+def _plus_minutes( times, minutes ):
+    # 'HH:MM:SS' + minutos, voltando a 00:00 depois da meia-noite; só os
+    # horários distintos são convertidos
+    codigos, distintos = pd.factorize( times )
+    inicio = np.array( [int( t[:2] ) * 60 + int( t[3:5] ) for t in distintos], dtype=np.int64 )
+    return CLOCK[( inicio[codigos] + minutes ) % 1440]
+
+def generate_chunk( profile, couriers, start, n, rng ):
+    """
+        Esta função tem a responsabilidade de gerar n linhas no formato do
+        train.csv
+
+        Input: Profile, tabela de entregadores, número da primeira linha,
+               quantidade de linhas, gerador aleatório
+        Output: Dataframe de textos, com as colunas do train.csv
+    """
+    df = pd.DataFrame( { col: sample( rng, profile.row_values[col], n ) for col in ROW_COLUMNS } )
+    df['ID'] = pd.Series( np.arange( start, start + n ) ).map( '0x{:x} '.format ).to_numpy()
+
+    quem = couriers.iloc[rng.integers( 0, len( couriers ), size=n )].reset_index( drop=True )
+    for col in ['Delivery_person_ID', 'Restaurant_latitude', 'Restaurant_longitude',
+                'Delivery_person_Age', 'Delivery_person_Ratings']:
+        df[col] = quem[col].to_numpy()
+
+    # Colunas vazias: um padrão do arquivo real por linha
+    padroes, probs = profile.nan_patterns
+    vazios = padroes[rng.choice( len( padroes ), size=n, p=probs )]
+    for i, ( col, texto ) in enumerate( SENTINELS.items() ):
+        df.loc[vazios[:, i], col] = texto
+
+    deslocamento = profile.offsets[rng.integers( 0, len( profile.offsets ), size=n )]
+    for i, ( origem, destino ) in enumerate( [( 'Restaurant_latitude', 'Delivery_location_latitude' ),
+                                              ( 'Restaurant_longitude', 'Delivery_location_longitude' )] ):
+        df[destino] = np.char.mod( '%.6f', df[origem].astype( float ).to_numpy() + deslocamento[:, i] )
+
+    # Retirada 5, 10 ou 15 minutos depois do pedido; sem horário do pedido,
+    # sorteia a retirada
+    df['Time_Order_picked'] = sample( rng, profile.picked, n )
+    com_horario = ( df['Time_Orderd'] != SENTINELS['Time_Orderd'] ).to_numpy()
+    df.loc[com_horario, 'Time_Order_picked'] = _plus_minutes( df.loc[com_horario, 'Time_Orderd'].to_numpy(),
+                                                              rng.choice( [5, 10, 15], size=com_horario.sum() ) )
+
+    df['Time_taken(min)'] = ''
+    for traffic, values in profile.time_taken.items():
+        linhas = ( df['Road_traffic_density'] == traffic ).to_numpy()
+        df.loc[linhas, 'Time_taken(min)'] = sample( rng, values, linhas.sum() )
+
+    return df.loc[:, profile.columns]
+
+def generate( path, rows, seed=0, couriers=None, chunk_rows=CHUNK_ROWS, profile=None ):
+    """
+        Esta função tem a responsabilidade de gravar um CSV sintético
+
+        Input: caminho de destino, quantidade de linhas, semente, quantidade
+               de entregadores (padrão: default_couriers), linhas por bloco
+        Output: caminho do arquivo gerado
+    """
+    profile = profile or Profile()
+    rng = np.random.default_rng( seed )
+    tabela = couriers_table( profile, couriers or default_couriers( rows, profile.real_couriers ), rng )
+
+    with open( path, 'w', newline='' ) as f:
+        for start in range( 0, rows, chunk_rows ):
+            df = generate_chunk( profile, tabela, start, min( chunk_rows, rows - start ), rng )
+            df.to_csv( f, index=False, header=( start == 0 ) )
+        if rows == 0:
+            f.write( ','.join( profile.columns ) + '\n' )
+
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Gera um CSV sintético no formato do train.csv' )
+    parser.add_argument( 'rows', help='quantidade de linhas (10k, 1M, 50M...)' )
+    parser.add_argument( 'path' )
+    parser.add_argument( '--seed', type=int, default=0 )
+    parser.add_argument( '--couriers', type=int, help='entregadores distintos' )
+    args = parser.parse_args()
+
+    generate( args.path, parse_rows( args.rows ), args.seed, args.couriers )
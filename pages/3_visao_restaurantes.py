@@ -2,168 +2,19 @@
 # Importando Bibliotecas
 # ================================
 
-import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 import streamlit as st
-import folium
-import datetime
-from streamlit_folium import folium_static
-from haversine import haversine
-from PIL import Image
+
+from utils.filters import load_domains, sidebar_filters
+from utils.metrics import FilterContext, available
+from utils.profiling import debug_panel, page_trace
+from utils.table import paged_table
+from utils.warmup import schedule
 
 st.set_page_config( page_title='Visão Restaurantes', layout='wide')
 
-# ===============================
-# Funções
-# ===============================
-def clean_code( df1 ):
-    """
-        Esta função tem a responsabilidade de limpar o dataframe
-        
-        Tipos de limpeza:
-        1. Remoção dos NaN
-        2. Mudança do tipo da coluna de dados
-        3. Remoção dos espaços das variáveis texto
-        4. Formatação da coluna de data
-        5. Limpeza da coluna de tempo (remoção do texto da variável numérica)
-        
-        Input: Dataframe
-        Output: Dataframe
-    """
-    
-    # Removendo os espaços depois das strings. 
-    df1.loc[ : , 'ID'] = df1.loc[ : , 'ID'].str.strip()
-    df1.loc[ : , 'Road_traffic_density'] = df1.loc[ : , 'Road_traffic_density'].str.strip()
-    df1.loc[ : , 'Type_of_order'] = df1.loc[ : , 'Type_of_order'].str.strip()
-    df1.loc[ : , 'Type_of_vehicle'] = df1.loc[ : , 'Type_of_vehicle'].str.strip()
-    df1.loc[ : , 'City'] = df1.loc[ : , 'City'].str.strip()
-    df1.loc[ : , 'Festival'] = df1.loc[ : , 'Festival'].str.strip()
-
-    # Excluindo as linhas vazias
-    # 1. Delivery_person_Age
-    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, : ]
-
-    # 2. Multiple_deliveries
-    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :]
-
-    # 3. Road_traffic_density
-    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN'
-    df1 = df1.loc[linhas_selecionadas, :]
-
-    # 4. City
-    linhas_selecionadas = df1['City'] != 'NaN'
-    df1 = df1.loc[linhas_selecionadas, :]
-
-    # 5. Festival
-    linhas_selecionadas = df1['Festival'] != 'NaN'
-    df1 = df1.loc[linhas_selecionadas, :]
-
-    # 6. Time_taken(min)
-    linhas_selecionadas = df1['Time_taken(min)'] != 'NaN'
-    df1 = df1.loc[linhas_selecionadas, :]
-    df1 = df1[df1['Time_taken(min)'].notnull()]
-
-    # Comando para retirar o index como texto
-    df1 = df1.reset_index( drop=True )
-
-    # Convertendo string para números
-    # 1. Delivery_person_Age
-    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype( int )
-
-    # 2. Delivery_person_Ratings
-    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype( float )
-
-    # 3. multiple_deliveries 
-    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype( int )
-
-    # Conversao de texto para data
-    df1['Order_Date'] = pd.to_datetime( df1['Order_Date'], format='%d-%m-%Y' )
-
-    # Limpando a coluna de Time Taken
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply( lambda x: x.split( '(min) ')[1] )
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype( int )
-
-    return df1
-
-# Distância média das entregas            
-def avg_delivery( df1 ):
-    cols = ['Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude', 'Delivery_location_longitude']
-    df1['distance'] = (df1.loc[:, cols].apply( lambda x: 
-                                               haversine(
-                                                   (x['Restaurant_latitude'], x['Restaurant_longitude']),
-                                                   (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1))
-    avg_distance = np.round(df1['distance'].mean(),2)
-    
-    return avg_distance
-
-# Cálculo da média e mediana das entregas com festival e sem festival
-def avg_std_delivery(df1, Festival, op):
-    df_aux = ( df1.loc[: , ['Time_taken(min)', 'Festival'] ]
-                  .groupby('Festival')
-                  .agg( {'Time_taken(min)': ['mean','std'] } ) )
-
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
-    linhas_selecionadas = df_aux['Festival'] == Festival
-    df_aux = np.round(df_aux.loc[ linhas_selecionadas , op], 2)
-    
-    return df_aux
-
-# Tempo de espera por cidade
-def waiting_time( df1 ):
-    df_aux = df1.loc[: , ['Time_taken(min)','City']].groupby('City').agg( { 'Time_taken(min)': ['mean', 'std'] }  )
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
-
-    fig = go.Figure()
-    fig.add_trace( go.Bar( name='Control', x=df_aux['City'], y=df_aux['avg_time'], error_y=dict(type='data', array=df_aux['std_time'] ) ) )
-
-    fig.update_layout(barmode='group')            
-    
-    return fig
-
-# Tempo médio de entrega por cidade
-def waiting_time_city( df1 ):
-    cols = ['Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude', 'Delivery_location_longitude']
-    df1['distance'] = (df1.loc[:, cols].apply( lambda x: 
-                                              haversine( (x['Restaurant_latitude'], x['Restaurant_longitude']),
-                                                         (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1))
-
-    avg_distance = df1.loc[:, ['City', 'distance']].groupby( 'City' ).mean().reset_index()
-
-    fig = go.Figure( data = [ go.Pie( labels = avg_distance['City'], values=avg_distance['distance'], pull=[0, 0.1, 0] ) ] )
-    
-    return fig
-
-# Tempo de entrega por cidade e tipo de tráfego
-def waiting_time_city_traffic( df1 ):
-    df_aux = ( df1.loc[: , ['Time_taken(min)', 'City', 'Road_traffic_density']]
-                  .groupby(['City', 'Road_traffic_density'])
-                  .agg({'Time_taken(min)' : ['mean', 'std']}) )
-
-    df_aux.columns = ['avg_time', 'std_time']
-
-    df_aux = df_aux.reset_index()
-
-    fig = px.sunburst(df_aux, path = ['City', 'Road_traffic_density'], values = 'avg_time', 
-                      color = 'std_time', color_continuous_scale = 'RdBu', 
-                      color_continuous_midpoint=np.average(df_aux['std_time'] ) )
-    return fig
-
-
-# Tempo de entrega por cidade e tipo de pedido
-def waiting_time_city_typeorder( df1 ):
-    delivery_time = ( df1.loc[: , ['Time_taken(min)','City', 'Type_of_order']]
-                         .groupby(['City', 'Type_of_order'])
-                         .agg( {'Time_taken(min)':['mean', 'std']}) )
-    delivery_time.columns = ['avg_time', 'std_time']
-    delivery_time = np.round(delivery_time.reset_index(), 2)
-
-    return delivery_time
+# Trechos medidos nesta execução, com o modo debug ligado
+trace = page_trace( 'visao_restaurantes' )
 
 # ------------------- Início da Estrutura Lógica do Código --------------------------
 
@@ -171,15 +22,12 @@ def waiting_time_city_typeorder( df1 ):
 # Carregando os dados 
 # ================================
 
-df = pd.read_csv('dataset/train.csv')
-
-df1 = df.copy()
-
-# ================================
-# Limpando os dados
-# ================================
+# A leitura, a limpeza, o cubo de agregados e os índices ficam em cache até o
+# CSV ser alterado; as métricas estão em utils.metrics
 
-df1 = clean_code( df1 )
+# Pré-cálculo das métricas das páginas (utils.metrics.PAGE_METRICS) em
+# segundo plano, caso a Home ainda não tenha iniciado
+schedule()
 
 # ======================================
 # Streamlit
@@ -192,98 +40,194 @@ st.sidebar.markdown( '# Curry Company' )
 st.sidebar.markdown( '## Fastest Delivery in Town' )
 st.sidebar.markdown( """---""" )
 
-# Filtro de data
-st.sidebar.markdown( '## Selecione uma data limite' )
+# Filtros com os limites lidos dos dados: data, trânsito, cidade, clima,
+# tipo de veículo e festival
+date_slider, traffic_options, filters = sidebar_filters()
 
-date_slider = st.sidebar.slider(
-    'Até qual valor?',
-    value=datetime.datetime(2022, 4, 6),
-    min_value=datetime.datetime(2022, 2, 11),
-    max_value=datetime.datetime(2022, 4, 13),
-    format='DD-MM-YYYY'
-)
-
-date_slider = pd.to_datetime(date_slider)
-df1 = df1[df1['Order_Date'] < date_slider]
-
-st.sidebar.markdown( """---""" )
-
-traffic_options = st.sidebar.multiselect(
-    'Quais as condições do trânsito?',
-    ['Low', 'Medium', 'High', 'Jam'],
-    default=['Low', 'Medium', 'High', 'Jam'])
-
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
-
-df1 = df1.loc[linhas_selecionadas, :]
+# Gráficos e KPIs reagrupam apenas as células do cubo que atendem aos filtros,
+# as médias e desvios padrão são calculados uma vez por estado dos filtros e as
+# buscas no índice espacial usam as linhas dos filtros; os resultados ficam
+# guardados por estado, compartilhados entre sessões
+context = FilterContext( date_slider, traffic_options, filters=filters )
 
 st.sidebar.markdown( """---""" )
 st.sidebar.markdown( '### Powered by Comunidade DS' )
 
-# ============= Layout no Streamlit ===============
-tab1, tab2, tab3 = st.tabs( ['Visão Gerencial', '_', '_'] )
-
-with tab1:
+# O painel de proximidade é um fragmento: trocar o restaurante ou o raio
+# executa só ele
+@st.fragment
+def proximity_panel( context, restaurants ):
     with st.container():
-        st.subheader( 'Métricas Gerais' )
-        
+        st.subheader( 'Pedidos ao redor de um restaurante' )
+
         col1, col2 = st.columns( 2 )
-        
+
         with col1:
-            entregadores = len(df['Delivery_person_ID'].unique())
-            col1.metric( 'Entregadores únicos', entregadores )
-        
+            restaurant = st.selectbox( 'Restaurante', restaurants )
+
         with col2:
-            avg_distance = avg_delivery( df1 )
-            col2.metric('Distância média das entregas', avg_distance)
-            
-    with st.container():
-        st.subheader( 'Tempo relacionado aos Festivais')
-    
-        col3, col4, col5, col6 = st.columns(4)
-        
-        with col3:
-            df_aux = avg_std_delivery( df1, 'Yes', 'avg_time' )
-            col3.metric( 'Média c/ Festival', df_aux )
-            
-        with col4:
-            df_aux = avg_std_delivery( df1, 'Yes', 'std_time' )
-            col4.metric( 'DP c/ Festival', df_aux )
-            
-        with col5:
-            df_aux = avg_std_delivery( df1, 'No', 'avg_time' )
-            col5.metric( 'Média s/ Festival', df_aux )
-            
-        with col6:
-            df_aux = avg_std_delivery( df1, 'No', 'std_time' )
-            col6.metric( 'DP s/ Festival', df_aux )    
-    
+            radius_km = st.slider( 'Raio (km)', min_value=1, max_value=20, value=3 )
+
+        orders_near = context.query( 'orders_near_restaurant', restaurant=restaurant, radius_km=radius_km )
+
+        col3, col4, col5 = st.columns( 3 )
+        col3.metric( 'Pedidos entregues no raio', orders_near['orders'] )
+        col4.metric( 'Tempo médio', np.round( orders_near['time_mean'], 2 ) )
+        col5.metric( 'Distância média', np.round( orders_near['distance_mean'], 2 ) )
+
     with st.container():
         st.markdown( """---""" )
+        st.subheader( 'Restaurantes mais próximos' )
+        df_aux = context.query( 'nearest_restaurants', restaurant=restaurant )
+        st.dataframe( df_aux )
 
-        st.subheader('Tempo de entrega por cidade')
-        fig = waiting_time( df1 )
-        st.plotly_chart( fig )        
-            
     with st.container():
         st.markdown( """---""" )
-        st.subheader( 'Distribuição do Tempo' )
-    
-        col7, col8 = st.columns( 2 )
-        
-        with col7:
-            st.markdown('Tempo médio de entrega por cidade')
-            fig = waiting_time_city( df1 )
+        st.subheader( 'Zonas de entrega com mais pedidos' )
+        df_aux = context.query( 'delivery_zones' )
+        st.dataframe( df_aux )
+
+# ============= Layout no Streamlit ===============
+# Só a aba aberta é calculada: trocar de aba executa a página de novo, e cada
+# métrica fica guardada por estado dos filtros no cache de resultados
+tab1, tab2, tab3, tab4 = st.tabs( ['Visão Gerencial', 'Proximidade', 'Previsão de Entrega', 'Horários'],
+                            key='visao_restaurantes_tab', on_change='rerun' )
+
+with tab1:
+    if tab1.open:
+        with st.container():
+            st.subheader( 'Métricas Gerais' )
+
+            col1, col2 = st.columns( 2 )
+
+            with col1:
+                entregadores = context.query( 'unique_couriers' )
+                col1.metric( 'Entregadores únicos', entregadores )
+
+            with col2:
+                avg_distance = context.query( 'avg_delivery' )
+                col2.metric('Distância média das entregas', avg_distance)
+
+        with st.container():
+            st.subheader( 'Tempo relacionado aos Festivais')
+
+            col3, col4, col5, col6 = st.columns(4)
+
+            with col3:
+                df_aux = context.query( 'avg_std_delivery', Festival='Yes', op='avg_time' )
+                col3.metric( 'Média c/ Festival', df_aux )
+
+            with col4:
+                df_aux = context.query( 'avg_std_delivery', Festival='Yes', op='std_time' )
+                col4.metric( 'DP c/ Festival', df_aux )
+
+            with col5:
+                df_aux = context.query( 'avg_std_delivery', Festival='No', op='avg_time' )
+                col5.metric( 'Média s/ Festival', df_aux )
+
+            with col6:
+                df_aux = context.query( 'avg_std_delivery', Festival='No', op='std_time' )
+                col6.metric( 'DP s/ Festival', df_aux )    
+
+        with st.container():
+            st.markdown( """---""" )
+
+            st.subheader('Tempo de entrega por cidade')
+            fig = context.query( 'waiting_time' )
+            st.plotly_chart( fig )        
+
+        with st.container():
+            st.markdown( """---""" )
+            st.subheader( 'Distribuição do Tempo' )
+
+            col7, col8 = st.columns( 2 )
+
+            with col7:
+                st.markdown('Tempo médio de entrega por cidade')
+                fig = context.query( 'waiting_time_city' )
+                st.plotly_chart( fig )
+
+            with col8:
+                st.markdown('Tempo de entrega por cidade e tipo de tráfego')
+                fig = context.query( 'waiting_time_city_traffic' )
+                st.plotly_chart( fig )
+
+        with st.container():
+            st.markdown( """---""" )
+            st.subheader( 'Tempo de entrega por cidade e tipo de pedido' )
+            paged_table( context, 'waiting_time_city_typeorder', key='city_typeorder' )
+
+# Mensagem das abas que precisam dos pedidos em memória
+SEM_MEMORIA = 'Indisponível com CURRY_MAX_MEMORY_MB: esta aba precisa do dataset completo em memória.'
+
+with tab2:
+    if tab2.open and not available( 'orders_near_restaurant' ):
+        st.info( SEM_MEMORIA )
+    elif tab2.open:
+        # Restaurantes do painel (não dependem dos filtros); o índice espacial
+        # só é montado quando a aba é aberta
+        restaurants = FilterContext().query( 'restaurant_labels' )
+        proximity_panel( context, restaurants )
+
+with tab3:
+    if tab3.open and not available( 'eta_quality' ):
+        st.info( SEM_MEMORIA )
+    elif tab3.open:
+        with st.container():
+            st.subheader( 'Qualidade do modelo de tempo de entrega' )
+
+            # Erro medido nos pedidos separados do treino
+            quality = context.query( 'eta_quality' )
+            col1, col2, col3 = st.columns( 3 )
+            col1.metric( 'Erro médio absoluto (min)', quality['mae'] )
+            col2.metric( 'RMSE (min)', quality['rmse'] )
+            col3.metric( 'R²', quality['r2'] )
+
+        with st.container():
+            st.markdown( """---""" )
+            st.subheader( 'Tempo previsto x real por cidade' )
+
+            # Cenário: todos os pedidos filtrados previstos com o mesmo tráfego
+            scenario = st.selectbox( 'Simular todos os pedidos com o tráfego',
+                                     ['Atual'] + load_domains()['Road_traffic_density'] )
+            scenario_traffic = '' if scenario == 'Atual' else scenario
+
+            fig = context.query( 'eta_city_chart', scenario_traffic=scenario_traffic )
+            st.plotly_chart( fig )
+
+            df_aux = context.query( 'eta_by_city', scenario_traffic=scenario_traffic )
+            st.dataframe( df_aux )
+
+# Horários do pedido e da retirada: tudo sai da tabela por hora do cubo, sem
+# percorrer os pedidos
+with tab4:
+    if tab4.open:
+        with st.container():
+            st.subheader( 'Tempo de preparo dos restaurantes' )
+
+            col1, col2 = st.columns( 2 )
+
+            with col1:
+                prep_time = context.query( 'avg_prep_time' )
+                col1.metric( 'Preparo médio (min)', prep_time )
+
+            with col2:
+                df_aux = context.query( 'prep_time_city' )
+                st.dataframe( df_aux )
+
+        with st.container():
+            st.markdown( """---""" )
+            st.subheader( 'Pedidos por hora em cada cidade' )
+            fig = context.query( 'hourly_load_city' )
             st.plotly_chart( fig )
-   
-        with col8:
-            st.markdown('Tempo de entrega por cidade e tipo de tráfego')
-            fig = waiting_time_city_traffic( df1 )
+
+        with st.container():
+            st.markdown( """---""" )
+            st.subheader( 'Horários de pico' )
+
+            city = st.selectbox( 'Cidade', ['Todas'] + df_aux['City'].tolist() )
+            fig = context.query( 'peak_hour_heatmap', City='' if city == 'Todas' else city )
             st.plotly_chart( fig )
-            
-    with st.container():
-        st.markdown( """---""" )
-        st.subheader( 'Tempo de entrega por cidade e tipo de pedido' )
-        delivery_time = waiting_time_city_typeorder( df1 )
-        st.dataframe( delivery_time )
\ No newline at end of file
+
+# Divisão do tempo desta execução
+debug_panel( trace )
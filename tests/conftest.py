@@ -0,0 +1,33 @@
+# ================================
+# Dados compartilhados pelos testes
+# ================================
+#
+# Os testes usam um CSV sintético pequeno (benchmarks/synthetic.py), gerado
+# em um diretório temporário; o cache de utils.data é limpo ao final de cada
+# teste.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from benchmarks.synthetic import generate
+from utils import data
+
+ROWS = 4000
+
+
+@pytest.fixture
+def csv_lines( tmp_path ):
+    """
+        Cabeçalho e linhas de um CSV sintético pequeno
+    """
+    with open( generate( str( tmp_path / 'source.csv' ), ROWS, seed=0 ), 'rb' ) as f:
+        header = f.readline()
+        linhas = f.readlines()
+
+    yield header, linhas
+
+    data.clear_cache()
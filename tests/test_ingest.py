@@ -0,0 +1,63 @@
+# ================================
+# Ingestão incremental x carga completa
+# ================================
+#
+# O CSV sintético pequeno dos testes (conftest.py) é gravado pela metade,
+# carregado, e o restante das linhas é acrescentado em lotes. A cada lote o
+# dataframe, o cubo, a tabela de entregadores e o ranking atualizados devem
+# ser iguais aos de uma carga completa do arquivo. A comparação é exata, com
+# exceção das médias e desvios do rollup do cubo (ver compare_cubes).
+#
+# Uso: python -m pytest tests
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_ingest import compare_cubes
+from utils import data
+from utils.couriers import CourierTable, load_couriers
+from utils.cube import build_cube, load_cube
+from utils.leaderboard import Leaderboard, load_leaderboard
+
+BATCHES = 3
+
+
+def test_incremental_matches_full_reload( tmp_path, csv_lines ):
+    header, linhas = csv_lines
+    inicial = len( linhas ) // 2
+    path = str( tmp_path / 'train.csv' )
+    with open( path, 'wb' ) as f:
+        f.write( header + b''.join( linhas[:inicial] ) )
+
+    data.load_data( path )
+    load_cube( path, max_memory_mb=None )
+    couriers = load_couriers( path, max_memory_mb=None )
+    leaderboard = load_leaderboard( path )
+
+    appends = data.cache_stats['appends']
+    for lote in np.array_split( np.arange( inicial, len( linhas ) ), BATCHES ):
+        with open( path, 'ab' ) as f:
+            f.write( b''.join( linhas[j] for j in lote ) )
+
+        df1 = data.load_data( path )
+        cube = load_cube( path, max_memory_mb=None )
+
+        df_full = data._build( path, use_snapshot=False )[0]
+        pd.testing.assert_frame_equal( df1, df_full )
+        compare_cubes( cube, build_cube( df_full ) )
+
+        # As estruturas com atualização são somadas, não reconstruídas
+        assert load_couriers( path, max_memory_mb=None ) is couriers
+        assert load_leaderboard( path ) is leaderboard
+
+        # Os códigos dos entregadores novos vêm depois dos existentes; a
+        # comparação é por Delivery_person_ID
+        completa = CourierTable( df_full )
+        pd.testing.assert_frame_equal( couriers.attributes.sort_values( 'Delivery_person_ID', ignore_index=True ),
+                                       completa.attributes.sort_values( 'Delivery_person_ID', ignore_index=True ) )
+
+        for fastest in ( True, False ):
+            a, b = leaderboard.table( fastest ), Leaderboard.from_orders( df_full ).table( fastest )
+            pd.testing.assert_frame_equal( a, b, check_exact=True )
+
+    assert data.cache_stats['appends'] - appends == BATCHES
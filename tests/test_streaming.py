@@ -0,0 +1,41 @@
+# ================================
+# Ingestão em blocos x carga em memória
+# ================================
+#
+# O cubo montado bloco a bloco (utils.streaming.stream_cube) deve ser igual
+# ao cubo do dataframe completo, e um orçamento de memória pequeno demais
+# interrompe a leitura com MemoryError.
+#
+# Uso: python -m pytest tests
+
+import pytest
+
+from benchmarks.bench_ingest import compare_cubes
+from utils import data
+from utils.cube import build_cube
+from utils.streaming import stream_cube
+
+# Blocos pequenos para o CSV de teste passar por vários merges
+CHUNK_ROWS = 500
+
+
+def _write( tmp_path, csv_lines ):
+    header, linhas = csv_lines
+    path = str( tmp_path / 'train.csv' )
+    with open( path, 'wb' ) as f:
+        f.write( header + b''.join( linhas ) )
+    return path
+
+
+def test_stream_cube_matches_in_memory( tmp_path, csv_lines ):
+    path = _write( tmp_path, csv_lines )
+
+    cube = stream_cube( path, max_memory_mb=64, chunk_rows=CHUNK_ROWS )
+    compare_cubes( cube, build_cube( data.load_data( path ) ) )
+
+
+def test_stream_cube_over_budget( tmp_path, csv_lines ):
+    path = _write( tmp_path, csv_lines )
+
+    with pytest.raises( MemoryError ):
+        stream_cube( path, max_memory_mb=0.01, chunk_rows=CHUNK_ROWS )
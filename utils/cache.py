@@ -0,0 +1,172 @@
+# ================================
+# Cache de resultados das métricas
+# ================================
+#
+# Gráficos, tabelas e KPIs são guardados por (versão do dataset, data limite,
+# tráfegos selecionados, demais filtros, métrica e opções); as chaves são
+# montadas pelo FilterContext (utils.metrics). O cache vive no processo do Streamlit, então
+# é compartilhado entre páginas e sessões: quando vários analistas usam os
+# mesmos filtros, só o primeiro paga o cálculo.
+#
+# A política é LRU com orçamento de memória: ao passar do limite, os
+# resultados usados há mais tempo são descartados. Acertos, faltas e
+# descartes ficam em ResultCache.stats.
+
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_PATH, file_key
+
+# Orçamento padrão do cache de resultados, em MB
+RESULT_CACHE_MB = float( os.environ.get( 'CURRY_RESULT_CACHE_MB' ) or 256 )
+
+# Layout de uma figura do Plotly (quase todo o template padrão), em bytes
+FIGURE_LAYOUT_BYTES = 8 * 1024
+
+
+def _props_size( value ):
+    """
+        Memória aproximada de uma propriedade de trace do Plotly: arrays pelo
+        nbytes, textos pelo tamanho e dicionários e listas somando os itens
+    """
+    if isinstance( value, np.ndarray ):
+        if value.dtype == object:
+            return value.nbytes + sum( sys.getsizeof( item ) for item in value.ravel() )
+        return value.nbytes
+    if isinstance( value, dict ):
+        return sum( _props_size( item ) for item in value.values() )
+    if isinstance( value, ( list, tuple ) ):
+        return 8 * len( value ) + sum( _props_size( item ) for item in value )
+    if isinstance( value, str ):
+        return len( value )
+    return 8
+
+def figure_size( fig ):
+    """
+        Memória aproximada de uma figura do Plotly, somando os arrays dos
+        traces sem serializar a figura
+
+        Input: figura do Plotly
+        Output: bytes
+    """
+    return FIGURE_LAYOUT_BYTES + sum( _props_size( trace._props or {} ) for trace in fig.data )
+
+
+def estimate_size( value ):
+    """
+        Memória aproximada de um resultado, em bytes
+        
+        Input: Dataframe, Series, array, objeto com memory_usage(), figura do
+               Plotly ou outro objeto
+        Output: bytes
+    """
+    if isinstance( value, pd.DataFrame ):
+        return int( value.memory_usage( deep=True ).sum() )
+    if isinstance( value, pd.Series ):
+        return int( value.memory_usage( deep=True ) )
+    if isinstance( value, np.ndarray ):
+        return value.nbytes
+    if hasattr( value, 'memory_usage' ):
+        return int( value.memory_usage() )
+    if hasattr( value, 'to_plotly_json' ):
+        return figure_size( value )
+    try:
+        return len( pickle.dumps( value ) )
+    except Exception:
+        return sys.getsizeof( value )
+
+
+class ResultCache:
+    """
+        Cache LRU limitado por memória
+        
+        Input: orçamento em bytes
+    """
+
+    def __init__( self, max_bytes ):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats( self ):
+        with self._lock:
+            return { 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                     'entries': len( self._entries ), 'bytes': self._bytes,
+                     'max_bytes': self.max_bytes }
+
+    def __contains__( self, key ):
+        with self._lock:
+            return key in self._entries
+
+    def get( self, key, default=None ):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end( key )
+            return self._entries[key][0]
+
+    def put( self, key, value ):
+        size = estimate_size( value )
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop( key )[1]
+
+            # Resultados maiores que o orçamento inteiro não são guardados
+            if size > self.max_bytes:
+                return value
+
+            self._entries[key] = ( value, size )
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, ( _, removido ) = self._entries.popitem( last=False )
+                self._bytes -= removido
+                self.evictions += 1
+
+        return value
+
+    def get_or_compute( self, key, func ):
+        """
+            Resultado em cache ou calculado por func() e guardado
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end( key )
+                return self._entries[key][0]
+            self.misses += 1
+
+        return self.put( key, func() )
+
+    def clear( self ):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+# Cache único do processo, compartilhado por todas as páginas e sessões
+results = ResultCache( int( RESULT_CACHE_MB * 2**20 ) )
+
+
+def filter_state( date_limit, traffic_options, path=DATA_PATH, filters=() ):
+    """
+        Identificação do estado dos filtros: versão do dataset, data limite,
+        tráfegos selecionados (em ordem, para que a ordem da seleção não
+        gere chaves diferentes) e os filtros das demais dimensões, no formato
+        de utils.filters.normalize_filters
+    """
+    return ( file_key( path ), pd.Timestamp( date_limit ), tuple( sorted( traffic_options ) ), tuple( filters ) )
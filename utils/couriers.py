@@ -0,0 +1,138 @@
+# ================================
+# Dimensão de entregadores
+# ================================
+#
+# O Delivery_person_ID se repete em todos os pedidos do entregador. Na
+# ingestão ele já vira uma coluna categórica (um texto por entregador, um
+# código inteiro por pedido), e os agrupamentos por entregador usam códigos
+# int32 densos em vez de textos.
+#
+# CourierTable é a tabela de dimensão: um código int32 por entregador, na
+# ordem em que ele apareceu pela primeira vez (códigos estáveis quando chegam
+# pedidos novos), com os atributos do pedido mais recente: idade, avaliação,
+# cidade e tipo de veículo, além da quantidade de pedidos.
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_PATH, MAX_MEMORY_MB, load_derived, load_from_source
+
+# Atributos guardados por entregador, do pedido mais recente
+ATTRIBUTES = ['Delivery_person_Age', 'Delivery_person_Ratings', 'City', 'Type_of_vehicle']
+
+
+def encode_couriers( serie ):
+    """
+        Esta função tem a responsabilidade de codificar os entregadores dos
+        pedidos como inteiros
+
+        Na coluna categórica os códigos já existem e nenhum texto é
+        percorrido; nas demais os textos são fatorados.
+
+        Input: Series com Delivery_person_ID
+        Output: (array int32 com o código de cada pedido, Index com o
+                 entregador de cada código)
+    """
+    if isinstance( serie.dtype, pd.CategoricalDtype ):
+        return serie.cat.codes.to_numpy().astype( np.int32 ), pd.Index( serie.cat.categories, dtype=object )
+
+    codes, uniques = pd.factorize( serie )
+    return codes.astype( np.int32 ), pd.Index( uniques, dtype=object )
+
+
+class CourierTable:
+    """
+        Tabela de dimensão dos entregadores
+
+        Input: Dataframe limpo
+    """
+
+    def __init__( self, df1 ):
+        self.ids = pd.Index( [], dtype=object )
+        self.attributes = pd.DataFrame( columns=['Delivery_person_ID', 'orders', 'last_order'] + ATTRIBUTES )
+        self.update( df1 )
+
+    def __len__( self ):
+        return len( self.ids )
+
+    def codes( self, serie ):
+        """
+            Códigos int32 da tabela para uma coluna de entregadores; quem não
+            está na tabela recebe -1
+        """
+        codes, uniques = encode_couriers( serie )
+        de_para = np.append( self.ids.get_indexer( uniques ), -1 ).astype( np.int32 )
+        return de_para[codes]
+
+    def update( self, df_new ):
+        """
+            Esta função tem a responsabilidade de somar pedidos novos à tabela
+
+            Entregadores novos recebem os próximos códigos; os atributos passam
+            a ser os do pedido mais recente (pela Order_Date, e pela ordem das
+            linhas no mesmo dia).
+
+            Input: Dataframe limpo com os pedidos novos
+            Output: a própria tabela
+        """
+        if len( df_new ) == 0:
+            return self
+
+        codes, uniques = encode_couriers( df_new['Delivery_person_ID'] )
+        validos = codes >= 0
+        presentes = np.flatnonzero( np.bincount( codes[validos], minlength=len( uniques ) ) )
+        ids = self.ids.append( uniques[presentes].difference( self.ids, sort=False ) )
+        tabela = ids.get_indexer( uniques )
+
+        # Último pedido de cada entregador nas linhas novas
+        aux = df_new.loc[validos, ['Order_Date'] + ATTRIBUTES].reset_index( drop=True )
+        aux['courier'] = tabela[codes[validos]]
+        aux = aux.sort_values( 'Order_Date', kind='stable' )
+        grupos = aux.groupby( 'courier', sort=True )
+        recentes = grupos.tail( 1 ).set_index( 'courier' ).sort_index()
+
+        attributes = self.attributes.reindex( np.arange( len( ids ) ) ).astype( object )
+        attributes['Delivery_person_ID'] = ids.to_numpy()
+        attributes['orders'] = attributes['orders'].fillna( 0 )
+        attributes.loc[recentes.index, 'orders'] += grupos.size()
+
+        # Pedidos novos com data anterior ao último já visto não trocam os atributos
+        anterior = pd.to_datetime( attributes.loc[recentes.index, 'last_order'] )
+        atualizar = recentes.index[~( recentes['Order_Date'] < anterior ).to_numpy()]
+        for col in ['Order_Date'] + ATTRIBUTES:
+            destino = 'last_order' if col == 'Order_Date' else col
+            attributes.loc[atualizar, destino] = recentes.loc[atualizar, col].astype( object ).to_numpy()
+
+        # Tipos compactos, como no dataframe limpo
+        tipos = { 'orders': 'int64', 'last_order': df_new['Order_Date'].dtype }
+        for col in ATTRIBUTES:
+            tipos[col] = 'category' if isinstance( df_new[col].dtype, pd.CategoricalDtype ) else df_new[col].dtype
+
+        # A tabela só é trocada inteira, para quem está lendo ao mesmo tempo
+        self.attributes, self.ids = attributes.astype( tipos ), ids
+        return self
+
+    def memory_usage( self ):
+        """
+            Memória ocupada pela tabela, em bytes
+        """
+        return int( self.ids.memory_usage( deep=True ) + self.attributes.memory_usage( deep=True ).sum() )
+
+
+def append_to_couriers( couriers, df_new ):
+    return couriers.update( df_new )
+
+def load_couriers( path=DATA_PATH, max_memory_mb=MAX_MEMORY_MB ):
+    """
+        CourierTable do dataset atual, construída uma vez por versão do CSV;
+        pedidos acrescentados ao CSV são somados à tabela existente. Com
+        max_memory_mb a tabela é montada lendo o CSV em blocos.
+    """
+    if max_memory_mb:
+        from utils.streaming import stream_couriers
+
+        return load_from_source( f'couriers_stream_{max_memory_mb}',
+                                 lambda csv: stream_couriers( csv, max_memory_mb ), path,
+                                 update=append_to_couriers )
+
+    return load_derived( 'couriers', CourierTable, path, update=append_to_couriers )
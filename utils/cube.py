@@ -0,0 +1,481 @@
+# ================================
+# Cubo de agregados dos pedidos
+# ================================
+#
+# Os pedidos são agregados uma única vez por combinação de
+# (Order_Date, City, Road_traffic_density, Type_of_order, Festival,
+# Weatherconditions). Cada célula guarda contagens e acumuladores (n, média,
+# M2) de cada medida, o suficiente para reconstruir médias e desvios padrão
+# de qualquer agrupamento mais grosso (utils.stats), e o conjunto de
+# entregadores distintos, que pode ser unido entre células.
+#
+# Os entregadores distintos são contados de forma exata, pela união dos
+# conjuntos das células. Também há sketches HyperLogLog por (Order_Date, City,
+# Road_traffic_density) para quem aceita uma contagem aproximada com memória
+# fixa: com distinct='hll', contagens semanais e filtradas saem da união dos
+# sketches diários.
+#
+# As métricas por entregador (avaliação média, tempo médio por cidade) vêm de
+# uma segunda tabela, agregada por (Order_Date, Road_traffic_density, City,
+# courier), que também respeita os filtros da barra lateral. courier é o código
+# int32 do entregador no índice couriers do cubo; o texto do
+# Delivery_person_ID só volta no resultado final.
+#
+# O mapa usa uma terceira tabela com os pedidos por célula da grade
+# geográfica (utils.grid), por (Order_Date, Road_traffic_density).
+#
+# A carga por hora e o tempo de preparo (retirada - pedido) vêm de uma quarta
+# tabela, por (Order_Date, Road_traffic_density, City, order_hour), com os
+# acumuladores (n, média, M2) do preparo.
+#
+# Gráficos e KPIs filtram e reagrupam as células do cubo em vez de varrer os
+# pedidos, então o custo por interação depende da quantidade de grupos e não
+# da quantidade de pedidos. Cubos parciais (de blocos do CSV, por exemplo)
+# podem ser unidos com merge_cubes.
+
+import numpy as np
+import pandas as pd
+
+from utils import grid, sketch
+from utils.couriers import encode_couriers
+from utils.data import DATA_PATH, MAX_MEMORY_MB, load_derived, load_from_source
+from utils.stats import StatsEngine, combine, finalize, moments
+
+CUBE_DIMENSIONS = ['Order_Date', 'City', 'Road_traffic_density', 'Type_of_order',
+                   'Festival', 'Weatherconditions']
+
+# Granularidade dos sketches de entregadores distintos
+SKETCH_DIMENSIONS = ['Order_Date', 'City', 'Road_traffic_density']
+
+# Granularidade da tabela por entregador
+COURIER_DIMENSIONS = ['Order_Date', 'Road_traffic_density', 'City', 'courier']
+
+# Granularidade da tabela de pedidos por célula da grade geográfica
+GEO_DIMENSIONS = ['Order_Date', 'Road_traffic_density']
+
+# Granularidade da tabela por hora do pedido
+HOUR_DIMENSIONS = ['Order_Date', 'Road_traffic_density', 'City', 'order_hour']
+HOUR_MEASURES = ['prep']
+
+# Medidas com média e desvio padrão: nome no cubo -> coluna de origem
+MEASURES = {
+    'time': 'Time_taken(min)',
+    'ratings': 'Delivery_person_Ratings',
+    'distance': 'distance',
+}
+
+# Colunas do dataframe limpo usadas na construção do cubo
+SOURCE_COLUMNS = list( dict.fromkeys( CUBE_DIMENSIONS + list( MEASURES.values() )
+                                      + ['Delivery_person_Age', 'Vehicle_condition', 'Delivery_person_ID',
+                                         'order_minute', 'picked_minute']
+                                      + [col for cols in grid.GEO_LAYERS.values() for col in cols] ) )
+
+MOMENT_COLUMNS = [f'{m}_{s}' for m in MEASURES for s in ( 'n', 'mean', 'm2' )]
+MIN_COLUMNS = ['age_min', 'vehicle_min']
+MAX_COLUMNS = ['age_max', 'vehicle_max']
+COURIER_SUM_COLUMNS = ['orders', 'time_n', 'time_sum', 'ratings_n', 'ratings_sum']
+
+
+def build_cube( df1, distinct='exact', precision=sketch.DEFAULT_PRECISION ):
+    """
+        Esta função tem a responsabilidade de agregar os pedidos limpos nas
+        células do cubo
+
+        Input: Dataframe limpo, contagem de distintos padrão ('hll' ou
+               'exact'), precisão dos sketches
+        Output: OrderCube
+    """
+    aux = df1.loc[:, CUBE_DIMENSIONS].copy()
+    for name, col in MEASURES.items():
+        aux[name] = df1[col].astype( 'float64' )
+    aux['age'] = df1['Delivery_person_Age']
+    aux['vehicle'] = df1['Vehicle_condition']
+
+    # Entregadores codificados como inteiros para as uniões entre células e
+    # os agrupamentos por entregador
+    codes, couriers = encode_couriers( df1['Delivery_person_ID'] )
+    aux['courier'] = codes
+
+    grupos = aux.groupby( CUBE_DIMENSIONS, observed=True )
+    cells = grupos.agg( orders=( 'courier', 'size' ),
+                        age_min=( 'age', 'min' ), age_max=( 'age', 'max' ),
+                        vehicle_min=( 'vehicle', 'min' ), vehicle_max=( 'vehicle', 'max' ) )
+    cells = cells.join( moments( aux, CUBE_DIMENSIONS, { name: name for name in MEASURES } ) )
+    cells['couriers'] = pd.Series( _distinct_per_group( grupos.ngroup().to_numpy(), codes, len( cells ) ),
+                                   index=cells.index, dtype=object )
+    cells = cells.reset_index()
+
+    # Um sketch HyperLogLog de entregadores por dia, cidade e tráfego
+    grupos = df1.groupby( SKETCH_DIMENSIONS, observed=True )
+    sketch_keys = grupos.size().reset_index().loc[:, SKETCH_DIMENSIONS]
+    # Um hash por entregador, espalhado para os pedidos pelos códigos
+    hashes = np.append( sketch.hash_values( couriers ), sketch.hash_values( [np.nan] ) )[codes]
+    sketches = sketch.group_registers( hashes,
+                                       grupos.ngroup().to_numpy(), len( sketch_keys ), precision )
+
+    # Somas por entregador
+    courier_cells = ( df1.loc[:, COURIER_DIMENSIONS[:-1] + ['Time_taken(min)', 'Delivery_person_Ratings']]
+                         .astype( { 'Time_taken(min)': 'float64', 'Delivery_person_Ratings': 'float64' } )
+                         .assign( courier=codes )
+                         .groupby( COURIER_DIMENSIONS, observed=True )
+                         .agg( orders=( 'Time_taken(min)', 'size' ),
+                               time_n=( 'Time_taken(min)', 'count' ),
+                               time_sum=( 'Time_taken(min)', 'sum' ),
+                               ratings_n=( 'Delivery_person_Ratings', 'count' ),
+                               ratings_sum=( 'Delivery_person_Ratings', 'sum' ) )
+                         .reset_index() )
+    # Pedidos sem entregador ficam fora da tabela
+    courier_cells = courier_cells.loc[courier_cells['courier'] >= 0].reset_index( drop=True )
+
+    # Pedidos por célula da grade geográfica
+    geo_cells = grid.bin_points( df1, GEO_DIMENSIONS )
+
+    return OrderCube( _with_week( cells ), couriers, _with_week( sketch_keys ),
+                      sketches, courier_cells, geo_cells, hour_table( df1 ), distinct )
+
+def hour_table( df1 ):
+    """
+        Esta função tem a responsabilidade de agregar os pedidos por hora
+
+        O tempo de preparo é o intervalo entre o pedido e a retirada, em
+        minutos, contando a virada da meia-noite. Pedidos sem horário ficam
+        fora da tabela.
+
+        Input: Dataframe limpo
+        Output: Dataframe com HOUR_DIMENSIONS, orders e prep_n, prep_mean, prep_m2
+    """
+    pedido = df1['order_minute'].to_numpy()
+    retirada = df1['picked_minute'].to_numpy()
+    linhas = pedido >= 0
+
+    aux = df1.loc[linhas, HOUR_DIMENSIONS[:-1]].reset_index( drop=True )
+    aux['order_hour'] = ( pedido[linhas] // 60 ).astype( np.int8 )
+    prep = ( retirada[linhas].astype( np.int32 ) - pedido[linhas] ) % 1440
+    aux['prep'] = np.where( retirada[linhas] >= 0, prep, np.nan )
+
+    grupos = aux.groupby( HOUR_DIMENSIONS, observed=True )
+    hour_cells = grupos.size().rename( 'orders' ).to_frame()
+    hour_cells = hour_cells.join( moments( aux, HOUR_DIMENSIONS, { name: name for name in HOUR_MEASURES } ) )
+
+    return hour_cells.reset_index()
+
+def merge_cubes( cubes ):
+    """
+        Esta função tem a responsabilidade de unir cubos parciais em um só
+
+        Contagens são somadas, acumuladores (n, média, M2) combinados pela
+        fórmula de Chan, mínimos e máximos combinados, os conjuntos de entregadores unidos e os sketches combinados pelo máximo
+        dos registros. O resultado é o mesmo cubo que build_cube geraria com
+        todos os pedidos juntos.
+
+        Input: lista de OrderCube
+        Output: OrderCube
+    """
+    cubes = list( cubes )
+    if len( cubes ) == 1:
+        return cubes[0]
+
+    # Códigos de entregador passam a apontar para um índice único
+    couriers = pd.Index( np.concatenate( [cube.couriers.to_numpy() for cube in cubes] ) ).unique()
+    codes = []
+    courier_parts = []
+    for cube in cubes:
+        remap = couriers.get_indexer( cube.couriers ).astype( np.int32 )
+        codes += [remap[arr] for arr in cube.cells['couriers']]
+        courier_parts.append( cube.courier_cells.assign( courier=remap[cube.courier_cells['courier'].to_numpy()] ) )
+
+    cells = pd.concat( [cube.cells.drop( columns=['couriers', 'week_of_year'] ) for cube in cubes],
+                       ignore_index=True )
+    cells = _as_category( cells, CUBE_DIMENSIONS[1:] )
+    grupos = cells.groupby( CUBE_DIMENSIONS, observed=True )
+    merged = pd.concat( [grupos[['orders']].sum(),
+                         grupos[MIN_COLUMNS].min(),
+                         grupos[MAX_COLUMNS].max(),
+                         combine( cells, CUBE_DIMENSIONS, MEASURES )], axis=1 )
+
+    ids = np.repeat( grupos.ngroup().to_numpy(), [len( arr ) for arr in codes] )
+    flat = np.concatenate( codes ) if codes else np.zeros( 0, dtype=np.int64 )
+    merged['couriers'] = pd.Series( _distinct_per_group( ids, flat, len( merged ) ),
+                                    index=merged.index, dtype=object )
+    merged = merged.reset_index().loc[:, cubes[0].cells.columns.drop( 'week_of_year' )]
+
+    sketch_keys = _as_category( pd.concat( [cube.sketch_keys.loc[:, SKETCH_DIMENSIONS] for cube in cubes],
+                                           ignore_index=True ), SKETCH_DIMENSIONS[1:] )
+    grupos_sketch = sketch_keys.groupby( SKETCH_DIMENSIONS, observed=True )
+    sketches = _max_per_group( grupos_sketch.ngroup().to_numpy(),
+                               np.vstack( [cube.sketches for cube in cubes] ) )
+
+    courier_cells = _as_category( pd.concat( courier_parts, ignore_index=True ),
+                                  COURIER_DIMENSIONS[1:3] )
+    courier_cells = ( courier_cells.groupby( COURIER_DIMENSIONS, observed=True )[COURIER_SUM_COLUMNS]
+                                   .sum()
+                                   .reset_index() )
+
+    geo_cells = _as_category( pd.concat( [cube.geo_cells for cube in cubes], ignore_index=True ),
+                              GEO_DIMENSIONS[1:] + ['layer'] )
+    geo_cells = ( geo_cells.groupby( GEO_DIMENSIONS + ['layer', 'level', 'cell'], observed=True )['orders']
+                           .sum()
+                           .reset_index() )
+
+    hour_cells = _as_category( pd.concat( [cube.hour_cells for cube in cubes], ignore_index=True ),
+                               HOUR_DIMENSIONS[1:3] )
+    grupos_hora = hour_cells.groupby( HOUR_DIMENSIONS, observed=True )
+    hour_cells = pd.concat( [grupos_hora[['orders']].sum(),
+                             combine( hour_cells, HOUR_DIMENSIONS, HOUR_MEASURES )], axis=1 ).reset_index()
+
+    return OrderCube( _with_week( merged ), couriers,
+                      _with_week( grupos_sketch.size().reset_index().loc[:, SKETCH_DIMENSIONS] ),
+                      sketches, courier_cells, geo_cells, hour_cells, cubes[0].distinct )
+
+
+class OrderCube:
+    """
+        Células agregadas dos pedidos, com filtro e reagrupamento
+
+        Input: dataframe de células, nomes dos entregadores (índice = código),
+               chaves e registros dos sketches, somas por entregador,
+               pedidos por célula da grade, pedidos e preparo por hora,
+               contagem de distintos padrão
+    """
+
+    def __init__( self, cells, couriers, sketch_keys, sketches, courier_cells, geo_cells, hour_cells,
+                  distinct='exact' ):
+        self.cells = cells
+        self.couriers = couriers
+        self.sketch_keys = sketch_keys
+        self.sketches = sketches
+        self.courier_cells = courier_cells
+        self.geo_cells = geo_cells
+        self.hour_cells = hour_cells
+        self.distinct = distinct
+        self._stats = None
+
+    @property
+    def stats( self ):
+        """
+            StatsEngine deste cubo, criado no primeiro acesso
+        """
+        if self._stats is None:
+            self._stats = StatsEngine( self )
+        return self._stats
+
+    def __len__( self ):
+        return len( self.cells )
+
+    def memory_usage( self ):
+        """
+            Memória ocupada pelo cubo, em bytes
+        """
+        total = self.cells.drop( columns='couriers' ).memory_usage( deep=True ).sum()
+        total += sum( arr.nbytes for arr in self.cells['couriers'] )
+        total += self.couriers.memory_usage( deep=True )
+        total += self.sketch_keys.memory_usage( deep=True ).sum() + self.sketches.nbytes
+        total += self.courier_cells.memory_usage( deep=True ).sum()
+        total += self.geo_cells.memory_usage( deep=True ).sum()
+        total += self.hour_cells.memory_usage( deep=True ).sum()
+        return int( total )
+
+    def filter( self, date_limit=None, traffic_options=None ):
+        """
+            Cubo apenas com as células que atendem aos filtros da barra lateral
+
+            Input: data limite (exclusiva), valores de tráfego selecionados
+            Output: OrderCube
+        """
+        linhas = _filter_mask( self.cells, date_limit, traffic_options )
+        linhas_sketch = _filter_mask( self.sketch_keys, date_limit, traffic_options )
+        linhas_courier = _filter_mask( self.courier_cells, date_limit, traffic_options )
+        linhas_geo = _filter_mask( self.geo_cells, date_limit, traffic_options )
+        linhas_hora = _filter_mask( self.hour_cells, date_limit, traffic_options )
+
+        return OrderCube( self.cells.loc[linhas], self.couriers,
+                          self.sketch_keys.loc[linhas_sketch], self.sketches[linhas_sketch],
+                          self.courier_cells.loc[linhas_courier], self.geo_cells.loc[linhas_geo],
+                          self.hour_cells.loc[linhas_hora], self.distinct )
+
+    def rollup( self, by=(), distinct=None ):
+        """
+            Esta função tem a responsabilidade de reagrupar as células do cubo
+
+            Para cada medida (time, ratings, distance) são devolvidos a média
+            e o desvio padrão amostral, como no groupby().agg(['mean', 'std']).
+
+            Os entregadores distintos vêm dos conjuntos exatos ou, com
+            distinct='hll' e um agrupamento só por data, semana, cidade e
+            tráfego, da união dos sketches HyperLogLog.
+
+            Input: coluna ou lista de colunas do agrupamento ([] = total geral),
+                   contagem de distintos ('hll' ou 'exact', padrão do cubo)
+            Output: Dataframe com orders, couriers, <medida>_mean, <medida>_std,
+                    age_min/max e vehicle_min/max por grupo
+        """
+        by = [by] if isinstance( by, str ) else list( by )
+        cells = self.cells
+        if not by:
+            cells = cells.assign( _total=0 )
+            keys = ['_total']
+        else:
+            keys = by
+
+        grupos = cells.groupby( keys, observed=True, sort=True )
+        df_aux = pd.concat( [grupos[['orders']].sum(),
+                             grupos[MIN_COLUMNS].min(),
+                             grupos[MAX_COLUMNS].max(),
+                             combine( cells, keys, MEASURES )], axis=1 )
+
+        distinct = distinct or self.distinct
+        if distinct == 'hll' and set( by ) <= set( SKETCH_DIMENSIONS + ['week_of_year'] ):
+            df_aux['couriers'] = self._estimate_couriers( keys )
+        else:
+            df_aux['couriers'] = grupos['couriers'].agg( _count_distinct )
+
+        df_aux = finalize( df_aux, MEASURES )
+
+        if not by:
+            # O total geral sempre tem uma linha, mesmo sem nenhuma célula
+            df_aux = df_aux.reindex( [0] ).fillna( { 'orders': 0, 'couriers': 0 } )
+            return df_aux.reset_index( drop=True )
+
+        return df_aux.reset_index()
+
+    def courier_rollup( self, by='Delivery_person_ID' ):
+        """
+            Reagrupa a tabela por entregador
+
+            O agrupamento é feito pelos códigos inteiros dos entregadores; o
+            Delivery_person_ID só é montado para as linhas do resultado.
+
+            Input: coluna ou lista de colunas do agrupamento (deve incluir
+                   Delivery_person_ID para métricas por entregador)
+            Output: Dataframe com orders, time_mean e ratings_mean por grupo
+        """
+        by = [by] if isinstance( by, str ) else list( by )
+        chaves = ['courier' if col == 'Delivery_person_ID' else col for col in by]
+        df_aux = self.courier_cells.groupby( chaves, observed=True, sort=False )[COURIER_SUM_COLUMNS].sum()
+        df_aux['time_mean'] = df_aux['time_sum'] / df_aux['time_n']
+        df_aux['ratings_mean'] = df_aux['ratings_sum'] / df_aux['ratings_n']
+        df_aux = df_aux.reset_index()
+
+        if 'courier' in chaves:
+            ids = self.couriers.to_numpy()[df_aux['courier'].to_numpy()]
+            df_aux.insert( chaves.index( 'courier' ), 'Delivery_person_ID', ids )
+            df_aux = df_aux.drop( columns='courier' )
+
+        return df_aux.sort_values( by, ignore_index=True )
+
+    def density( self, layer='delivery', level=grid.DEFAULT_LEVEL ):
+        """
+            Pedidos por célula da grade geográfica
+
+            Input: camada ('delivery' ou 'restaurant'), nível da grade
+            Output: Dataframe com cell, orders, latitude e longitude do centro
+        """
+        linhas = ( ( self.geo_cells['layer'] == layer ) & ( self.geo_cells['level'] == level ) ).to_numpy()
+        df_aux = self.geo_cells.loc[linhas].groupby( 'cell', sort=True )['orders'].sum().reset_index()
+        df_aux['latitude'], df_aux['longitude'] = grid.cell_centers( df_aux['cell'].to_numpy(), level )
+
+        return df_aux
+
+    def hourly_rollup( self, by=( 'order_hour', ) ):
+        """
+            Reagrupa a tabela por hora do pedido
+
+            Input: coluna ou lista de colunas do agrupamento (Order_Date,
+                   Road_traffic_density, City, order_hour; [] = total geral)
+            Output: Dataframe com orders, prep_n, prep_mean e prep_std por grupo
+        """
+        by = [by] if isinstance( by, str ) else list( by )
+        hour_cells = self.hour_cells
+        keys = by or ['_total']
+        if not by:
+            hour_cells = hour_cells.assign( _total=0 )
+
+        grupos = hour_cells.groupby( keys, observed=True, sort=True )
+        df_aux = pd.concat( [grupos[['orders']].sum(), combine( hour_cells, by, HOUR_MEASURES )], axis=1 )
+        df_aux = finalize( df_aux, HOUR_MEASURES ).drop( columns='prep_m2' )
+
+        return df_aux.reset_index( drop=not by )
+
+    def _estimate_couriers( self, keys ):
+        """
+            Entregadores distintos por grupo pela união dos sketches
+        """
+        sketch_keys = self.sketch_keys.assign( _total=0 )
+        if len( sketch_keys ) == 0:
+            return 0
+
+        grupos = sketch_keys.groupby( keys, observed=True, sort=True )
+        registers = _max_per_group( grupos.ngroup().to_numpy(), self.sketches )
+
+        return pd.Series( np.round( sketch.estimate( registers ) ), index=grupos.size().index )
+
+
+def _with_week( df_aux ):
+    df_aux['week_of_year'] = df_aux['Order_Date'].dt.strftime( '%U' )
+    return df_aux
+
+def _as_category( df_aux, cols ):
+    # Categorias diferentes entre blocos viram texto no concat
+    return df_aux.astype( { col: 'category' for col in cols } )
+
+def _distinct_per_group( group_ids, codes, n_groups ):
+    """
+        Conjunto ordenado de códigos distintos de cada grupo
+
+        Input: grupo de cada linha, código de cada linha, quantidade de grupos
+        Output: lista com um array por grupo
+    """
+    if n_groups == 0:
+        return []
+
+    base = np.int64( codes.max() + 1 ) if len( codes ) else np.int64( 1 )
+    chaves = np.unique( group_ids.astype( np.int64 ) * base + codes )
+    limites = np.searchsorted( chaves // base, np.arange( 1, n_groups ) )
+    return np.split( chaves % base, limites )
+
+def _max_per_group( group_ids, registers ):
+    ordem = np.argsort( group_ids, kind='stable' )
+    inicios = np.flatnonzero( np.r_[True, np.diff( group_ids[ordem] ) != 0] )
+    return np.maximum.reduceat( registers[ordem], inicios, axis=0 )
+
+def _filter_mask( df_aux, date_limit, traffic_options ):
+    linhas = np.ones( len( df_aux ), dtype=bool )
+    if date_limit is not None:
+        linhas &= ( df_aux['Order_Date'] < pd.Timestamp( date_limit ) ).to_numpy()
+    if traffic_options is not None:
+        linhas &= df_aux['Road_traffic_density'].isin( traffic_options ).to_numpy()
+    return linhas
+
+def _count_distinct( arrays ):
+    arrays = arrays.to_list()
+    if not arrays:
+        return 0
+    return len( np.unique( np.concatenate( arrays ) ) )
+
+def append_to_cube( cube, df_new ):
+    """
+        Cubo com os pedidos novos somados: só as linhas novas são agregadas
+    """
+    return merge_cubes( [cube, build_cube( df_new, cube.distinct )] )
+
+def load_cube( path=DATA_PATH, max_memory_mb=MAX_MEMORY_MB ):
+    """
+        Cubo do dataset atual, construído uma vez por versão do CSV
+
+        Linhas novas no final do CSV são agregadas à parte e combinadas com o
+        cubo existente (append_to_cube).
+
+        Com max_memory_mb o CSV é lido em blocos (utils.streaming) e o
+        dataframe completo nunca é carregado. Sem ele, e com CURRY_WORKERS
+        maior que 1, a construção é dividida entre processos (utils.parallel).
+    """
+    if max_memory_mb:
+        from utils.streaming import stream_cube
+
+        return load_from_source( f'cube_stream_{max_memory_mb}',
+                                 lambda csv: stream_cube( csv, max_memory_mb ), path,
+                                 update=append_to_cube )
+
+    from utils.parallel import parallel_build_cube
+
+    return load_derived( 'cube', parallel_build_cube, path, update=append_to_cube )
@@ -0,0 +1,398 @@
+# ================================
+# Carregamento e limpeza dos dados
+# ================================
+#
+# Módulo compartilhado pelas páginas do dashboard. O CSV é lido e limpo uma
+# única vez por processo; as execuções seguintes do Streamlit reaproveitam o
+# dataframe em memória enquanto o arquivo de origem não mudar. Quando o
+# arquivo apenas recebe linhas novas, só elas são lidas e limpas e entram no
+# dataframe e nas estruturas derivadas já carregadas (utils.ingest).
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.geo import haversine_distance
+from utils.profiling import span
+
+# No pandas 3 o Copy-on-Write é sempre ativo; nas versões 2.x é opcional
+if int( pd.__version__.split( '.' )[0] ) < 3:
+    pd.set_option( 'mode.copy_on_write', True )
+
+# O caminho do CSV pode ser trocado por CURRY_DATA (por exemplo, um arquivo
+# sintético dos benchmarks)
+DATA_PATH = os.environ.get( 'CURRY_DATA', 'dataset/train.csv' )
+
+# Orçamento de memória (MB) para ler o CSV em blocos, sem carregar o arquivo
+# inteiro (utils.streaming). Vazio ou 0 usa o dataframe completo em memória.
+MAX_MEMORY_MB = float( os.environ.get( 'CURRY_MAX_MEMORY_MB' ) or 0 ) or None
+
+_cache = {}
+_derived = {}
+_sources = {}   # caminho -> (versão carregada, marca d'água)
+_updaters = {}  # estrutura derivada -> função que soma as linhas novas
+_cache_lock = threading.RLock()
+cache_stats = {'hits': 0, 'misses': 0, 'appends': 0}
+
+
+# ===============================
+# Esquema do CSV
+# ===============================
+# Tipos declarados na leitura: as colunas de baixa cardinalidade já entram
+# como categóricas e os sentinelas 'NaN ' viram nulos no próprio parser.
+# Delivery_person_Ratings fica em float64: em float32 as médias exibidas
+# carregam o arredondamento (4.8500000238 em vez de 4.85).
+SCHEMA = {
+    'ID': 'str',
+    'Delivery_person_ID': 'category',
+    'Delivery_person_Age': 'float32',
+    'Delivery_person_Ratings': 'float64',
+    'Restaurant_latitude': 'float64',
+    'Restaurant_longitude': 'float64',
+    'Delivery_location_latitude': 'float64',
+    'Delivery_location_longitude': 'float64',
+    'Order_Date': 'category',
+    'Time_Orderd': 'category',
+    'Time_Order_picked': 'category',
+    'Weatherconditions': 'category',
+    'Road_traffic_density': 'category',
+    'Vehicle_condition': 'int8',
+    'Type_of_order': 'category',
+    'Type_of_vehicle': 'category',
+    'multiple_deliveries': 'float32',
+    'Festival': 'category',
+    'City': 'category',
+    'Time_taken(min)': 'category',
+}
+
+NA_VALUES = ['NaN ', 'NaN']
+
+# Colunas categóricas mantidas no dataframe limpo. Delivery_person_ID também
+# fica categórica: um texto por entregador e um código por pedido
+# (utils.couriers). Order_Date, os horários e Time_taken(min) também são lidos
+# como categóricos, mas só para que a conversão seja feita uma vez por valor
+# distinto em vez de uma vez por linha.
+CATEGORY_COLUMNS = ['Weatherconditions', 'Road_traffic_density', 'Type_of_order',
+                    'Type_of_vehicle', 'Festival', 'City']
+
+# Colunas cujo valor nulo elimina a linha
+REQUIRED_COLUMNS = ['Delivery_person_Age', 'multiple_deliveries', 'Road_traffic_density',
+                    'City', 'Festival', 'Time_taken(min)']
+
+# Tipos finais das colunas numéricas depois da limpeza
+NUMERIC_TYPES = {
+    'Delivery_person_Age': 'int8',
+    'multiple_deliveries': 'int8',
+    'Time_taken(min)': 'int16',
+}
+
+# Horários convertidos em minuto do dia (0 a 1439); -1 quando vazio
+TIME_COLUMNS = {
+    'Time_Orderd': 'order_minute',
+    'Time_Order_picked': 'picked_minute',
+}
+
+
+def read_data( path=DATA_PATH, **kwargs ):
+    """
+        Lê o CSV já com os tipos do SCHEMA e os sentinelas de NaN convertidos
+        em nulos
+        
+        Input: caminho do CSV (e argumentos extras do pd.read_csv)
+        Output: Dataframe bruto tipado
+    """
+    return pd.read_csv( path, dtype=SCHEMA, na_values=NA_VALUES, **kwargs )
+
+def strip_text( serie ):
+    """
+        Remove os espaços das pontas de uma coluna texto. Nas categóricas
+        apenas as categorias são tratadas, sem percorrer as linhas.
+        
+        Input: Series
+        Output: Series
+    """
+    if not isinstance( serie.dtype, pd.CategoricalDtype ):
+        return serie.str.strip()
+
+    categorias = serie.cat.categories.str.strip()
+    if categorias.is_unique:
+        return serie.cat.rename_categories( categorias )
+
+    # Categorias que ficam iguais depois do strip ('Urban' e 'Urban ') são unidas
+    return serie.astype( 'str' ).str.strip().astype( 'category' )
+
+def map_categories( serie, func ):
+    """
+        Aplica func sobre os valores distintos de uma coluna categórica e
+        espalha o resultado para as linhas pelos códigos das categorias
+        
+        Input: Series, função que recebe e devolve valores vetorizados
+        Output: Series
+    """
+    if not isinstance( serie.dtype, pd.CategoricalDtype ):
+        return func( serie )
+
+    valores = np.asarray( func( serie.cat.categories ) )
+    return pd.Series( valores[serie.cat.codes], index=serie.index, name=serie.name )
+
+def minute_of_day( serie ):
+    """
+        Converte horários 'HH:MM:SS' em minuto do dia. Valores vazios ou
+        inválidos viram -1.
+
+        Input: Series ou Index de texto
+        Output: array int16
+    """
+    partes = pd.Series( serie, dtype='str' ).str.extract( r'^\s*(\d{1,2}):(\d{2})' )
+    minutos = partes[0].astype( 'float64' ) * 60 + partes[1].astype( 'float64' )
+    minutos = minutos.where( minutos < 1440 )
+
+    return minutos.fillna( -1 ).to_numpy( dtype=np.int16 )
+
+def clean_code( df1 ):
+    """
+        Esta função tem a responsabilidade de limpar o dataframe lido por
+        read_data
+        
+        Tipos de limpeza:
+        1. Remoção dos NaN
+        2. Mudança do tipo da coluna de dados
+        3. Remoção dos espaços das variáveis texto
+        4. Formatação da coluna de data
+        5. Limpeza da coluna de tempo (remoção do texto da variável numérica)
+        6. Cálculo da distância entre restaurante e local de entrega
+        7. Conversão dos horários do pedido e da retirada em minuto do dia
+        
+        Input: Dataframe
+        Output: Dataframe
+    """
+    
+    # Removendo os espaços depois das strings
+    for col in ['ID', 'Delivery_person_ID'] + CATEGORY_COLUMNS:
+        df1[col] = strip_text( df1[col] )
+
+    # Excluindo as linhas vazias de uma só vez
+    df1 = df1.dropna( subset=REQUIRED_COLUMNS ).reset_index( drop=True )
+
+    # Limpando a coluna de Time Taken
+    df1['Time_taken(min)'] = map_categories( df1['Time_taken(min)'],
+                                             lambda s: s.str.extract( r'\(min\) (\d+)', expand=False ) )
+
+    # Convertendo para os tipos numéricos compactos
+    df1 = df1.astype( NUMERIC_TYPES )
+
+    # Conversao de texto para data
+    df1['Order_Date'] = map_categories( df1['Order_Date'],
+                                        lambda s: pd.to_datetime( s, format='%d-%m-%Y' ) )
+
+    # Categorias que só existiam nas linhas removidas
+    for col in ['Delivery_person_ID'] + CATEGORY_COLUMNS:
+        df1[col] = df1[col].cat.remove_unused_categories()
+
+    # Distância da entrega em km, calculada uma vez para todas as linhas
+    with span( 'haversine', rows=len( df1 ) ):
+        df1['distance'] = haversine_distance( df1['Restaurant_latitude'], df1['Restaurant_longitude'],
+                                              df1['Delivery_location_latitude'], df1['Delivery_location_longitude'] )
+
+    # Horários como minuto do dia (int16), no lugar do texto. A conversão é
+    # feita nas categorias; o código -1 (vazio) lê o -1 acrescentado no final
+    for col, minuto in TIME_COLUMNS.items():
+        valores = np.append( minute_of_day( df1[col].cat.categories ), np.int16( -1 ) )
+        df1[minuto] = valores[df1[col].cat.codes.to_numpy()]
+    df1 = df1.drop( columns=list( TIME_COLUMNS ) )
+
+    return df1
+
+def file_key( path ):
+    """
+        Identifica a versão do arquivo de origem pelo caminho absoluto,
+        tamanho em bytes e data de modificação.
+        
+        Input: caminho do arquivo
+        Output: tupla (caminho, tamanho, mtime)
+    """
+    stat = os.stat( path )
+    return ( os.path.abspath( path ), stat.st_size, stat.st_mtime_ns )
+
+def _build( path, use_snapshot ):
+    # Importado aqui porque os módulos de snapshot e ingestão dependem deste
+    from utils import ingest, snapshot
+
+    if use_snapshot and snapshot.available():
+        snapshot_dir = snapshot.snapshot_dir_for( path )
+        manifest = snapshot.build_snapshot( path, snapshot_dir )
+        watermark = { k: manifest[k] for k in ( 'header', 'offset', 'check' ) }
+        with span( 'load_snapshot' ) as sp:
+            df1 = snapshot.load_snapshot( snapshot_dir )
+            sp['rows'] = len( df1 )
+    else:
+        watermark = ingest.watermark_for( path )
+        with span( 'read_data' ) as sp:
+            df1 = read_data( ingest.complete_lines( path, watermark['offset'] ) )
+            sp['rows'] = len( df1 )
+        with span( 'clean_code', rows=len( df1 ) ) as sp:
+            df1 = clean_code( df1 )
+            sp['rows'] = len( df1 )
+
+    # Ordenado por data para que os filtros usem busca binária
+    with span( 'sort_by_date', rows=len( df1 ) ):
+        return df1.sort_values( 'Order_Date', kind='stable', ignore_index=True ), watermark
+
+def _drop( source ):
+    for old_key in [k for k in _cache if k[0] == source]:
+        del _cache[old_key]
+    for old_key in [k for k in _derived if k[0][0] == source]:
+        del _derived[old_key]
+    _sources.pop( source, None )
+
+def _refresh( path ):
+    """
+        Atualiza o que está em memória para a versão atual do arquivo
+        
+        Com linhas novas apenas no final, elas são limpas uma vez e somadas ao
+        dataframe e às estruturas derivadas que têm função de atualização; as
+        demais são descartadas e reconstruídas quando pedidas. Se o arquivo foi
+        editado, tudo é descartado.
+        
+        Input: caminho do CSV
+        Output: versão atual do arquivo (file_key)
+    """
+    from utils import ingest
+
+    key = file_key( path )
+    source = _sources.get( key[0] )
+    if source is None or source[0] == key:
+        return key
+
+    with span( 'read_appended' ) as sp:
+        df_new, watermark = ingest.read_appended( path, source[1] )
+        sp['rows'] = None if df_new is None else len( df_new )
+    if df_new is None:
+        _drop( key[0] )
+        return key
+
+    cache_stats['appends'] += 1
+    for old_key in [k for k in _cache if k[0] == key[0]]:
+        with span( 'append_rows', rows=len( df_new ) ):
+            _cache[key + old_key[3:]] = ingest.append_rows( _cache.pop( old_key ), df_new )
+    for old_key, name in [k for k in _derived if k[0][0] == key[0]]:
+        value = _derived.pop( ( old_key, name ) )
+        if len( df_new ) == 0:
+            _derived[( key + old_key[3:], name )] = value
+        elif name in _updaters:
+            with span( f'update:{name}', rows=len( df_new ) ):
+                _derived[( key + old_key[3:], name )] = _updaters[name]( value, df_new )
+    _sources[key[0]] = ( key, watermark )
+
+    return key
+
+def _load( path, use_snapshot ):
+    with _cache_lock:
+        key = _refresh( path ) + ( use_snapshot, )
+        df1 = _cache.get( key )
+        if df1 is not None:
+            cache_stats['hits'] += 1
+        else:
+            cache_stats['misses'] += 1
+            df1, watermark = _build( path, use_snapshot )
+
+            # Apenas uma versão de cada arquivo fica em memória
+            for old_key in [k for k in _cache if k[0] == key[0]]:
+                del _cache[old_key]
+                for derived_key in [k for k in _derived if k[0] == old_key]:
+                    del _derived[derived_key]
+            _cache[key] = df1
+            _sources[key[0]] = ( key[:3], watermark )
+
+    return key, df1
+
+def load_data( path=DATA_PATH, use_snapshot=True ):
+    """
+        Esta função tem a responsabilidade de entregar o dataframe limpo
+        para as páginas
+        
+        O CSV só é lido e limpo novamente quando o arquivo muda (caminho,
+        tamanho ou mtime). As chamadas seguintes reaproveitam o resultado
+        em cache e contam um acerto em cache_stats. Se o arquivo só recebeu
+        linhas novas no final, apenas elas são lidas e limpas.
+        
+        Com o pyarrow instalado os dados vêm do snapshot em Parquet
+        (utils.snapshot), que é atualizado incrementalmente antes da leitura.
+        Sem ele, ou com use_snapshot=False, o CSV é lido e limpo por inteiro.
+        
+        O dataframe devolvido é uma cópia rasa: com Copy-on-Write, qualquer
+        alteração feita pela página fica na cópia dela e nunca chega ao
+        dataframe em cache.
+        
+        Input: caminho do CSV, uso do snapshot em Parquet
+        Output: Dataframe limpo
+    """
+    key, df1 = _load( path, use_snapshot )
+
+    return df1.copy( deep=False )
+
+def load_derived( name, builder, path=DATA_PATH, use_snapshot=True, update=None ):
+    """
+        Estruturas calculadas a partir do dataframe limpo (índices, agregados)
+        ficam em cache junto com ele e são descartadas quando o CSV muda
+        
+        Com update, linhas novas no final do CSV são somadas à estrutura
+        existente com update( estrutura, df_new ) em vez de reconstruí-la.
+        
+        Input: nome da estrutura, função que a constrói a partir do
+               dataframe, caminho do CSV, uso do snapshot em Parquet,
+               função de atualização
+        Output: resultado de builder( df1 )
+    """
+    with _cache_lock:
+        if update is not None:
+            _updaters[name] = update
+        key, df1 = _load( path, use_snapshot )
+        if ( key, name ) not in _derived:
+            with span( f'build:{name}', rows=len( df1 ) ):
+                _derived[( key, name )] = builder( df1 )
+
+        return _derived[( key, name )]
+
+def load_from_source( name, builder, path=DATA_PATH, update=None ):
+    """
+        Como load_derived, para estruturas construídas direto do CSV, sem
+        carregar o dataframe limpo (ingestão em blocos, por exemplo)
+        
+        Input: nome da estrutura, função que a constrói a partir do caminho
+               do CSV, caminho do CSV, função de atualização
+        Output: resultado de builder( path )
+    """
+    from utils import ingest
+
+    with _cache_lock:
+        if update is not None:
+            _updaters[name] = update
+        key = ( _refresh( path ), name )
+
+        if key not in _derived:
+            for old_key in [k for k in _derived if k[0][0] == key[0][0] and k[1] == name]:
+                del _derived[old_key]
+            cache_stats['misses'] += 1
+            watermark = ingest.watermark_for( path )
+            with span( f'build:{name}' ):
+                _derived[key] = builder( path )
+            _sources.setdefault( key[0][0], ( key[0], watermark ) )
+        else:
+            cache_stats['hits'] += 1
+
+        return _derived[key]
+
+def clear_cache():
+    """
+        Descarta os dataframes em cache e zera os contadores
+    """
+    with _cache_lock:
+        _cache.clear()
+        _derived.clear()
+        _sources.clear()
+        cache_stats['hits'] = 0
+        cache_stats['misses'] = 0
+        cache_stats['appends'] = 0
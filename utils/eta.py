@@ -0,0 +1,357 @@
+# ================================
+# Previsão do tempo de entrega
+# ================================
+#
+# Modelo linear (regressão ridge) do Time_taken(min) a partir da distância,
+# do tráfego, do clima, da condição do veículo, das entregas múltiplas, do
+# festival e da cidade, com duas interações: tráfego x cidade e distância x
+# tráfego (a velocidade muda com o trânsito).
+#
+# O treino acumula X'X e X'y em blocos de linhas, então a matriz completa
+# nunca fica em memória. A previsão não monta matriz nenhuma: cada variável
+# categórica vira um código inteiro e a previsão é a soma dos coeficientes
+# lidos por esses códigos, o que permite pontuar milhões de pedidos de uma vez
+# e simular cenários (todos os pedidos com tráfego 'Jam', por exemplo).
+#
+# O modelo treinado é gravado em JSON em CURRY_MODEL_DIR (padrão:
+# dataset/models) junto com a versão do CSV usada no treino, e só é treinado
+# de novo quando o CSV muda.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_PATH, file_key, load_derived
+
+MODEL_DIR = os.environ.get( 'CURRY_MODEL_DIR', os.path.join( 'dataset', 'models' ) )
+
+TARGET = 'Time_taken(min)'
+NUMERIC_FEATURES = ['distance', 'Vehicle_condition', 'multiple_deliveries']
+CATEGORICAL_FEATURES = ['Road_traffic_density', 'Weatherconditions', 'Festival', 'City']
+INTERACTIONS = [( 'Road_traffic_density', 'City' )]
+SLOPES = [( 'distance', 'Road_traffic_density' )]   # inclinação de distância por tráfego
+
+RIDGE = 1.0
+HOLDOUT = 0.2
+CHUNK_ROWS = 250_000
+
+
+def category_codes( values, categories ):
+    """
+        Códigos das categorias do treino; valores desconhecidos viram -1
+    """
+    if isinstance( getattr( values, 'dtype', None ), pd.CategoricalDtype ):
+        # Só as categorias da coluna são convertidas; as linhas são lidas pelos códigos
+        de_para = category_codes( values.cat.categories.astype( str ), categories )
+        return np.append( de_para, -1 ).astype( np.int32 )[values.cat.codes.to_numpy()]
+    return pd.Categorical( np.asarray( values, dtype=object ), categories=categories ).codes.astype( np.int32 )
+
+
+class EtaModel:
+    """
+        Modelo do tempo de entrega
+
+        Input: nível de regularização ridge
+    """
+
+    def __init__( self, ridge=RIDGE ):
+        self.ridge = ridge
+        self.categories = {}      # coluna -> categorias do treino
+        self.center = {}          # coluna numérica -> (média, desvio)
+        self.coef = {}            # bloco -> coeficientes
+        self.intercept = 0.0
+        self.metrics = {}
+        self.source = None        # versão do CSV usada no treino
+
+    # ---------- codificação ----------
+    def encode( self, df, **overrides ):
+        """
+            Esta função tem a responsabilidade de converter os pedidos para as
+            variáveis do modelo
+
+            Input: Dataframe limpo, valores fixos para simular cenários
+                   (Road_traffic_density='Jam', distance=5...)
+            Output: dicionário coluna -> array (float64 para numéricas,
+                    int32 com os códigos para categóricas)
+        """
+        n = len( df )
+        encoded = {}
+        for col in NUMERIC_FEATURES:
+            valores = overrides[col] if col in overrides else df[col].to_numpy( dtype=np.float64, na_value=np.nan )
+            media, desvio = self.center[col]
+            valores = np.broadcast_to( np.asarray( valores, dtype=np.float64 ), ( n, ) )
+            encoded[col] = ( np.where( np.isnan( valores ), media, valores ) - media ) / desvio
+        for col in CATEGORICAL_FEATURES:
+            valores = [overrides[col]] * n if col in overrides else df[col]
+            encoded[col] = category_codes( valores, self.categories[col] )
+
+        return encoded
+
+    def _pair_codes( self, encoded, a, b ):
+        n_b = len( self.categories[b] )
+        codes = encoded[a] * n_b + encoded[b]
+        return np.where( ( encoded[a] < 0 ) | ( encoded[b] < 0 ), -1, codes )
+
+    def _blocks( self ):
+        # Nome do bloco -> tamanho, na ordem das colunas da matriz
+        blocos = { 'numeric': len( NUMERIC_FEATURES ) }
+        for col in CATEGORICAL_FEATURES:
+            blocos[col] = len( self.categories[col] )
+        for a, b in INTERACTIONS:
+            blocos[f'{a}*{b}'] = len( self.categories[a] ) * len( self.categories[b] )
+        for num, cat in SLOPES:
+            blocos[f'{num}*{cat}'] = len( self.categories[cat] )
+        return blocos
+
+    def _design( self, encoded, start, stop ):
+        """
+            Matriz do bloco de linhas [start, stop), com a coluna do intercepto
+        """
+        blocos = self._blocks()
+        X = np.zeros( ( stop - start, 1 + sum( blocos.values() ) ) )
+        X[:, 0] = 1.0
+        linhas = np.arange( stop - start )
+        parte = { col: valores[start:stop] for col, valores in encoded.items() }
+        pos = 1
+
+        X[:, pos:pos + len( NUMERIC_FEATURES )] = np.column_stack( [parte[c] for c in NUMERIC_FEATURES] )
+        pos += len( NUMERIC_FEATURES )
+
+        def one_hot( codes, tamanho, peso=1.0 ):
+            validos = codes >= 0
+            X[linhas[validos], pos + codes[validos]] = peso[validos] if np.ndim( peso ) else peso
+            return pos + tamanho
+
+        for col in CATEGORICAL_FEATURES:
+            pos = one_hot( parte[col], blocos[col] )
+        for a, b in INTERACTIONS:
+            pos = one_hot( self._pair_codes( parte, a, b ), blocos[f'{a}*{b}'] )
+        for num, cat in SLOPES:
+            pos = one_hot( parte[cat], blocos[f'{num}*{cat}'], parte[num] )
+
+        return X
+
+    # ---------- treino ----------
+    def fit( self, df1, holdout=HOLDOUT, seed=0 ):
+        """
+            Esta função tem a responsabilidade de treinar o modelo
+
+            Uma fração holdout dos pedidos (sorteada com seed) fica fora do
+            treino e é usada para medir o erro.
+
+            Input: Dataframe limpo, fração de validação, semente
+            Output: o próprio modelo
+        """
+        for col in CATEGORICAL_FEATURES:
+            serie = df1[col]
+            categorias = serie.cat.categories if isinstance( serie.dtype, pd.CategoricalDtype ) else serie.unique()
+            self.categories[col] = sorted( str( c ) for c in categorias if pd.notna( c ) )
+        for col in NUMERIC_FEATURES:
+            valores = df1[col].to_numpy( dtype=np.float64, na_value=np.nan )
+            self.center[col] = ( float( np.nanmean( valores ) ), float( np.nanstd( valores ) ) or 1.0 )
+
+        encoded = self.encode( df1 )
+        y = df1[TARGET].to_numpy( dtype=np.float64 )
+        treino = np.random.default_rng( seed ).random( len( df1 ) ) >= holdout
+
+        p = 1 + sum( self._blocks().values() )
+        XtX = np.zeros( ( p, p ) )
+        Xty = np.zeros( p )
+        for start in range( 0, len( df1 ), CHUNK_ROWS ):
+            stop = min( start + CHUNK_ROWS, len( df1 ) )
+            X = self._design( encoded, start, stop )[treino[start:stop]]
+            XtX += X.T @ X
+            Xty += X.T @ y[start:stop][treino[start:stop]]
+
+        # Sem penalidade no intercepto
+        penalidade = np.full( p, self.ridge )
+        penalidade[0] = 0.0
+        beta = np.linalg.solve( XtX + np.diag( penalidade ), Xty )
+
+        self.intercept = float( beta[0] )
+        pos = 1
+        for nome, tamanho in self._blocks().items():
+            self.coef[nome] = beta[pos:pos + tamanho]
+            pos += tamanho
+
+        previsto = self.predict_encoded( encoded )
+        self.metrics = { 'train': _errors( y[treino], previsto[treino] ),
+                         'holdout': _errors( y[~treino], previsto[~treino] ),
+                         'rows': int( len( df1 ) ) }
+        return self
+
+    # ---------- previsão ----------
+    def predict_encoded( self, encoded, rows=None ):
+        """
+            Previsão vetorizada a partir de encode()
+
+            Input: variáveis codificadas, linhas (slice ou posições, opcional)
+            Output: array float64 com os minutos previstos
+        """
+        def pick( arr ):
+            return arr if rows is None else arr[rows]
+
+        def lookup( coef, codes ):
+            # Código -1 (categoria desconhecida) soma zero
+            return np.append( coef, 0.0 )[codes]
+
+        numericas = [pick( encoded[c] ) for c in NUMERIC_FEATURES]
+        previsto = np.full( len( numericas[0] ), self.intercept )
+        for w, valores in zip( self.coef['numeric'], numericas ):
+            previsto += w * valores
+        for col in CATEGORICAL_FEATURES:
+            previsto += lookup( self.coef[col], pick( encoded[col] ) )
+        for a, b in INTERACTIONS:
+            previsto += lookup( self.coef[f'{a}*{b}'], pick( self._pair_codes( encoded, a, b ) ) )
+        for num, cat in SLOPES:
+            previsto += lookup( self.coef[f'{num}*{cat}'], pick( encoded[cat] ) ) * pick( encoded[num] )
+
+        return previsto
+
+    def predict( self, df, **overrides ):
+        """
+            Esta função tem a responsabilidade de prever o tempo de entrega de
+            um lote de pedidos
+
+            Exemplo: model.predict( df1, Road_traffic_density='Jam' ) prevê
+            todos os pedidos como se o trânsito estivesse parado.
+
+            Input: Dataframe limpo, valores fixos para simular cenários
+            Output: array float64 com os minutos previstos
+        """
+        return self.predict_encoded( self.encode( df, **overrides ) )
+
+    # ---------- persistência ----------
+    def to_dict( self ):
+        return { 'ridge': self.ridge, 'categories': self.categories, 'center': self.center,
+                 'coef': { k: v.tolist() for k, v in self.coef.items() }, 'intercept': self.intercept,
+                 'metrics': self.metrics, 'source': self.source,
+                 'features': { 'numeric': NUMERIC_FEATURES, 'categorical': CATEGORICAL_FEATURES,
+                               'interactions': INTERACTIONS, 'slopes': SLOPES } }
+
+    @classmethod
+    def from_dict( cls, data ):
+        model = cls( data['ridge'] )
+        model.categories = data['categories']
+        model.center = { k: tuple( v ) for k, v in data['center'].items() }
+        model.coef = { k: np.asarray( v ) for k, v in data['coef'].items() }
+        model.intercept = data['intercept']
+        model.metrics = data['metrics']
+        model.source = data['source']
+        return model
+
+    def save( self, path ):
+        os.makedirs( os.path.dirname( os.path.abspath( path ) ), exist_ok=True )
+        with open( path + '.tmp', 'w' ) as f:
+            json.dump( self.to_dict(), f )
+        os.replace( path + '.tmp', path )
+
+    @classmethod
+    def load( cls, path ):
+        with open( path ) as f:
+            return cls.from_dict( json.load( f ) )
+
+
+def _errors( y, previsto ):
+    if len( y ) == 0:
+        return { 'mae': None, 'rmse': None, 'r2': None }
+    erro = previsto - y
+    total = ( ( y - y.mean() )**2 ).sum()
+    return { 'mae': float( np.abs( erro ).mean() ), 'rmse': float( np.sqrt( ( erro**2 ).mean() ) ),
+             'r2': float( 1 - ( erro**2 ).sum() / total ) if total > 0 else None }
+
+def model_path_for( csv_path ):
+    """
+        Arquivo do modelo de um CSV: dataset/train.csv -> dataset/models/train_eta.json
+    """
+    nome = os.path.splitext( os.path.basename( csv_path ) )[0]
+    return os.path.join( MODEL_DIR, f'{nome}_eta.json' )
+
+def train_model( df1, path=DATA_PATH ):
+    """
+        Esta função tem a responsabilidade de entregar o modelo da versão
+        atual do CSV: lê o modelo gravado quando ele foi treinado com a mesma
+        versão, senão treina e grava
+
+        Input: Dataframe limpo, caminho do CSV
+        Output: EtaModel
+    """
+    versao = list( file_key( path )[1:] )
+    arquivo = model_path_for( path )
+    if os.path.exists( arquivo ):
+        try:
+            model = EtaModel.load( arquivo )
+            if model.source == versao:
+                return model
+        except ( OSError, ValueError, KeyError ):
+            pass
+
+    model = EtaModel().fit( df1 )
+    model.source = versao
+    try:
+        model.save( arquivo )
+    except OSError:
+        # Sem permissão de escrita o modelo fica só em memória
+        pass
+    return model
+
+
+class OrderEta:
+    """
+        Modelo e pedidos codificados de uma versão do CSV, para pontuar os
+        pedidos filtrados sem codificá-los de novo
+
+        Input: Dataframe limpo (na mesma ordem de linhas do FilterIndex), caminho do CSV
+    """
+
+    def __init__( self, df1, path=DATA_PATH ):
+        self.model = train_model( df1, path )
+        self.encoded = self.model.encode( df1 )
+        self.actual = df1[TARGET].to_numpy( dtype=np.float64 )
+        self.city = df1['City'].to_numpy( dtype=object )
+
+    def predict( self, rows=None, **overrides ):
+        """
+            Previsão dos pedidos, opcionalmente em um cenário
+
+            Input: linhas dos filtros, valores fixos do cenário
+            Output: array float64
+        """
+        encoded = self.encoded
+        if overrides:
+            n = len( self.actual )
+            encoded = dict( encoded )
+            for col, value in overrides.items():
+                if col in CATEGORICAL_FEATURES:
+                    encoded[col] = np.full( n, category_codes( [value], self.model.categories[col] )[0] )
+                else:
+                    media, desvio = self.model.center[col]
+                    encoded[col] = np.full( n, ( float( value ) - media ) / desvio )
+        return self.model.predict_encoded( encoded, rows )
+
+    def by_city( self, rows=None, **overrides ):
+        """
+            Esta função tem a responsabilidade de comparar o tempo previsto com
+            o real por cidade
+
+            Input: linhas dos filtros, valores fixos do cenário
+            Output: Dataframe com City, orders, actual, predicted e mae
+        """
+        actual = self.actual if rows is None else self.actual[rows]
+        city = self.city if rows is None else self.city[rows]
+        previsto = self.predict( rows, **overrides )
+        df_aux = pd.DataFrame( { 'City': city, 'actual': actual, 'predicted': previsto,
+                                 'abs_error': np.abs( previsto - actual ) } )
+        df_aux = df_aux.groupby( 'City', sort=True ).agg( orders=( 'actual', 'size' ), actual=( 'actual', 'mean' ),
+                                                          predicted=( 'predicted', 'mean' ),
+                                                          mae=( 'abs_error', 'mean' ) ).reset_index()
+        return df_aux
+
+
+def load_eta( path=DATA_PATH ):
+    """
+        OrderEta do dataset atual, construído uma vez por versão do CSV
+    """
+    return load_derived( 'eta', lambda df1: OrderEta( df1, path ), path )
@@ -0,0 +1,275 @@
+# ================================
+# Filtros da barra lateral
+# ================================
+#
+# Os dados chegam ordenados por Order_Date, então o corte "pedidos antes da
+# data limite" é sempre um prefixo das linhas, encontrado por busca binária.
+# Para o tráfego, a cidade, o clima, o tipo de veículo e o festival, cada
+# valor tem um bitmap compactado (8 linhas por byte, np.packbits) montado uma
+# única vez. A seleção de uma dimensão é a união dos bitmaps escolhidos (em
+# cache) e as dimensões são combinadas por interseção, byte a byte, só até o
+# corte da data; as posições das linhas são extraídas uma única vez no final.
+#
+# Quando o filtro se reduz a um prefixo, rows() devolve uma fatia, que
+# seleciona as linhas do dataframe em cache sem cópia. Caso contrário, uma
+# única seleção por posições substitui as máscaras aplicadas em sequência.
+#
+# Os limites da barra lateral (primeira e última data, valores de cada
+# dimensão) também são lidos dos dados na construção do índice, em domains.
+# Com CURRY_MAX_MEMORY_MB o índice (que guarda o dataframe) não é montado: os
+# limites vêm da leitura do CSV em blocos (utils.streaming) e filter_mask
+# seleciona as linhas de cada bloco.
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_PATH, MAX_MEMORY_MB, load_derived, load_from_source
+
+# Dimensões com filtro na barra lateral, além da data
+FILTER_COLUMNS = ['Road_traffic_density', 'City', 'Weatherconditions', 'Type_of_vehicle', 'Festival']
+
+# Dimensões com os valores descritos em domains
+DOMAIN_COLUMNS = FILTER_COLUMNS + ['Type_of_order']
+
+# Data limite padrão da barra lateral, quando está dentro do período dos dados
+DEFAULT_DATE = pd.Timestamp( 2022, 4, 6 )
+
+
+def normalize_filters( filters, domains=None ):
+    """
+        Filtros em formato canônico: ( (coluna, (valores ordenados)), ... ),
+        sem as dimensões com todos os valores selecionados
+
+        Input: dicionário coluna -> valores selecionados (None = todos),
+               domains do FilterIndex
+        Output: tupla ordenada, usada também nas chaves de cache
+    """
+    normalizados = []
+    for col, values in sorted( ( filters or {} ).items() ):
+        if col not in FILTER_COLUMNS:
+            raise KeyError( f'filtro desconhecido: {col}' )
+        if values is None:
+            continue
+        values = tuple( sorted( set( [values] if isinstance( values, str ) else values ) ) )
+        if domains is not None and set( domains[col] ) <= set( values ):
+            continue
+        normalizados.append( ( col, values ) )
+
+    return tuple( normalizados )
+
+
+class FilterIndex:
+    """
+        Índice sobre o dataframe limpo para os filtros da barra lateral
+
+        Input: Dataframe limpo (será ordenado por Order_Date se necessário)
+    """
+
+    def __init__( self, df1, date_col='Order_Date', columns=FILTER_COLUMNS ):
+        if not df1[date_col].is_monotonic_increasing:
+            df1 = df1.sort_values( date_col, kind='stable', ignore_index=True )
+
+        self.df = df1
+        self.size = len( df1 )
+        self.dates = df1[date_col].to_numpy()
+
+        # Um bitmap compactado por valor de cada dimensão
+        self.bitmaps = {}
+        for col in columns:
+            serie = df1[col].astype( 'category' )
+            codes = serie.cat.codes.to_numpy()
+            self.bitmaps[col] = { value: np.packbits( codes == code )
+                                  for code, value in enumerate( serie.cat.categories ) }
+
+        self.domains = dataset_domains( df1, date_col )
+
+        self._unions = {}
+        self._lock = threading.Lock()
+
+    def date_cutoff( self, date_limit ):
+        """
+            Quantidade de linhas com Order_Date anterior à data limite
+        """
+        if date_limit is None:
+            return self.size
+        limite = np.datetime64( pd.Timestamp( date_limit ) )
+        return int( np.searchsorted( self.dates, limite, side='left' ) )
+
+    def bitmap( self, col, values ):
+        """
+            União compactada dos bitmaps dos valores selecionados de uma
+            dimensão. Retorna None quando todos os valores estão selecionados
+            (nenhuma linha é excluída).
+        """
+        selecionados = frozenset( values ).intersection( self.bitmaps[col] )
+        if selecionados == self.bitmaps[col].keys():
+            return None
+
+        with self._lock:
+            if ( col, selecionados ) not in self._unions:
+                bitmap = np.zeros( -( -self.size // 8 ), dtype=np.uint8 )
+                for value in selecionados:
+                    bitmap |= self.bitmaps[col][value]
+                self._unions[( col, selecionados )] = bitmap
+
+            return self._unions[( col, selecionados )]
+
+    def rows( self, date_limit=None, traffic_options=None, filters=None ):
+        """
+            Linhas que atendem aos filtros
+
+            Input: data limite (exclusiva), valores de tráfego selecionados,
+                   dicionário coluna -> valores das demais dimensões
+            Output: slice quando o resultado é um prefixo, ou array de posições
+        """
+        cut = self.date_cutoff( date_limit )
+
+        selecoes = dict( filters or {} )
+        if traffic_options is not None:
+            selecoes['Road_traffic_density'] = traffic_options
+        bitmaps = [self.bitmap( col, values ) for col, values in selecoes.items() if values is not None]
+        bitmaps = [bitmap for bitmap in bitmaps if bitmap is not None]
+
+        if not bitmaps:
+            return slice( 0, cut )
+
+        # Interseção só nos bytes antes do corte da data
+        n_bytes = -( -cut // 8 )
+        linhas = bitmaps[0][:n_bytes].copy()
+        for bitmap in bitmaps[1:]:
+            np.bitwise_and( linhas, bitmap[:n_bytes], out=linhas )
+
+        return np.flatnonzero( np.unpackbits( linhas, count=cut ) )
+
+
+def dataset_domains( df1, date_col='Order_Date' ):
+    """
+        Esta função tem a responsabilidade de descrever os limites dos filtros
+        a partir dos dados
+
+        Input: Dataframe limpo
+        Output: dicionário com date_min, date_max, date_default (a data padrão
+                dentro do período) e a lista de valores de cada DOMAIN_COLUMNS
+    """
+    if len( df1 ):
+        date_min, date_max = pd.Timestamp( df1[date_col].min() ), pd.Timestamp( df1[date_col].max() )
+    else:
+        date_min = date_max = DEFAULT_DATE
+
+    domains = { 'date_min': date_min, 'date_max': date_max,
+                'date_default': min( max( DEFAULT_DATE, date_min ), date_max ) }
+    for col in DOMAIN_COLUMNS:
+        serie = df1[col]
+        valores = serie.cat.categories if isinstance( serie.dtype, pd.CategoricalDtype ) else serie.dropna().unique()
+        domains[col] = sorted( str( value ) for value in valores )
+
+    return domains
+
+def merge_domains( domains, other ):
+    """
+        Limites de dois conjuntos de pedidos juntos (blocos do CSV, linhas
+        novas)
+    """
+    date_min, date_max = min( domains['date_min'], other['date_min'] ), max( domains['date_max'], other['date_max'] )
+    merged = { 'date_min': date_min, 'date_max': date_max,
+               'date_default': min( max( DEFAULT_DATE, date_min ), date_max ) }
+    for col in DOMAIN_COLUMNS:
+        merged[col] = sorted( set( domains[col] ) | set( other[col] ) )
+
+    return merged
+
+def filter_mask( df1, date_limit=None, traffic_options=None, filters=None ):
+    """
+        Máscara das linhas que atendem aos filtros, para os blocos lidos do
+        CSV quando não há índice
+
+        Input: Dataframe limpo, data limite (exclusiva), tráfegos, dicionário
+               coluna -> valores das demais dimensões
+        Output: array booleano
+    """
+    linhas = np.ones( len( df1 ), dtype=bool )
+    if date_limit is not None:
+        linhas &= ( df1['Order_Date'] < pd.Timestamp( date_limit ) ).to_numpy()
+
+    selecoes = dict( filters or {} )
+    if traffic_options is not None:
+        selecoes['Road_traffic_density'] = traffic_options
+    for col, values in selecoes.items():
+        if values is not None:
+            linhas &= df1[col].isin( list( values ) ).to_numpy()
+
+    return linhas
+
+def append_to_domains( domains, df_new ):
+    return merge_domains( domains, dataset_domains( df_new ) )
+
+def load_filter_index( path=DATA_PATH ):
+    """
+        FilterIndex do dataset atual, construído uma vez por versão do CSV
+    """
+    return load_derived( 'filter_index', FilterIndex, path )
+
+def load_domains( path=DATA_PATH, max_memory_mb=MAX_MEMORY_MB ):
+    """
+        Limites e valores dos filtros do dataset atual; com max_memory_mb
+        vêm da leitura do CSV em blocos, sem o índice
+    """
+    if max_memory_mb:
+        from utils.streaming import stream_domains
+
+        return load_from_source( f'domains_stream_{max_memory_mb}',
+                                 lambda csv: stream_domains( csv, max_memory_mb ), path,
+                                 update=append_to_domains )
+
+    return load_filter_index( path ).domains
+
+
+# ===============================
+# Filtros na barra lateral
+# ===============================
+# Rótulos das dimensões na barra lateral
+FILTER_LABELS = {
+    'Road_traffic_density': 'Quais as condições do trânsito?',
+    'City': 'Quais cidades?',
+    'Weatherconditions': 'Quais as condições climáticas?',
+    'Type_of_vehicle': 'Quais tipos de veículo?',
+    'Festival': 'Pedidos em festival?',
+}
+
+def sidebar_filters( path=DATA_PATH ):
+    """
+        Esta função tem a responsabilidade de desenhar os filtros da barra
+        lateral com os limites lidos dos dados
+
+        Input: caminho do CSV
+        Output: (data limite, tráfegos selecionados, dicionário coluna ->
+                 valores das demais dimensões)
+    """
+    import datetime
+
+    import streamlit as st
+
+    domains = load_domains( path )
+
+    st.sidebar.markdown( '## Selecione uma data limite' )
+
+    date_slider = st.sidebar.slider(
+        'Até qual valor?',
+        value=domains['date_default'].to_pydatetime(),
+        min_value=domains['date_min'].to_pydatetime(),
+        # A data limite é exclusiva: o dia seguinte ao último inclui todos os pedidos
+        max_value=( domains['date_max'] + datetime.timedelta( days=1 ) ).to_pydatetime(),
+        format='DD-MM-YYYY'
+    )
+
+    st.sidebar.markdown( """---""" )
+
+    selecoes = {}
+    for col, label in FILTER_LABELS.items():
+        selecoes[col] = st.sidebar.multiselect( label, domains[col], default=domains[col] )
+
+    traffic_options = selecoes.pop( 'Road_traffic_density' )
+
+    return pd.to_datetime( date_slider ), traffic_options, selecoes
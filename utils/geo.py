@@ -0,0 +1,25 @@
+# ================================
+# Funções geográficas
+# ================================
+
+import numpy as np
+
+# Mesmo raio médio da Terra usado pelo pacote haversine
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_distance( lat1, lon1, lat2, lon2 ):
+    """
+        Distância do grande círculo em km, calculada sobre arrays inteiros
+        de latitude e longitude (em graus) de uma só vez
+        
+        Input: arrays de latitude/longitude de origem e destino
+        Output: array de distâncias em km
+    """
+    lat1, lon1, lat2, lon2 = ( np.radians( np.asarray( x, dtype=np.float64 ) )
+                               for x in ( lat1, lon1, lat2, lon2 ) )
+
+    d = ( np.sin( ( lat2 - lat1 ) * 0.5 ) ** 2
+          + np.cos( lat1 ) * np.cos( lat2 ) * np.sin( ( lon2 - lon1 ) * 0.5 ) ** 2 )
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin( np.sqrt( d ) )
@@ -0,0 +1,102 @@
+# ================================
+# Grade geográfica dos pedidos
+# ================================
+#
+# As coordenadas dos restaurantes e dos locais de entrega são agrupadas em
+# uma grade de latitude/longitude com vários níveis, no estilo do geohash: no
+# nível z o globo é dividido em 2^z faixas de latitude e 2^z de longitude, e
+# cada célula do nível z contém exatamente 4 células do nível z+1.
+#
+# A contagem de pedidos por célula é feita uma vez, na construção do cubo
+# (utils.cube), e o mapa mostra a densidade por célula em vez de um marcador
+# por pedido.
+
+import numpy as np
+import pandas as pd
+
+from utils.geo import EARTH_RADIUS_KM
+
+# Camadas do mapa: nome -> colunas de latitude e longitude
+GEO_LAYERS = {
+    'delivery': ( 'Delivery_location_latitude', 'Delivery_location_longitude' ),
+    'restaurant': ( 'Restaurant_latitude', 'Restaurant_longitude' ),
+}
+
+# Níveis da grade, do mais grosso (~80 km) ao mais fino (~1 km)
+GRID_LEVELS = ( 8, 10, 12, 14 )
+DEFAULT_LEVEL = 12
+
+
+def cell_size_km( level ):
+    """
+        Altura aproximada de uma célula do nível, em km
+    """
+    return np.radians( 180 / 2**level ) * EARTH_RADIUS_KM
+
+def valid_points( lat, lon ):
+    """
+        Coordenadas preenchidas: o dataset usa (0, 0) e valores próximos para
+        locais desconhecidos
+    """
+    return ( np.abs( lat ) >= 1 ) | ( np.abs( lon ) >= 1 )
+
+def cell_ids( lat, lon, level ):
+    """
+        Esta função tem a responsabilidade de identificar a célula de cada ponto
+
+        Input: arrays de latitude e longitude em graus, nível da grade
+        Output: array int64 com linha * 2^level + coluna
+    """
+    n = 2**level
+    rows = np.clip( np.floor( ( np.asarray( lat ) + 90 ) / 180 * n ), 0, n - 1 ).astype( np.int64 )
+    cols = np.clip( np.floor( ( np.asarray( lon ) + 180 ) / 360 * n ), 0, n - 1 ).astype( np.int64 )
+    return rows * n + cols
+
+def parent_ids( cells, level, parent_level ):
+    """
+        Células de um nível mais grosso que contêm as células dadas
+    """
+    shift = level - parent_level
+    rows, cols = np.divmod( cells, 2**level )
+    return ( rows >> shift ) * 2**parent_level + ( cols >> shift )
+
+def cell_centers( cells, level ):
+    """
+        Latitude e longitude do centro de cada célula
+
+        Input: array de células, nível da grade
+        Output: (latitudes, longitudes)
+    """
+    n = 2**level
+    rows, cols = np.divmod( np.asarray( cells ), n )
+    return ( rows + 0.5 ) / n * 180 - 90, ( cols + 0.5 ) / n * 360 - 180
+
+def bin_points( df1, dims, levels=GRID_LEVELS ):
+    """
+        Esta função tem a responsabilidade de contar os pedidos por célula da
+        grade, em cada camada e nível
+
+        As células do nível mais fino são calculadas uma vez; as dos demais
+        níveis saem delas por deslocamento de bits.
+
+        Input: Dataframe limpo, dimensões mantidas (data, tráfego), níveis
+        Output: Dataframe com dims, layer, level, cell e orders
+    """
+    fino = max( levels )
+    partes = []
+    for layer, ( lat_col, lon_col ) in GEO_LAYERS.items():
+        lat = df1[lat_col].to_numpy()
+        lon = df1[lon_col].to_numpy()
+        linhas = valid_points( lat, lon )
+        cells = cell_ids( lat[linhas], lon[linhas], fino )
+        base = df1.loc[linhas, dims].reset_index( drop=True )
+
+        for level in levels:
+            df_aux = base.assign( cell=parent_ids( cells, fino, level ) )
+            df_aux = df_aux.groupby( dims + ['cell'], observed=True ).size().rename( 'orders' ).reset_index()
+            partes.append( df_aux.assign( layer=layer, level=np.int8( level ) ) )
+
+    df_aux = pd.concat( partes, ignore_index=True )
+    df_aux['layer'] = pd.Categorical( df_aux['layer'], categories=list( GEO_LAYERS ) )
+
+    return df_aux.loc[:, dims + ['layer', 'level', 'cell', 'orders']]
@@ -0,0 +1,151 @@
+# ================================
+# Ingestão incremental do CSV
+# ================================
+#
+# O CSV de pedidos só recebe linhas novas no final. A marca d'água guarda o
+# cabeçalho, até qual byte o arquivo já foi lido e um hash do início do
+# arquivo e do trecho logo antes desse byte. Quando o arquivo muda:
+#
+# 1. Início e trecho antes da marca iguais: apenas as linhas depois da marca
+#    são lidas e limpas, e entram nas estruturas já carregadas
+# 2. Caso contrário o arquivo foi editado e tudo é recarregado
+#
+# O snapshot em Parquet (utils.snapshot) usa a mesma marca d'água no
+# manifesto; aqui ela vale para os dados em memória de um processo.
+
+import hashlib
+import io
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from utils.data import clean_code, read_data
+
+# Quantidade de bytes no início do CSV e antes da marca d'água usada para
+# detectar edições no conteúdo já processado
+CHECK_BYTES = 64 * 1024
+
+
+def digest( data ):
+    return hashlib.sha1( data ).hexdigest()
+
+def last_newline( f, size ):
+    """
+        Posição logo após a última quebra de linha do arquivo. Uma linha final
+        sem quebra é considerada uma escrita ainda em andamento e fica para a
+        próxima leitura.
+    """
+    pos = size
+    while pos > 0:
+        start = max( 0, pos - CHECK_BYTES )
+        f.seek( start )
+        bloco = f.read( pos - start )
+        idx = bloco.rfind( b'\n' )
+        if idx >= 0:
+            return start + idx + 1
+        pos = start
+    return 0
+
+def check_digest( f, offset ):
+    f.seek( 0 )
+    inicio = f.read( min( offset, CHECK_BYTES ) )
+    start = max( 0, offset - CHECK_BYTES )
+    f.seek( start )
+    return digest( inicio + f.read( offset - start ) )
+
+def is_append( watermark, f, header, size ):
+    """
+        Verifica se o arquivo só recebeu linhas novas depois da marca d'água
+    """
+    return ( watermark['header'] == header.decode()
+             and size >= watermark['offset']
+             and watermark['check'] == check_digest( f, watermark['offset'] ) )
+
+def watermark_for( path ):
+    """
+        Marca d'água do conteúdo atual do arquivo (até a última linha completa)
+
+        Input: caminho do CSV
+        Output: dicionário com header, offset e check
+    """
+    with open( path, 'rb' ) as f:
+        header = f.readline()
+        size = os.fstat( f.fileno() ).st_size
+        offset = max( last_newline( f, size ), len( header ) )
+
+        return { 'header': header.decode(), 'offset': offset, 'check': check_digest( f, offset ) }
+
+def complete_lines( path, offset ):
+    """
+        Fonte para o read_csv com o arquivo até o byte offset: o próprio
+        caminho quando o arquivo termina nele, ou uma cópia em memória do
+        trecho quando há uma linha final incompleta depois da marca d'água
+    """
+    if os.path.getsize( path ) == offset:
+        return path
+
+    with open( path, 'rb' ) as f:
+        return io.BytesIO( f.read( offset ) )
+
+def read_appended( path, watermark ):
+    """
+        Esta função tem a responsabilidade de ler e limpar apenas as linhas
+        acrescentadas depois da marca d'água
+
+        Input: caminho do CSV, marca d'água da última leitura
+        Output: (Dataframe limpo com as linhas novas, nova marca d'água), ou
+                (None, None) se o arquivo foi editado antes da marca
+    """
+    with open( path, 'rb' ) as f:
+        header = f.readline()
+        size = os.fstat( f.fileno() ).st_size
+
+        if not is_append( watermark, f, header, size ):
+            return None, None
+
+        start = watermark['offset']
+        end = max( last_newline( f, size ), start )
+        f.seek( start )
+        novas = f.read( end - start )
+        check = check_digest( f, end )
+
+    df_new = clean_code( read_data( io.BytesIO( header + novas ) ) )
+
+    return df_new, { 'header': watermark['header'], 'offset': end, 'check': check }
+
+def append_rows( df1, df_new, date_col='Order_Date' ):
+    """
+        Esta função tem a responsabilidade de juntar as linhas novas ao
+        dataframe limpo, mantendo a ordem por data
+
+        As categorias das duas partes são unidas (em ordem alfabética quando
+        as do dataframe original já estavam) e a ordenação é estável: o
+        resultado é o mesmo da limpeza do arquivo inteiro.
+
+        Input: Dataframe limpo e ordenado por data, Dataframe limpo com as
+               linhas novas
+        Output: Dataframe
+    """
+    if len( df_new ) == 0:
+        return df1
+
+    df_new = df_new.sort_values( date_col, kind='stable', ignore_index=True )
+
+    colunas = {}
+    for col in df1.columns:
+        antigo, novo = df1[col], df_new[col]
+        if isinstance( antigo.dtype, pd.CategoricalDtype ):
+            ordenadas = antigo.cat.categories.is_monotonic_increasing
+            colunas[col] = union_categoricals( [antigo.array, novo.astype( 'category' ).array],
+                                               sort_categories=ordenadas )
+        else:
+            colunas[col] = pd.concat( [antigo, novo], ignore_index=True )
+
+    df_aux = pd.DataFrame( colunas )
+
+    # Pedidos novos com data anterior à última já carregada exigem reordenar
+    if len( df1 ) and df_new[date_col].iloc[0] < df1[date_col].iloc[-1]:
+        df_aux = df_aux.sort_values( date_col, kind='stable', ignore_index=True )
+
+    return df_aux
@@ -0,0 +1,203 @@
+# ================================
+# Ranking de entregadores por cidade
+# ================================
+#
+# O ranking guarda, por (cidade, entregador), a soma e a quantidade dos
+# tempos de entrega. Os 10 mais rápidos e os 10 mais lentos de cada cidade
+# saem de uma única passada pelos entregadores da cidade com dois heaps
+# limitados a k itens, sem ordenar todos os entregadores.
+#
+# Pedidos novos entram com update(): só as cidades que receberam pedidos têm
+# o ranking recalculado, as demais reaproveitam o resultado anterior. As
+# cidades vêm dos próprios dados.
+#
+# O ranking de todos os pedidos (load_leaderboard) é mantido assim: linhas
+# acrescentadas ao CSV são somadas a ele em vez de reconstruí-lo. Os rankings
+# de estados filtrados saem das somas por entregador do cubo filtrado.
+
+import heapq
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.couriers import encode_couriers
+from utils.data import DATA_PATH, load_derived
+
+# Tamanho padrão do ranking
+TOP_K = 10
+
+
+class _Desc:
+    """
+        Chave com a ordem invertida, para desempatar nos heaps
+    """
+    __slots__ = ( 'key', )
+
+    def __init__( self, key ):
+        self.key = key
+
+    def __eq__( self, other ):
+        return self.key == other.key
+
+    def __lt__( self, other ):
+        return other.key < self.key
+
+    def __gt__( self, other ):
+        return self.key < other.key
+
+
+def top_bottom( items, k ):
+    """
+        Esta função tem a responsabilidade de separar os k menores e os k
+        maiores valores em uma passada
+
+        Empates são resolvidos pela chave (a menor entra primeiro), então o
+        resultado não depende da ordem dos itens.
+
+        Input: iterável de (valor, chave), quantidade k
+        Output: duas listas de (valor, chave), a primeira em ordem crescente
+                e a segunda em ordem decrescente
+    """
+    fastest = []  # heap de máximo (valores negativos) com os k menores
+    slowest = []  # heap de mínimo com os k maiores
+
+    for value, key in items:
+        item = ( -value, _Desc( key ) )
+        if len( fastest ) < k:
+            heapq.heappush( fastest, item )
+        elif item > fastest[0]:
+            heapq.heapreplace( fastest, item )
+
+        item = ( value, _Desc( key ) )
+        if len( slowest ) < k:
+            heapq.heappush( slowest, item )
+        elif item > slowest[0]:
+            heapq.heapreplace( slowest, item )
+
+    fastest = sorted( ( -value, key.key ) for value, key in fastest )
+    slowest = sorted( ( ( value, key.key ) for value, key in slowest ), key=lambda item: ( -item[0], item[1] ) )
+
+    return fastest, slowest
+
+
+class Leaderboard:
+    """
+        Ranking incremental dos entregadores mais rápidos e mais lentos por cidade
+
+        Input: tamanho k do ranking
+    """
+
+    def __init__( self, k=TOP_K ):
+        self.k = k
+        self._sums = {}      # cidade -> {entregador: [soma dos tempos, pedidos]}
+        self._ranks = {}     # cidade -> (mais rápidos, mais lentos)
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cube( cls, cube, k=TOP_K ):
+        """
+            Ranking a partir das somas por entregador de um cubo (já filtrado)
+        """
+        leaderboard = cls( k )
+        leaderboard.update( cube.courier_cells, cube.couriers )
+        return leaderboard
+
+    @classmethod
+    def from_orders( cls, df1, k=TOP_K ):
+        """
+            Ranking a partir dos pedidos limpos
+        """
+        return cls( k ).add_orders( df1 )
+
+    def add_orders( self, df_new ):
+        """
+            Soma pedidos limpos ao ranking (linhas novas do CSV, por exemplo)
+
+            Input: Dataframe limpo
+            Output: o próprio ranking
+        """
+        codes, couriers = encode_couriers( df_new['Delivery_person_ID'] )
+        tempos = df_new['Time_taken(min)'].to_numpy( dtype=np.float64, na_value=np.nan )
+        courier_cells = pd.DataFrame( { 'City': df_new['City'].to_numpy(), 'courier': codes,
+                                        'time_sum': np.nan_to_num( tempos ),
+                                        'time_n': ( ~np.isnan( tempos ) ).astype( np.int64 ) } )
+        self.update( courier_cells.loc[codes >= 0], couriers )
+        return self
+
+    def update( self, courier_cells, couriers ):
+        """
+            Esta função tem a responsabilidade de somar pedidos novos ao ranking
+
+            A soma por (cidade, entregador) é feita pelos códigos inteiros; o
+            ranking guarda o Delivery_person_ID, que vale entre cubos.
+
+            Input: Dataframe com City, courier, time_sum e time_n (as somas
+                   por entregador do cubo), entregador de cada código
+        """
+        df_aux = ( courier_cells.groupby( ['City', 'courier'], observed=True, sort=False )
+                                [['time_sum', 'time_n']].sum() )
+        df_aux = df_aux.loc[df_aux['time_n'] > 0, :]
+        cidades = df_aux.index.get_level_values( 'City' )
+        ids = couriers.to_numpy()[df_aux.index.get_level_values( 'courier' ).to_numpy()]
+
+        with self._lock:
+            for city, courier, time_sum, time_n in zip( cidades, ids, df_aux['time_sum'], df_aux['time_n'] ):
+                acumulado = self._sums.setdefault( city, {} ).setdefault( courier, [0.0, 0] )
+                acumulado[0] += time_sum
+                acumulado[1] += time_n
+                self._dirty.add( city )
+
+    def memory_usage( self ):
+        """
+            Memória aproximada das somas por entregador, em bytes
+        """
+        total = 0
+        for couriers in self._sums.values():
+            total += sys.getsizeof( couriers )
+            total += sum( sys.getsizeof( courier ) + sys.getsizeof( acumulado ) + 48
+                          for courier, acumulado in couriers.items() )
+        return total
+
+    @property
+    def cities( self ):
+        return sorted( self._sums )
+
+    def ranks( self, city ):
+        """
+            Mais rápidos e mais lentos de uma cidade, recalculados só se a
+            cidade recebeu pedidos desde o último cálculo
+        """
+        with self._lock:
+            if city in self._dirty or city not in self._ranks:
+                medias = ( ( soma / n, courier ) for courier, ( soma, n ) in self._sums.get( city, {} ).items() )
+                self._ranks[city] = top_bottom( medias, self.k )
+                self._dirty.discard( city )
+            return self._ranks[city]
+
+    def table( self, fastest=True ):
+        """
+            Esta função tem a responsabilidade de montar a tabela do ranking
+
+            Input: True para os mais rápidos, False para os mais lentos
+            Output: Dataframe com City, Delivery_person_ID e Time_taken(min)
+        """
+        linhas = [( city, courier, value )
+                  for city in self.cities
+                  for value, courier in self.ranks( city )[0 if fastest else 1]]
+
+        return pd.DataFrame( linhas, columns=['City', 'Delivery_person_ID', 'Time_taken(min)'] )
+
+
+def append_to_leaderboard( leaderboard, df_new ):
+    return leaderboard.add_orders( df_new )
+
+def load_leaderboard( path=DATA_PATH ):
+    """
+        Ranking de todos os pedidos do dataset atual, construído uma vez por
+        versão do CSV; pedidos acrescentados ao CSV são somados ao ranking
+        existente
+    """
+    return load_derived( 'leaderboard', Leaderboard.from_orders, path, update=append_to_leaderboard )
@@ -0,0 +1,621 @@
+# ================================
+# Métricas do dashboard
+# ================================
+#
+# As funções que montam os gráficos, tabelas e KPIs das páginas, e uma API de
+# consulta para usá-las fora do Streamlit (utils.server, outros sistemas).
+#
+# Cada métrica recebe as fontes de dados pelo nome do parâmetro: cube (cubo
+# filtrado), stats (médias e desvios do StatsEngine), rows (linhas do
+# FilterIndex), locations (índices espaciais), leaderboard (ranking de
+# entregadores), couriers (dimensão de entregadores) e eta (modelo do tempo de
+# entrega com os pedidos codificados). Os demais parâmetros são opções da métrica, com valor padrão.
+#
+# FilterContext representa um estado dos filtros da barra lateral: as fontes
+# só são carregadas quando alguma métrica não está no cache de resultados, e
+# são compartilhadas entre as métricas do mesmo estado. Com filtros de cidade,
+# clima, veículo ou festival, as linhas vêm da interseção dos bitmaps do
+# FilterIndex e o cubo do estado é agregado só a partir delas (e guardado no
+# cache de resultados); sem eles, o cubo pré-calculado é apenas filtrado.
+
+import inspect
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from folium.plugins import HeatMap
+
+from utils.cache import filter_state, results
+from utils.couriers import load_couriers
+from utils.cube import build_cube, load_cube
+from utils.data import DATA_PATH, MAX_MEMORY_MB
+from utils.eta import load_eta
+from utils.filters import DEFAULT_DATE, filter_mask, load_domains, load_filter_index, normalize_filters
+from utils.grid import DEFAULT_LEVEL
+from utils.leaderboard import Leaderboard, load_leaderboard
+from utils.profiling import span
+from utils.spatial import load_locations
+from utils.table import table_view
+
+# Estado padrão da barra lateral (a data padrão vem de utils.filters)
+DEFAULT_TRAFFIC = ( 'Low', 'Medium', 'High', 'Jam' )
+
+
+# ===============================
+# Visão Empresa
+# ===============================
+def order_metric( cube ):
+    df_aux = cube.rollup( 'Order_Date' )
+    fig = px.bar(df_aux, x='Order_Date', y='orders')
+    return fig
+                 
+def traffic_order_share( cube ):
+    df_aux = cube.rollup( 'Road_traffic_density' )
+    df_aux[ 'perc_ID'] = 100* (df_aux['orders']/df_aux['orders'].sum())
+    fig = px.pie(df_aux, values = 'perc_ID', names = 'Road_traffic_density')            
+    return fig 
+
+def traffic_order_city ( cube ):
+    df_aux = cube.rollup( ['City', 'Road_traffic_density'] )
+    fig = px.scatter(df_aux, x = 'City', y = 'Road_traffic_density', size = 'orders')
+    return fig
+
+def order_by_week( cube ):
+    df_aux = cube.rollup( 'week_of_year' )
+    fig = px.line(df_aux, x = 'week_of_year', y = 'orders')
+    return fig
+
+# Entregadores distintos exatos; distinct='hll' usa os sketches aproximados
+def order_share_by_week( cube, distinct='exact' ):
+    df_aux = cube.rollup( 'week_of_year', distinct=distinct )
+    df_aux['order_by_delivery'] = df_aux['orders'] / df_aux['couriers']
+    fig = px.line( df_aux, x = 'week_of_year', y = 'order_by_delivery' )    
+    return fig
+
+def country_maps( cube, level=DEFAULT_LEVEL ):
+    # Densidade de pedidos por célula da grade, uma camada para os locais de
+    # entrega e outra para os restaurantes
+    delivery = cube.density( 'delivery', level )
+    restaurant = cube.density( 'restaurant', level )
+
+    # Desenhar o mapa
+    map = folium.Map( tiles='OpenStreetMap' )
+
+    for nome, data_plot, show in [( 'Entregas', delivery, True ), ( 'Restaurantes', restaurant, False )]:
+        camada = folium.FeatureGroup( name=nome, show=show )
+        if len( data_plot ) > 0:
+            pesos = data_plot['orders'] / data_plot['orders'].max()
+            HeatMap( np.column_stack( [data_plot['latitude'], data_plot['longitude'], pesos] ).tolist(),
+                     radius=12 ).add_to( camada )
+        camada.add_to( map )
+
+    folium.LayerControl().add_to( map )
+
+    # Enquadra as células com entregas, sem os pontos isolados
+    if len( delivery ) > 0:
+        lat = delivery['latitude'].to_numpy()
+        lon = delivery['longitude'].to_numpy()
+        map.fit_bounds( [[np.quantile( lat, 0.01 ), np.quantile( lon, 0.01 )],
+                         [np.quantile( lat, 0.99 ), np.quantile( lon, 0.99 )]] )
+
+    # O HTML pronto fica no cache de resultados por estado dos filtros
+    return folium.Figure().add_child( map ).render()
+
+# ===============================
+# Visão Entregadores
+# ===============================
+# Idades e condições dos veículos dos entregadores
+# (NaN quando nenhum pedido atende aos filtros)
+def courier_overview( cube ):
+    totais = cube.rollup( [] )
+    overview = { col: totais.loc[0, col] for col in ['age_min', 'age_max', 'vehicle_min', 'vehicle_max'] }
+
+    return overview
+
+# Avaliação média por entregador, com a cidade e o veículo do cadastro
+def mean_deliver(cube, couriers):
+    avg_delivery = cube.courier_rollup( 'Delivery_person_ID' )
+    avg_delivery = avg_delivery.loc[:, ['Delivery_person_ID', 'ratings_mean']]
+    avg_delivery.columns = ['Delivery_person_ID', 'Delivery_person_Ratings']
+
+    cadastro = couriers.attributes.iloc[couriers.codes( avg_delivery['Delivery_person_ID'] )]
+    avg_delivery['City'] = cadastro['City'].to_numpy()
+    avg_delivery['Type_of_vehicle'] = cadastro['Type_of_vehicle'].to_numpy()
+    
+    return avg_delivery
+
+# Avalição Média e Desvio Padrão
+def mean_std_ratings(stats):
+    mean_std_ratings = stats['traffic']
+    mean_std_ratings = mean_std_ratings.loc[:, ['Road_traffic_density', 'ratings_mean', 'ratings_std']]
+
+    return mean_std_ratings
+
+def mean_std_ratings_weather(stats):
+    mean_std_ratings = stats['weather']
+    mean_std_ratings = mean_std_ratings.loc[:, ['Weatherconditions', 'ratings_mean', 'ratings_std']]
+
+    return mean_std_ratings
+    
+# Os tops entregadores
+def courier_leaderboard( cube ):
+    return Leaderboard.from_cube( cube )
+
+def top_delivers ( leaderboard, top_asc=True ):
+    df3 = leaderboard.table( fastest=top_asc )
+            
+    return df3
+
+# ===============================
+# Visão Restaurantes
+# ===============================
+# Entregadores únicos
+def unique_couriers( cube, distinct='exact' ):
+    entregadores = int( cube.rollup( [], distinct=distinct ).loc[0, 'couriers'] )
+
+    return entregadores
+
+# Distância média das entregas            
+def avg_delivery( stats ):
+    avg_distance = np.round(stats['total'].loc[0, 'distance_mean'],2)
+    
+    return avg_distance
+
+# Cálculo da média e mediana das entregas com festival e sem festival
+def avg_std_delivery(stats, Festival='Yes', op='avg_time'):
+    df_aux = stats['festival']
+    df_aux = df_aux.rename( columns={'time_mean': 'avg_time', 'time_std': 'std_time'} )
+    df_aux = df_aux.set_index( 'Festival' )
+    df_aux = np.round(df_aux[op].get( Festival, np.nan ), 2)
+    
+    return df_aux
+
+# Tempo de espera por cidade
+def waiting_time( stats ):
+    df_aux = stats['city']
+
+    fig = go.Figure()
+    fig.add_trace( go.Bar( name='Control', x=df_aux['City'], y=df_aux['time_mean'], error_y=dict(type='data', array=df_aux['time_std'] ) ) )
+
+    fig.update_layout(barmode='group')            
+    
+    return fig
+
+# Tempo médio de entrega por cidade
+def waiting_time_city( stats ):
+    avg_distance = stats['city']
+
+    fig = go.Figure( data = [ go.Pie( labels = avg_distance['City'], values=avg_distance['distance_mean'], pull=[0, 0.1, 0] ) ] )
+    
+    return fig
+
+# Tempo de entrega por cidade e tipo de tráfego
+def waiting_time_city_traffic( stats ):
+    df_aux = stats['city_traffic']
+    df_aux = df_aux.rename( columns={'time_mean': 'avg_time', 'time_std': 'std_time'} )
+
+    fig = px.sunburst(df_aux, path = ['City', 'Road_traffic_density'], values = 'avg_time', 
+                      color = 'std_time', color_continuous_scale = 'RdBu', 
+                      color_continuous_midpoint=np.average(df_aux['std_time'] ) )
+    return fig
+
+
+# Tempo de entrega por cidade e tipo de pedido
+def waiting_time_city_typeorder( stats ):
+    delivery_time = stats['city_order']
+    delivery_time = delivery_time.loc[:, ['City', 'Type_of_order', 'time_mean', 'time_std']]
+    delivery_time.columns = ['City', 'Type_of_order', 'avg_time', 'std_time']
+    delivery_time = np.round(delivery_time, 2)
+
+    return delivery_time
+
+# Restaurantes para o painel de proximidade, do que tem mais pedidos ao que tem menos
+def restaurant_labels( locations ):
+    return locations.restaurants['label'].tolist()
+
+# Pedidos entregues em um raio ao redor do restaurante
+def orders_near_restaurant( locations, rows, restaurant=None, radius_km=3 ):
+    restaurant = restaurant or locations.restaurants['label'].iloc[0]
+    df_aux = locations.restaurants.set_index( 'label' ).loc[restaurant]
+    orders_near = locations.orders_near( df_aux['Restaurant_latitude'], df_aux['Restaurant_longitude'],
+                                         radius_km, rows )
+
+    return orders_near
+
+# Restaurantes mais próximos do restaurante
+def nearest_restaurants( locations, restaurant=None ):
+    restaurant = restaurant or locations.restaurants['label'].iloc[0]
+    df_aux = locations.restaurants.set_index( 'label' ).loc[restaurant]
+    df_aux = locations.nearest_restaurants( df_aux['Restaurant_latitude'], df_aux['Restaurant_longitude'], k=6 )
+    df_aux = df_aux.loc[df_aux['label'] != restaurant, ['restaurant', 'City', 'orders', 'distance_km']]
+    df_aux = np.round( df_aux.head( 5 ).reset_index( drop=True ), 2 )
+
+    return df_aux
+
+# Pedidos por zona de entrega
+def delivery_zones( locations, rows ):
+    df_aux = locations.zones( level=10, rows=rows ).head( 20 )
+    df_aux = df_aux.loc[:, ['latitude', 'longitude', 'orders', 'time_mean', 'distance_mean']]
+    df_aux.columns = ['latitude', 'longitude', 'orders', 'avg_time', 'avg_distance']
+    df_aux = np.round( df_aux, 2 )
+
+    return df_aux
+
+# Tempo médio de preparo (do pedido à retirada), em minutos
+def avg_prep_time( cube ):
+    prep_time = np.round( cube.hourly_rollup( [] ).loc[0, 'prep_mean'], 2 )
+
+    return prep_time
+
+# Tempo de preparo por cidade
+def prep_time_city( cube ):
+    df_aux = cube.hourly_rollup( 'City' )
+    df_aux = df_aux.loc[:, ['City', 'orders', 'prep_mean', 'prep_std']]
+    df_aux.columns = ['City', 'orders', 'avg_prep', 'std_prep']
+    df_aux = np.round( df_aux, 2 )
+
+    return df_aux
+
+# Pedidos por hora do dia em cada cidade
+def hourly_load_city( cube ):
+    df_aux = cube.hourly_rollup( ['City', 'order_hour'] )
+    fig = px.line( df_aux, x='order_hour', y='orders', color='City', markers=True )
+    fig.update_xaxes( dtick=1 )
+
+    return fig
+
+# Mapa de calor dos pedidos por dia da semana e hora; com City, só a cidade
+def peak_hour_heatmap( cube, City='' ):
+    by = ['City', 'Order_Date', 'order_hour'] if City else ['Order_Date', 'order_hour']
+    df_aux = cube.hourly_rollup( by )
+    if City:
+        df_aux = df_aux.loc[df_aux['City'] == City]
+
+    dias = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+    df_aux = df_aux.assign( weekday=df_aux['Order_Date'].dt.dayofweek )
+    df_aux = ( df_aux.pivot_table( index='weekday', columns='order_hour', values='orders', aggfunc='sum' )
+                     .reindex( index=range( 7 ), columns=range( 24 ) )
+                     .fillna( 0 ) )
+
+    fig = go.Figure( data=go.Heatmap( z=df_aux.to_numpy(), x=list( df_aux.columns ), y=dias,
+                                      colorscale='YlOrRd', hovertemplate='%{y} %{x}h: %{z} pedidos<extra></extra>' ) )
+    fig.update_xaxes( title='Hora do pedido', dtick=1 )
+    fig.update_yaxes( autorange='reversed' )
+
+    return fig
+
+# Erro do modelo do tempo de entrega nos pedidos fora do treino
+def eta_quality( eta ):
+    holdout = eta.model.metrics['holdout']
+    quality = { key: np.round( value, 2 ) if value is not None else None for key, value in holdout.items() }
+
+    return quality
+
+# Tempo previsto x real por cidade; com scenario_traffic, todos os pedidos
+# filtrados são previstos com esse tráfego e, no lugar do erro do modelo, vem
+# a diferença do cenário para o tempo real
+def eta_by_city( eta, rows, scenario_traffic='' ):
+    overrides = { 'Road_traffic_density': scenario_traffic } if scenario_traffic else {}
+    df_aux = eta.by_city( rows, **overrides )
+    df_aux.columns = ['City', 'orders', 'avg_time', 'predicted_time', 'mae']
+    if scenario_traffic:
+        df_aux = df_aux.drop( columns='mae' )
+        df_aux['scenario_difference'] = df_aux['predicted_time'] - df_aux['avg_time']
+    df_aux = np.round( df_aux, 2 )
+
+    return df_aux
+
+def eta_city_chart( eta, rows, scenario_traffic='' ):
+    df_aux = eta_by_city( eta, rows, scenario_traffic )
+
+    fig = go.Figure()
+    fig.add_trace( go.Bar( name='Real', x=df_aux['City'], y=df_aux['avg_time'] ) )
+    fig.add_trace( go.Bar( name=f'Previsto ({scenario_traffic})' if scenario_traffic else 'Previsto',
+                           x=df_aux['City'], y=df_aux['predicted_time'] ) )
+    fig.update_layout( barmode='group' )
+
+    return fig
+
+
+# ===============================
+# API de consulta
+# ===============================
+
+# Métricas disponíveis: nome -> função
+METRICS = { func.__name__: func for func in [
+    order_metric, traffic_order_share, traffic_order_city, order_by_week, order_share_by_week, country_maps,
+    courier_overview, mean_deliver, mean_std_ratings, mean_std_ratings_weather, top_delivers,
+    unique_couriers, avg_delivery, avg_std_delivery, waiting_time, waiting_time_city,
+    waiting_time_city_traffic, waiting_time_city_typeorder, restaurant_labels,
+    orders_near_restaurant, nearest_restaurants, delivery_zones, avg_prep_time, prep_time_city,
+    hourly_load_city, peak_hour_heatmap, eta_quality, eta_by_city, eta_city_chart,
+]}
+
+# Métricas exibidas por página com as opções padrão dos controles, para o
+# pré-cálculo em segundo plano (utils.warmup); opções que dependem dos dados
+# são funções do FilterContext
+def first_restaurant( context ):
+    return context.query( 'restaurant_labels' )[0]
+
+PAGE_METRICS = {
+    'visao_empresa': [
+        ( 'order_metric', {} ),
+        ( 'traffic_order_share', {} ),
+        ( 'traffic_order_city', {} ),
+        ( 'order_by_week', {} ),
+        ( 'order_share_by_week', {} ),
+        ( 'country_maps', { 'level': DEFAULT_LEVEL } ),
+    ],
+    'visao_entregadores': [
+        ( 'courier_overview', {} ),
+        ( 'mean_deliver', {} ),
+        ( 'mean_std_ratings', {} ),
+        ( 'mean_std_ratings_weather', {} ),
+        ( 'top_delivers', { 'top_asc': True } ),
+        ( 'top_delivers', { 'top_asc': False } ),
+    ],
+    'visao_restaurantes': [
+        ( 'unique_couriers', {} ),
+        ( 'avg_delivery', {} ),
+        ( 'avg_std_delivery', { 'Festival': 'Yes', 'op': 'avg_time' } ),
+        ( 'avg_std_delivery', { 'Festival': 'Yes', 'op': 'std_time' } ),
+        ( 'avg_std_delivery', { 'Festival': 'No', 'op': 'avg_time' } ),
+        ( 'avg_std_delivery', { 'Festival': 'No', 'op': 'std_time' } ),
+        ( 'waiting_time', {} ),
+        ( 'waiting_time_city', {} ),
+        ( 'waiting_time_city_traffic', {} ),
+        ( 'waiting_time_city_typeorder', {} ),
+        ( 'orders_near_restaurant', { 'restaurant': first_restaurant, 'radius_km': 3 } ),
+        ( 'nearest_restaurants', { 'restaurant': first_restaurant } ),
+        ( 'delivery_zones', {} ),
+        ( 'avg_prep_time', {} ),
+        ( 'prep_time_city', {} ),
+        ( 'hourly_load_city', {} ),
+        ( 'peak_hour_heatmap', {} ),
+        ( 'eta_quality', {} ),
+        ( 'eta_by_city', {} ),
+        ( 'eta_city_chart', {} ),
+    ],
+}
+
+# Parâmetros preenchidos pelo FilterContext
+SOURCES = ( 'cube', 'stats', 'rows', 'locations', 'leaderboard', 'couriers', 'eta' )
+
+# Fontes que precisam do dataframe completo, indisponíveis com CURRY_MAX_MEMORY_MB
+ROW_SOURCES = ( 'rows', 'locations', 'eta' )
+
+
+def parameters( name ):
+    """
+        Opções de uma métrica e seus valores padrão (sem as fontes de dados)
+    """
+    return { p.name: p.default for p in inspect.signature( METRICS[name] ).parameters.values()
+             if p.name not in SOURCES }
+
+def needs_rows( name ):
+    """
+        Se a métrica usa os pedidos linha a linha (índice espacial, modelo de
+        tempo de entrega) em vez do cubo e das tabelas agregadas
+    """
+    return bool( set( inspect.signature( METRICS[name] ).parameters ) & set( ROW_SOURCES ) )
+
+def available( name ):
+    """
+        Se a métrica pode ser calculada: com CURRY_MAX_MEMORY_MB só as que
+        saem do cubo e da tabela de entregadores
+    """
+    return not MAX_MEMORY_MB or not needs_rows( name )
+
+
+def _size( value ):
+    # Linhas de uma fonte ou resultado, para a instrumentação
+    if isinstance( value, ( pd.DataFrame, pd.Series, np.ndarray, list ) ):
+        return len( value )
+    if isinstance( getattr( value, 'cells', None ), pd.DataFrame ):
+        return len( value.cells )
+    if isinstance( value, slice ):
+        return value.stop - value.start
+    return None
+
+
+class FilterContext:
+    """
+        Métricas de um estado dos filtros da barra lateral
+
+        Input: data limite (exclusiva), tráfegos selecionados, caminho do CSV,
+               dicionário coluna -> valores de City, Weatherconditions,
+               Type_of_vehicle e Festival (None ou ausente = todos)
+    """
+
+    def __init__( self, date_limit=DEFAULT_DATE, traffic_options=DEFAULT_TRAFFIC, path=DATA_PATH, filters=None ):
+        self.date_limit = pd.Timestamp( date_limit )
+        self.traffic_options = list( traffic_options )
+        self.path = path
+        self.filters = normalize_filters( filters, load_domains( path ) ) if filters else ()
+        self.state = filter_state( self.date_limit, self.traffic_options, path, self.filters )
+        self._sources = {}
+
+    def source( self, name ):
+        """
+            Fonte de dados do estado, carregada no primeiro uso
+        """
+        if name not in self._sources:
+            with span( f'source:{name}' ) as sp:
+                self._sources[name] = self._load( name )
+                sp['rows'] = _size( self._sources[name] )
+
+        return self._sources[name]
+
+    def _load( self, name ):
+        if name in ROW_SOURCES and MAX_MEMORY_MB:
+            raise MemoryError( f'{name}: indisponível com CURRY_MAX_MEMORY_MB (precisa do dataframe completo)' )
+        if name == 'cube' and self.filters and MAX_MEMORY_MB:
+            # Sem o índice, o CSV é relido em blocos só com as linhas do estado
+            from utils.streaming import stream_cube
+
+            def select( df_chunk ):
+                return filter_mask( df_chunk, self.date_limit, self.traffic_options, dict( self.filters ) )
+
+            return results.get_or_compute( self.state + ( 'source:cube', ),
+                                           lambda: stream_cube( self.path, MAX_MEMORY_MB, select=select ) )
+        if name == 'cube' and self.filters:
+            # Cubo só com as linhas do estado, agregado uma vez por estado
+            return results.get_or_compute( self.state + ( 'source:cube', ), lambda: build_cube(
+                load_filter_index( self.path ).df.iloc[self.source( 'rows' )], load_cube( self.path ).distinct ) )
+        if name == 'cube':
+            return load_cube( self.path ).filter( self.date_limit, self.traffic_options )
+        if name == 'stats' and self.filters:
+            return self.source( 'cube' ).stats.get()
+        if name == 'stats':
+            return load_cube( self.path ).stats.get( self.date_limit, self.traffic_options )
+        if name == 'rows':
+            return load_filter_index( self.path ).rows( self.date_limit, self.traffic_options, dict( self.filters ) )
+        if name == 'locations':
+            return load_locations( self.path )
+        if name == 'leaderboard' and self._all_orders():
+            # Ranking de todos os pedidos, atualizado com as linhas novas do CSV
+            return load_leaderboard( self.path )
+        if name == 'leaderboard':
+            # Um ranking por estado, compartilhado pelas tabelas de mais rápidos e mais lentos
+            return self._call( courier_leaderboard, {} )
+        if name == 'couriers':
+            return load_couriers( self.path )
+        if name == 'eta':
+            return load_eta( self.path )
+        raise KeyError( name )
+
+    def _all_orders( self ):
+        # Estado que inclui todos os pedidos: data limite depois do último
+        # pedido, todos os tráfegos e nenhum outro filtro
+        if MAX_MEMORY_MB:
+            # O ranking de todos os pedidos é montado a partir do dataframe
+            return False
+        domains = load_domains( self.path )
+        return ( not self.filters and self.date_limit > domains['date_max']
+                 and set( domains['Road_traffic_density'] ) <= set( self.traffic_options ) )
+
+    def _call( self, func, params ):
+        assinatura = inspect.signature( func ).parameters
+        desconhecidos = ( set( params ) - set( assinatura ) ) | ( set( params ) & set( SOURCES ) )
+        if desconhecidos:
+            raise TypeError( f'{func.__name__}: parâmetros desconhecidos {sorted( desconhecidos )}' )
+
+        opcoes = []
+        for p in assinatura.values():
+            if p.name in SOURCES:
+                continue
+            value = params.get( p.name, p.default )
+            if value is inspect.Parameter.empty:
+                raise TypeError( f'{func.__name__}: parâmetro {p.name} obrigatório' )
+            opcoes.append( ( p.name, value ) )
+
+        def compute():
+            valores = dict( opcoes )
+            args = [self.source( p ) if p in SOURCES else valores[p] for p in assinatura]
+            return func( *args )
+
+        key = self.state + ( func.__name__, ) + tuple( value for _, value in opcoes )
+        with span( f'metric:{func.__name__}', cache='hit' if key in results else 'miss' ) as sp:
+            value = results.get_or_compute( key, compute )
+            sp['rows'] = _size( value )
+
+        return value
+
+    def query( self, name, **params ):
+        """
+            Esta função tem a responsabilidade de calcular (ou ler do cache)
+            uma métrica neste estado dos filtros
+
+            Input: nome da métrica, opções da métrica
+            Output: resultado da métrica (figura, Dataframe, número...)
+        """
+        if name not in METRICS:
+            raise KeyError( f'métrica desconhecida: {name}' )
+        return self._call( METRICS[name], params )
+
+    def table_view( self, name, search='', sort_by='', descending=False, **params ):
+        """
+            Esta função tem a responsabilidade de buscar e ordenar uma métrica
+            em tabela (utils.table), guardando as posições no cache de resultados
+
+            Input: nome da métrica, texto buscado, coluna de ordenação, ordem
+                   decrescente, opções da métrica
+            Output: array com as posições das linhas exibidas
+        """
+        df_aux = self.query( name, **params )
+        if sort_by and sort_by not in df_aux.columns:
+            raise KeyError( f'{name}: coluna desconhecida {sort_by}' )
+        key = ( self.state + ( name, ) + tuple( sorted( params.items() ) )
+                + ( 'table_view', search, sort_by, bool( descending ) ) )
+        with span( f'table_view:{name}', cache='hit' if key in results else 'miss' ) as sp:
+            positions = results.get_or_compute( key, lambda: table_view( df_aux, search, sort_by, descending ) )
+            sp['rows'] = len( positions )
+
+        return positions
+
+
+def query( name, date_limit=DEFAULT_DATE, traffic_options=DEFAULT_TRAFFIC, path=DATA_PATH, filters=None, **params ):
+    """
+        Uma métrica em um estado dos filtros
+
+        Exemplo: query( 'avg_std_delivery', '2022-04-06', ['Low', 'Jam'], Festival='No', op='std_time',
+                        filters={ 'City': ['Urban'] } )
+    """
+    return FilterContext( date_limit, traffic_options, path, filters ).query( name, **params )
+
+def query_batch( requests, path=DATA_PATH ):
+    """
+        Esta função tem a responsabilidade de responder várias consultas de uma vez
+
+        Consultas com o mesmo estado dos filtros compartilham o mesmo
+        FilterContext, então o cubo filtrado e as estatísticas são montados
+        uma única vez por estado.
+
+        Input: lista de dicionários com metric e, opcionalmente, date,
+               traffic, filters ({ coluna: valores }) e params
+        Output: lista com o resultado de cada consulta, na mesma ordem; uma
+                consulta inválida gera { 'error': mensagem } no lugar dela
+    """
+    contextos = {}
+    respostas = []
+    for request in requests:
+        try:
+            date_limit = pd.Timestamp( request.get( 'date', DEFAULT_DATE ) )
+            traffic_options = request.get( 'traffic', DEFAULT_TRAFFIC )
+            if isinstance( traffic_options, str ):
+                traffic_options = [value for value in traffic_options.split( ',' ) if value]
+            filters = normalize_filters( request.get( 'filters' ) )
+            chave = ( date_limit, tuple( sorted( traffic_options ) ), filters )
+            if chave not in contextos:
+                contextos[chave] = FilterContext( date_limit, traffic_options, path, dict( filters ) )
+            respostas.append( contextos[chave].query( request['metric'], **request.get( 'params', {} ) ) )
+        except ( KeyError, TypeError, ValueError ) as error:
+            respostas.append( { 'error': str( error.args[0] if error.args else error ) } )
+
+    return respostas
+
+def to_json( value ):
+    """
+        Esta função tem a responsabilidade de converter o resultado de uma
+        métrica para tipos do JSON
+
+        Figuras do Plotly viram o dicionário da figura, Dataframes viram listas
+        de registros (datas em ISO 8601) e números do NumPy viram números;
+        NaN vira null.
+    """
+    if hasattr( value, 'to_plotly_json' ):
+        return json.loads( value.to_json() )
+    if isinstance( value, ( pd.DataFrame, pd.Series ) ):
+        return json.loads( value.to_json( orient='records', date_format='iso' ) )
+    if isinstance( value, dict ):
+        return { str( k ): to_json( v ) for k, v in value.items() }
+    if isinstance( value, ( list, tuple ) ):
+        return [to_json( v ) for v in value]
+    if isinstance( value, np.generic ):
+        value = value.item()
+    if isinstance( value, float ) and np.isnan( value ):
+        return None
+    return value
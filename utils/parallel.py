@@ -0,0 +1,162 @@
+# ================================
+# Agregação em paralelo
+# ================================
+#
+# A construção do cubo (groupbys, sketches, grade geográfica e somas por
+# entregador) é dividida em partições de Order_Date e distribuída entre
+# processos. Como o dataframe em cache já está ordenado por data, cada
+# partição é um intervalo contínuo de linhas.
+#
+# As colunas usadas pelo cubo são copiadas uma única vez para blocos de
+# memória compartilhada; os processos recebem apenas os nomes dos blocos e o
+# intervalo de linhas, e montam o dataframe da partição sobre esses blocos,
+# sem copiar nem serializar os pedidos. Os cubos parciais voltam ao processo
+# do Streamlit e são unidos por merge_cubes.
+#
+# O número de processos vem de CURRY_WORKERS (0 ou 1 desativa). Abaixo de
+# PARALLEL_MIN_ROWS pedidos o custo de distribuir o trabalho não compensa e
+# o cubo é construído no próprio processo.
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import SOURCE_COLUMNS, build_cube, merge_cubes
+
+WORKERS = int( os.environ.get( 'CURRY_WORKERS' ) or 0 )
+PARALLEL_MIN_ROWS = 200_000
+
+# Partições por processo: mais partições equilibram dias com volumes diferentes
+PARTITIONS_PER_WORKER = 2
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def get_executor( workers ):
+    """
+        Pool de processos reaproveitado entre as construções
+
+        Usa 'spawn' porque o processo do Streamlit tem várias threads.
+    """
+    global _executor, _executor_workers
+
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown( wait=False )
+            _executor = ProcessPoolExecutor( max_workers=workers, mp_context=get_context( 'spawn' ) )
+            _executor_workers = workers
+        return _executor
+
+def _to_shared( arr, blocks ):
+    arr = np.ascontiguousarray( arr )
+    shm = shared_memory.SharedMemory( create=True, size=max( arr.nbytes, 1 ) )
+    np.ndarray( arr.shape, dtype=arr.dtype, buffer=shm.buf )[:] = arr
+    blocks.append( shm )
+    return ( shm.name, arr.dtype.str, arr.shape )
+
+def share_columns( df1, columns ):
+    """
+        Esta função tem a responsabilidade de copiar as colunas para blocos
+        de memória compartilhada
+
+        Colunas numéricas e de data vão direto; categóricas e de texto vão
+        como códigos inteiros, com os valores distintos junto da descrição.
+
+        Input: Dataframe, colunas
+        Output: (blocos SharedMemory, descrição das colunas para os processos)
+    """
+    blocks = []
+    specs = {}
+    for col in columns:
+        serie = df1[col]
+        if isinstance( serie.dtype, pd.CategoricalDtype ):
+            specs[col] = ( 'category', _to_shared( serie.cat.codes.to_numpy(), blocks ),
+                           serie.cat.categories.tolist() )
+        elif serie.dtype.kind in 'biufmM':
+            specs[col] = ( 'array', _to_shared( serie.to_numpy(), blocks ), None )
+        else:
+            codes, uniques = pd.factorize( serie )
+            specs[col] = ( 'factor', _to_shared( codes.astype( np.int32 ), blocks ),
+                           ( uniques.tolist(), serie.dtype ) )
+
+    return blocks, specs
+
+def _partition_frame( specs, start, stop, handles ):
+    """
+        Dataframe da partição sobre os blocos de memória compartilhada
+    """
+    colunas = {}
+    for col, ( kind, ( name, dtype, shape ), extra ) in specs.items():
+        # O bloco pertence ao processo do Streamlit, que o libera ao final
+        shm = shared_memory.SharedMemory( name=name )
+        handles.append( shm )
+        arr = np.ndarray( shape, dtype=np.dtype( dtype ), buffer=shm.buf )[start:stop]
+
+        if kind == 'category':
+            colunas[col] = pd.Categorical.from_codes( arr, categories=extra )
+        elif kind == 'factor':
+            uniques, col_dtype = extra
+            valores = np.asarray( uniques + [None], dtype=object )
+            colunas[col] = pd.array( valores[arr], dtype=col_dtype )
+        else:
+            colunas[col] = arr
+
+    return pd.DataFrame( colunas )
+
+def _build_partition( specs, start, stop, distinct ):
+    handles = []
+    try:
+        return build_cube( _partition_frame( specs, start, stop, handles ), distinct )
+    finally:
+        for shm in handles:
+            shm.close()
+
+def date_partitions( dates, n_parts ):
+    """
+        Intervalos de linhas com aproximadamente o mesmo número de pedidos,
+        cortados apenas entre datas diferentes
+
+        Input: array de datas ordenado, quantidade de partições
+        Output: lista de (início, fim)
+    """
+    alvos = np.linspace( 0, len( dates ), n_parts + 1 )[1:-1].astype( np.int64 )
+    cortes = np.unique( np.searchsorted( dates, dates[alvos], side='left' ) ) if len( alvos ) else []
+    limites = [0] + [int( c ) for c in cortes if 0 < c < len( dates )] + [len( dates )]
+
+    return list( zip( limites[:-1], limites[1:] ) )
+
+def parallel_build_cube( df1, workers=WORKERS, distinct='exact' ):
+    """
+        Esta função tem a responsabilidade de construir o cubo em paralelo
+
+        O resultado é o mesmo de build_cube( df1 ): contagens iguais, médias e
+        desvios iguais a menos do arredondamento da combinação.
+
+        Input: Dataframe limpo, número de processos, contagem de distintos
+        Output: OrderCube
+    """
+    if workers <= 1 or len( df1 ) < PARALLEL_MIN_ROWS:
+        return build_cube( df1, distinct )
+
+    if not df1['Order_Date'].is_monotonic_increasing:
+        df1 = df1.sort_values( 'Order_Date', kind='stable', ignore_index=True )
+
+    partes = date_partitions( df1['Order_Date'].to_numpy(), workers * PARTITIONS_PER_WORKER )
+    blocks, specs = share_columns( df1, SOURCE_COLUMNS )
+    try:
+        executor = get_executor( workers )
+        futures = [executor.submit( _build_partition, specs, start, stop, distinct ) for start, stop in partes]
+        cubes = [future.result() for future in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return merge_cubes( cubes )
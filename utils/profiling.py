@@ -0,0 +1,283 @@
+# ================================
+# Instrumentação das execuções
+# ================================
+#
+# span( nome ) mede um trecho do código: tempo, variação do RSS do processo e,
+# quando informado, a quantidade de linhas. Os trechos ficam aninhados dentro
+# do trace da execução atual da página (um por rerun do Streamlit), e só são
+# registrados quando há um trace ativo na thread; fora dele (pré-cálculo em
+# segundo plano, API) o custo é uma consulta a uma ContextVar.
+#
+# Com o modo debug ligado na barra lateral (page_trace no início da página e
+# debug_panel no final), cada rerun mostra a divisão do tempo por trecho, pode
+# capturar um perfil com cProfile ou pyinstrument (se instalado) e exportar os
+# trechos para um arquivo JSON Lines em CURRY_PROFILE_DIR (padrão: profiles/).
+# CURRY_DEBUG=1 liga o modo debug por padrão em todas as sessões.
+
+import contextlib
+import contextvars
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pragma: no cover - pyinstrument é opcional
+    Profiler = None
+
+PROFILE_DIR = os.environ.get( 'CURRY_PROFILE_DIR', 'profiles' )
+DEBUG_DEFAULT = os.environ.get( 'CURRY_DEBUG', '0' ) not in ( '0', 'false', 'no' )
+
+# Traces terminados mantidos para exportação
+HISTORY_SIZE = 200
+
+PROFILERS = ['Nenhum', 'cProfile'] + ( ['pyinstrument'] if Profiler is not None else [] )
+
+_current = contextvars.ContextVar( 'curry_trace', default=None )
+_history = deque( maxlen=HISTORY_SIZE )
+_history_lock = threading.Lock()
+_ids = itertools.count( 1 )
+
+_PAGE_SIZE = os.sysconf( 'SC_PAGE_SIZE' ) if hasattr( os, 'sysconf' ) else 4096
+
+
+def rss_mb():
+    """
+        Memória residente atual do processo em MB (None fora do Linux)
+    """
+    try:
+        with open( '/proc/self/statm' ) as f:
+            return int( f.read().split()[1] ) * _PAGE_SIZE / 2**20
+    except OSError:
+        return None
+
+
+class Trace:
+    """
+        Trechos medidos em uma execução de uma página
+
+        Input: nome da página
+    """
+
+    def __init__( self, page ):
+        self.id = next( _ids )
+        self.page = page
+        self.started = time.time()
+        self.spans = []
+        self.seconds = None
+        self.profile = None       # texto do perfil capturado, se houver
+        self.profile_path = None
+        self._capture = None
+        self._start = time.perf_counter()
+        self.thread_name = threading.current_thread().name
+        self._depth = {}          # thread -> profundidade atual
+
+    def finish( self ):
+        self.seconds = time.perf_counter() - self._start
+
+    def records( self ):
+        """
+            Trechos como dicionários, na ordem em que começaram
+        """
+        return [dict( record, trace=self.id, page=self.page ) for record in self.spans]
+
+
+@contextlib.contextmanager
+def span( name, **attrs ):
+    """
+        Esta função tem a responsabilidade de medir um trecho do código
+
+        Uso:
+            with span( 'clean_code', rows=len( df ) ) as sp:
+                df1 = clean_code( df )
+                sp['rows'] = len( df1 )
+
+        Input: nome do trecho, atributos (rows e outros)
+        Output: dicionário do trecho, que pode receber atributos durante a medição
+    """
+    trace = _current.get()
+    if trace is None:
+        yield dict( attrs )
+        return
+
+    # Fragmentos paralelos do Streamlit herdam o trace em outra thread; cada
+    # thread tem a sua profundidade
+    thread = threading.get_ident()
+    depth = trace._depth.get( thread, 0 )
+    record = { 'name': name, 'depth': depth, 'start': time.perf_counter() - trace._start,
+               'thread': threading.current_thread().name, **attrs }
+    trace.spans.append( record )
+    rss = rss_mb()
+    inicio = time.perf_counter()
+    trace._depth[thread] = depth + 1
+    try:
+        yield record
+    finally:
+        trace._depth[thread] = depth
+        record['seconds'] = time.perf_counter() - inicio
+        depois = rss_mb()
+        record['rss_delta_mb'] = depois - rss if rss is not None and depois is not None else None
+
+def start_trace( page ):
+    """
+        Abre o trace de uma execução da página na thread atual
+    """
+    trace = Trace( page )
+    _current.set( trace )
+    return trace
+
+def finish_trace( trace ):
+    """
+        Fecha o trace e o guarda no histórico para exportação
+    """
+    trace.finish()
+    if _current.get() is trace:
+        _current.set( None )
+    with _history_lock:
+        _history.append( trace )
+    return trace
+
+def history():
+    with _history_lock:
+        return list( _history )
+
+def export( path=None, traces=None ):
+    """
+        Esta função tem a responsabilidade de gravar os trechos medidos
+
+        Cada linha do arquivo é um trecho em JSON, com o trace, a página, o
+        nome, a profundidade, o início e a duração em segundos, a variação do
+        RSS e os atributos.
+
+        Input: caminho do arquivo (padrão: CURRY_PROFILE_DIR/spans-<data>.jsonl),
+               traces (padrão: o histórico)
+        Output: caminho do arquivo gravado
+    """
+    path = path or os.path.join( PROFILE_DIR, f'spans-{time.strftime( "%Y%m%d-%H%M%S" )}.jsonl' )
+    os.makedirs( os.path.dirname( os.path.abspath( path ) ), exist_ok=True )
+    with open( path, 'a' ) as f:
+        for trace in ( history() if traces is None else traces ):
+            linha = { 'trace': trace.id, 'page': trace.page, 'name': '<rerun>', 'depth': -1, 'start': 0.0,
+                      'seconds': trace.seconds, 'started_at': trace.started }
+            f.write( json.dumps( linha ) + '\n' )
+            for record in trace.records():
+                f.write( json.dumps( record, default=str ) + '\n' )
+
+    return path
+
+@contextlib.contextmanager
+def capture( trace, profiler ):
+    """
+        Captura um perfil da execução com cProfile ou pyinstrument; o texto
+        fica em trace.profile e o arquivo em CURRY_PROFILE_DIR
+    """
+    if profiler not in PROFILERS[1:]:
+        yield
+        return
+
+    os.makedirs( PROFILE_DIR, exist_ok=True )
+    base = os.path.join( PROFILE_DIR, f'{trace.page}-{time.strftime( "%Y%m%d-%H%M%S" )}-{trace.id}' )
+    if profiler == 'cProfile':
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            trace.profile_path = base + '.prof'
+            perfil.dump_stats( trace.profile_path )
+            texto = io.StringIO()
+            pstats.Stats( perfil, stream=texto ).sort_stats( 'cumulative' ).print_stats( 30 )
+            trace.profile = texto.getvalue()
+    else:
+        perfil = Profiler()
+        perfil.start()
+        try:
+            yield
+        finally:
+            perfil.stop()
+            trace.profile_path = base + '.html'
+            with open( trace.profile_path, 'w' ) as f:
+                f.write( perfil.output_html() )
+            trace.profile = perfil.output_text()
+
+
+# ===============================
+# Painel de debug das páginas
+# ===============================
+def page_trace( page ):
+    """
+        Abre o trace da execução da página se o modo debug da sessão estiver
+        ligado, já com o perfil pedido no painel
+
+        Input: nome da página
+        Output: Trace, ou None com o modo debug desligado
+    """
+    import streamlit as st
+
+    # Execução anterior interrompida por uma exceção antes do painel
+    anterior = _current.get()
+    if anterior is not None:
+        _close( anterior )
+
+    if not st.session_state.get( 'curry_debug', DEBUG_DEFAULT ):
+        return None
+
+    trace = start_trace( page )
+    trace._capture = capture( trace, st.session_state.get( 'curry_profiler', PROFILERS[0] ) )
+    trace._capture.__enter__()
+    return trace
+
+def _close( trace ):
+    if trace.seconds is None:
+        trace._capture.__exit__( None, None, None )
+        finish_trace( trace )
+
+def debug_panel( trace ):
+    """
+        Esta função tem a responsabilidade de mostrar o modo debug na barra
+        lateral: o interruptor e, com ele ligado, a divisão do tempo da última
+        execução, o perfil capturado e a exportação dos trechos
+
+        Input: Trace de page_trace (None com o modo debug desligado)
+    """
+    import pandas as pd
+    import streamlit as st
+
+    if trace is not None:
+        _close( trace )
+
+    st.sidebar.toggle( 'Modo debug', value=DEBUG_DEFAULT, key='curry_debug' )
+    if not st.session_state.get( 'curry_debug' ):
+        return
+
+    with st.sidebar.expander( 'Tempo desta execução', expanded=True ):
+        if trace is None:
+            st.caption( 'Os trechos aparecem a partir da próxima execução.' )
+        else:
+            # O que não está em nenhum trecho da thread da página: widgets,
+            # gráficos e envio ao navegador. Trechos de fragmentos paralelos
+            # ainda em andamento aparecem sem tempo.
+            medido = sum( record.get( 'seconds', 0 ) for record in trace.spans
+                          if record['depth'] == 0 and record['thread'] == trace.thread_name )
+            col1, col2 = st.columns( 2 )
+            col1.metric( 'Total', f'{trace.seconds:.3f} s' )
+            col2.metric( 'Fora dos trechos', f'{trace.seconds - medido:.3f} s' )
+            df_aux = pd.DataFrame( list( trace.spans ),
+                                   columns=['name', 'depth', 'seconds', 'rows', 'rss_delta_mb', 'cache', 'thread'] )
+            df_aux['name'] = [' ' * 2 * depth + name for name, depth in zip( df_aux['name'], df_aux['depth'] )]
+            st.dataframe( df_aux.drop( columns='depth' ).round( 4 ), hide_index=True )
+
+        st.selectbox( 'Perfil da próxima execução', PROFILERS, key='curry_profiler' )
+        if trace is not None and trace.profile:
+            st.caption( f'Perfil gravado em {trace.profile_path}' )
+            st.code( trace.profile, language=None )
+
+        if st.button( 'Exportar trechos' ):
+            st.caption( f'Trechos gravados em {export()}' )
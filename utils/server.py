@@ -0,0 +1,244 @@
+# ================================
+# Servidor HTTP das métricas
+# ================================
+#
+# Serve as métricas de utils.metrics como JSON, sem o Streamlit, usando apenas
+# a biblioteca padrão (asyncio):
+#
+#   GET  /metrics                    nomes das métricas e suas opções
+#   GET  /metrics/<nome>?date=2022-04-06&traffic=Low,Jam&city=Urban&<opção>=<valor>
+#        (filtros: traffic, city, weather, vehicle e festival, separados por vírgula)
+#        tabelas aceitam também page, page_size, search, sort_by e descending
+#        e devolvem só a página pedida
+#   POST /batch                      lista JSON de { metric, date, traffic, filters, params }
+#
+# O cálculo roda em threads (run_in_executor) e usa os mesmos caches do
+# dashboard: dados limpos, cubo, índices e o cache de resultados por estado
+# dos filtros. Pedidos idênticos que chegam enquanto o primeiro ainda está
+# sendo calculado esperam pelo mesmo resultado em vez de recalculá-lo.
+#
+# Uso: python -m utils.server [--host 127.0.0.1] [--port 8000]
+
+import argparse
+import asyncio
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+from utils.data import DATA_PATH
+from utils.metrics import (DEFAULT_DATE, DEFAULT_TRAFFIC, METRICS, FilterContext, parameters, query,
+                           query_batch, to_json)
+from utils.table import PAGE_SIZE, page_count, page_slice
+
+MAX_BODY_BYTES = 1 << 20
+
+# Filtros da query string -> colunas de utils.filters
+FILTER_PARAMS = { 'city': 'City', 'weather': 'Weatherconditions', 'vehicle': 'Type_of_vehicle',
+                  'festival': 'Festival' }
+
+# Opções de paginação das tabelas e seus valores padrão
+TABLE_OPTIONS = { 'page': 1, 'page_size': PAGE_SIZE, 'search': '', 'sort_by': '', 'descending': False }
+
+STATUS = { 200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error' }
+
+
+class HTTPError( Exception ):
+    def __init__( self, status, message ):
+        super().__init__( message )
+        self.status = status
+
+
+def cast_param( value, default ):
+    """
+        Converte uma opção da query string para o tipo do valor padrão
+    """
+    if isinstance( default, bool ):
+        if value.lower() in ( '1', 'true', 'yes' ):
+            return True
+        if value.lower() in ( '0', 'false', 'no' ):
+            return False
+        raise ValueError( f'valor booleano inválido: {value}' )
+    if isinstance( default, int ):
+        return int( value )
+    if isinstance( default, float ):
+        return float( value )
+    return value
+
+def metric_request( name, query_string ):
+    """
+        Esta função tem a responsabilidade de montar a consulta de uma métrica
+        a partir da query string
+
+        Input: nome da métrica, query string
+        Output: dicionário no formato de query_batch
+    """
+    if name not in METRICS:
+        raise HTTPError( 404, f'métrica desconhecida: {name}' )
+
+    opcoes = parameters( name )
+    request = { 'metric': name, 'params': {} }
+    for key, value in parse_qsl( query_string, keep_blank_values=True ):
+        if key == 'date':
+            request['date'] = value
+        elif key == 'traffic':
+            request['traffic'] = [v for v in value.split( ',' ) if v]
+        elif key in FILTER_PARAMS and key not in opcoes:
+            request.setdefault( 'filters', {} )[FILTER_PARAMS[key]] = [v for v in value.split( ',' ) if v]
+        elif key in opcoes:
+            request['params'][key] = cast_param( value, opcoes[key] )
+        elif key in TABLE_OPTIONS:
+            request.setdefault( 'table', dict( TABLE_OPTIONS ) )[key] = cast_param( value, TABLE_OPTIONS[key] )
+        else:
+            raise HTTPError( 400, f'{name}: parâmetro desconhecido {key}' )
+
+    return request
+
+
+class MetricsServer:
+    """
+        Servidor HTTP/1.1 mínimo das métricas
+
+        Input: caminho do CSV
+    """
+
+    def __init__( self, path=DATA_PATH ):
+        self.path = path
+        self._inflight = {}       # consulta -> future do cálculo em andamento
+
+    async def _compute( self, key, func, *args ):
+        """
+            Executa func em uma thread; consultas iguais em andamento
+            compartilham o mesmo cálculo
+        """
+        if key not in self._inflight:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor( None, func, *args )
+            self._inflight[key] = future
+            future.add_done_callback( lambda _: self._inflight.pop( key, None ) )
+
+        return await asyncio.shield( self._inflight[key] )
+
+    def _single( self, request ):
+        if 'table' in request:
+            return self._table( request )
+        resposta = query( request['metric'], request.get( 'date', DEFAULT_DATE ),
+                          request.get( 'traffic', DEFAULT_TRAFFIC ), self.path, request.get( 'filters' ),
+                          **request['params'] )
+        return to_json( resposta )
+
+    def _table( self, request ):
+        # Uma página da tabela, com a busca e a ordenação feitas aqui
+        context = FilterContext( request.get( 'date', DEFAULT_DATE ), request.get( 'traffic', DEFAULT_TRAFFIC ),
+                                 self.path, request.get( 'filters' ) )
+        opcoes = dict( request['table'] )
+        page, page_size = opcoes.pop( 'page' ), max( 1, opcoes.pop( 'page_size' ) )
+        df_aux = context.query( request['metric'], **request['params'] )
+        if not hasattr( df_aux, 'iloc' ):
+            raise ValueError( f"{request['metric']}: a métrica não é uma tabela" )
+        positions = context.table_view( request['metric'], **opcoes, **request['params'] )
+        return { 'total': len( positions ), 'page': min( max( page, 1 ), page_count( len( positions ), page_size ) ),
+                 'pages': page_count( len( positions ), page_size ),
+                 'rows': to_json( page_slice( df_aux, positions, page, page_size ) ) }
+
+    def _batch( self, requests ):
+        return to_json( query_batch( requests, self.path ) )
+
+    async def route( self, method, target, body ):
+        """
+            Esta função tem a responsabilidade de responder uma requisição
+
+            Input: método, alvo (caminho e query string), corpo
+            Output: objeto JSON da resposta
+        """
+        url = urlsplit( target )
+        partes = [p for p in url.path.split( '/' ) if p]
+
+        if partes == ['metrics']:
+            if method != 'GET':
+                raise HTTPError( 405, 'use GET' )
+            return { name: parameters( name ) for name in METRICS }
+
+        if len( partes ) == 2 and partes[0] == 'metrics':
+            if method != 'GET':
+                raise HTTPError( 405, 'use GET' )
+            try:
+                request = metric_request( partes[1], url.query )
+            except ValueError as error:
+                raise HTTPError( 400, str( error ) )
+            key = json.dumps( request, sort_keys=True )
+            try:
+                return await self._compute( key, self._single, request )
+            except ( KeyError, TypeError, ValueError ) as error:
+                raise HTTPError( 400, str( error.args[0] if error.args else error ) )
+
+        if partes == ['batch']:
+            if method != 'POST':
+                raise HTTPError( 405, 'use POST' )
+            try:
+                requests = json.loads( body or b'[]' )
+            except ValueError:
+                raise HTTPError( 400, 'corpo não é JSON' )
+            if not isinstance( requests, list ) or not all( isinstance( r, dict ) for r in requests ):
+                raise HTTPError( 400, 'o corpo deve ser uma lista de consultas' )
+            key = json.dumps( requests, sort_keys=True )
+            return await self._compute( key, self._batch, requests )
+
+        raise HTTPError( 404, f'caminho desconhecido: {url.path}' )
+
+    async def handle( self, reader, writer ):
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha.strip():
+                    break
+                method, target, version = linha.decode( 'latin-1' ).split()
+
+                headers = {}
+                while True:
+                    linha = await reader.readline()
+                    if linha in ( b'\r\n', b'\n', b'' ):
+                        break
+                    nome, _, valor = linha.decode( 'latin-1' ).partition( ':' )
+                    headers[nome.strip().lower()] = valor.strip()
+
+                try:
+                    tamanho = int( headers.get( 'content-length', 0 ) )
+                    if tamanho > MAX_BODY_BYTES:
+                        raise HTTPError( 413, 'corpo grande demais' )
+                    body = await reader.readexactly( tamanho ) if tamanho else b''
+                    status, resposta = 200, await self.route( method, target, body )
+                except HTTPError as error:
+                    status, resposta = error.status, { 'error': str( error ) }
+                except Exception as error:
+                    status, resposta = 500, { 'error': repr( error ) }
+
+                conteudo = json.dumps( resposta, ensure_ascii=False ).encode( 'utf-8' )
+                fechar = headers.get( 'connection', '' ).lower() == 'close' or version == 'HTTP/1.0'
+                writer.write( ( f'HTTP/1.1 {status} {STATUS[status]}\r\n'
+                                'Content-Type: application/json; charset=utf-8\r\n'
+                                f'Content-Length: {len( conteudo )}\r\n'
+                                f"Connection: {'close' if fechar else 'keep-alive'}\r\n\r\n" ).encode( 'latin-1' )
+                              + conteudo )
+                await writer.drain()
+                if fechar or status == 413:
+                    break
+        except ( ConnectionError, ValueError, asyncio.IncompleteReadError ):
+            pass
+        finally:
+            writer.close()
+
+    async def serve( self, host='127.0.0.1', port=8000 ):
+        server = await asyncio.start_server( self.handle, host, port )
+        print( f'Servindo as métricas em http://{host}:{port}/metrics' )
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description='Serve as métricas do dashboard como JSON' )
+    parser.add_argument( '--host', default='127.0.0.1' )
+    parser.add_argument( '--port', type=int, default=8000 )
+    parser.add_argument( '--data', default=DATA_PATH, help='caminho do train.csv' )
+    args = parser.parse_args()
+
+    asyncio.run( MetricsServer( args.data ).serve( args.host, args.port ) )
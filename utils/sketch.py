@@ -0,0 +1,81 @@
+# ================================
+# HyperLogLog
+# ================================
+#
+# Contagem aproximada de valores distintos com memória fixa. Dois sketches
+# são unidos pelo máximo registro a registro, então contagens semanais ou
+# filtradas saem da união dos sketches diários sem voltar aos pedidos.
+#
+# Com precisão p são usados 2**p registros de 1 byte e o erro padrão é de
+# aproximadamente 1.04 / sqrt(2**p).
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 10
+
+
+def hash_values( values ):
+    """
+        Hash de 64 bits estável entre processos (mesma chave do pandas)
+        
+        Input: valores (array, Series ou lista)
+        Output: array uint64
+    """
+    return pd.util.hash_array( np.asarray( values, dtype=object ) )
+
+def _bit_length( w ):
+    n = np.zeros( w.shape, dtype=np.uint8 )
+    for shift in ( 32, 16, 8, 4, 2, 1 ):
+        maior = w >= ( np.uint64( 1 ) << np.uint64( shift ) )
+        n += np.where( maior, shift, 0 ).astype( np.uint8 )
+        w = np.where( maior, w >> np.uint64( shift ), w )
+    return n + ( w > 0 ).astype( np.uint8 )
+
+def registers_from_hashes( hashes, p=DEFAULT_PRECISION ):
+    """
+        Registro e posição do primeiro bit 1 de cada hash
+        
+        Input: array uint64 de hashes, precisão
+        Output: (índice do registro, valor do registro) para cada hash
+    """
+    hashes = np.asarray( hashes, dtype=np.uint64 )
+    bits = 64 - p
+    idx = ( hashes >> np.uint64( bits ) ).astype( np.int64 )
+    resto = hashes & np.uint64( ( 1 << bits ) - 1 )
+    rho = ( bits + 1 - _bit_length( resto ) ).astype( np.uint8 )
+    return idx, rho
+
+def group_registers( hashes, groups, n_groups, p=DEFAULT_PRECISION ):
+    """
+        Monta um sketch por grupo de uma só vez
+        
+        Input: hashes, código do grupo de cada hash, quantidade de grupos, precisão
+        Output: matriz uint8 (n_groups x 2**p)
+    """
+    registers = np.zeros( ( n_groups, 1 << p ), dtype=np.uint8 )
+    idx, rho = registers_from_hashes( hashes, p )
+    np.maximum.at( registers, ( np.asarray( groups ), idx ), rho )
+    return registers
+
+def estimate( registers ):
+    """
+        Estimativa de distintos para um sketch ou uma matriz de sketches
+        
+        Input: array uint8 (2**p) ou matriz (n x 2**p)
+        Output: estimativa (float para um sketch, array para uma matriz)
+    """
+    if registers.ndim == 1:
+        return float( estimate( registers[np.newaxis] )[0] )
+
+    m = registers.shape[1]
+    alpha = 0.7213 / ( 1 + 1.079 / m )
+
+    raw = alpha * m * m / np.sum( np.exp2( -registers.astype( np.float64 ) ), axis=1 )
+
+    # Correção para cardinalidades pequenas (linear counting)
+    zeros = np.count_nonzero( registers == 0, axis=1 )
+    linear = m * np.log( m / np.maximum( zeros, 1 ) )
+    result = np.where( ( raw <= 2.5 * m ) & ( zeros > 0 ), linear, raw )
+
+    return result
@@ -0,0 +1,190 @@
+# ================================
+# Snapshot colunar dos dados limpos
+# ================================
+#
+# O resultado do clean_code é gravado em arquivos Parquet, um por Order_Date,
+# dentro de dataset/snapshot/train. As páginas leem esses arquivos em vez de
+# interpretar o texto do CSV a cada início de processo.
+#
+# A construção é incremental: o manifesto guarda até qual byte do CSV já foi
+# processado. Quando novas linhas são acrescentadas ao final do arquivo, só
+# elas são lidas e limpas, e apenas as partições das datas que receberam
+# pedidos novos são regravadas. Se o início do arquivo ou o trecho logo antes
+# da marca d'água mudarem, o snapshot é reconstruído do zero; edições no meio
+# de um arquivo grande exigem build_snapshot( rebuild=True ).
+
+import io
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+    pq = None
+
+from utils.data import DATA_PATH, SCHEMA, clean_code, read_data
+from utils.ingest import check_digest, is_append, last_newline
+
+SNAPSHOT_DIR = 'dataset/snapshot/train'
+MANIFEST_FILE = 'manifest.json'
+
+# Deve ser incrementado sempre que o clean_code mudar o formato de saída,
+# para forçar a reconstrução dos snapshots existentes
+SNAPSHOT_VERSION = 5
+
+
+def available():
+    """
+        Indica se o pyarrow está instalado para gravar e ler os snapshots
+    """
+    return pq is not None
+
+def snapshot_dir_for( csv_path ):
+    """
+        Diretório do snapshot de um CSV: dataset/train.csv -> dataset/snapshot/train
+    """
+    nome = os.path.splitext( os.path.basename( csv_path ) )[0]
+    return os.path.join( os.path.dirname( csv_path ), 'snapshot', nome )
+
+def partition_path( snapshot_dir, date ):
+    return os.path.join( snapshot_dir, f'{date:%Y-%m-%d}.parquet' )
+
+def read_manifest( snapshot_dir=SNAPSHOT_DIR ):
+    """
+        Lê o manifesto do snapshot
+        
+        Input: diretório do snapshot
+        Output: dicionário ou None se o snapshot não existir
+    """
+    try:
+        with open( os.path.join( snapshot_dir, MANIFEST_FILE ) ) as f:
+            return json.load( f )
+    except ( FileNotFoundError, json.JSONDecodeError ):
+        return None
+
+def write_manifest( snapshot_dir, manifest ):
+    path = os.path.join( snapshot_dir, MANIFEST_FILE )
+    with open( path + '.tmp', 'w' ) as f:
+        json.dump( manifest, f, indent=2, sort_keys=True )
+    os.replace( path + '.tmp', path )
+
+def _is_append( manifest, f, header, size ):
+    """
+        Verifica se o CSV só recebeu linhas novas desde a última construção
+    """
+    return ( manifest.get( 'version' ) == SNAPSHOT_VERSION
+             and is_append( manifest, f, header, size ) )
+
+def _write_partition( path, df_new ):
+    """
+        Acrescenta as linhas novas à partição de uma data e regrava o arquivo
+    """
+    table = pa.Table.from_pandas( df_new, preserve_index=False )
+    if os.path.exists( path ):
+        old = pq.read_table( path )
+        table = pa.concat_tables( [old, table.cast( old.schema )] ).unify_dictionaries()
+
+    pq.write_table( table, path + '.tmp' )
+    os.replace( path + '.tmp', path )
+
+    return table.num_rows
+
+def build_snapshot( csv_path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, rebuild=False ):
+    """
+        Esta função tem a responsabilidade de manter o snapshot em Parquet
+        atualizado com o CSV
+        
+        1. Snapshot inexistente, de outra versão ou CSV editado: reconstrução completa
+        2. Linhas novas no final do CSV: limpeza apenas delas e regravação
+           apenas das partições das datas afetadas
+        3. Nada novo: nenhum arquivo é tocado
+        
+        Input: caminho do CSV, diretório do snapshot, reconstrução forçada
+        Output: manifesto atualizado
+    """
+    if not available():
+        raise ImportError( 'pyarrow é necessário para gerar o snapshot' )
+
+    os.makedirs( snapshot_dir, exist_ok=True )
+    manifest = read_manifest( snapshot_dir )
+
+    with open( csv_path, 'rb' ) as f:
+        header = f.readline()
+        size = os.fstat( f.fileno() ).st_size
+
+        rebuild = rebuild or manifest is None or not _is_append( manifest, f, header, size )
+        if rebuild:
+            # Reconstrução completa
+            for name in os.listdir( snapshot_dir ):
+                if name.endswith( '.parquet' ):
+                    os.remove( os.path.join( snapshot_dir, name ) )
+            manifest = {
+                'version': SNAPSHOT_VERSION,
+                'source': os.path.abspath( csv_path ),
+                'header': header.decode(),
+                'offset': len( header ),
+                'check': check_digest( f, len( header ) ),
+                'partitions': {},
+            }
+
+        start = manifest['offset']
+        end = max( last_newline( f, size ), start )
+        f.seek( start )
+        novas = f.read( end - start )
+        check = check_digest( f, end )
+
+    if novas.strip():
+        df_new = clean_code( read_data( io.BytesIO( header + novas ) ) )
+
+        for date, df_date in df_new.groupby( 'Order_Date', sort=True ):
+            rows = _write_partition( partition_path( snapshot_dir, date ), df_date )
+            manifest['partitions'][f'{date:%Y-%m-%d}'] = rows
+
+    if rebuild or end != start:
+        manifest['offset'] = end
+        manifest['check'] = check
+        write_manifest( snapshot_dir, manifest )
+
+    return manifest
+
+def load_snapshot( snapshot_dir=SNAPSHOT_DIR ):
+    """
+        Lê todas as partições do snapshot em ordem de data
+
+        As partições regravadas com linhas novas guardam as categorias na
+        ordem em que apareceram; elas voltam à ordem alfabética, a mesma da
+        leitura do CSV, para que os códigos das categorias (entregadores no
+        cubo, por exemplo) não mudem entre um snapshot incremental e um
+        reconstruído.
+        
+        Input: diretório do snapshot
+        Output: Dataframe limpo
+    """
+    manifest = read_manifest( snapshot_dir )
+    tables = [pq.read_table( partition_path( snapshot_dir, pd.Timestamp( date ) ) )
+              for date in sorted( manifest['partitions'] )]
+
+    if not tables:
+        return clean_code( read_data( io.StringIO( manifest['header'] ) ) )
+
+    df1 = pa.concat_tables( tables ).unify_dictionaries().to_pandas()
+    for col in SCHEMA:
+        if col in df1 and isinstance( df1[col].dtype, pd.CategoricalDtype ):
+            df1[col] = df1[col].cat.reorder_categories( sorted( df1[col].cat.categories ) )
+
+    return df1
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser( description='Atualiza o snapshot em Parquet do CSV de pedidos' )
+    parser.add_argument( 'csv', nargs='?', default=DATA_PATH )
+    parser.add_argument( '--rebuild', action='store_true', help='reconstrói todas as partições' )
+    args = parser.parse_args()
+
+    manifest = build_snapshot( args.csv, snapshot_dir_for( args.csv ), rebuild=args.rebuild )
+    print( f"{len( manifest['partitions'] )} partições, {sum( manifest['partitions'].values() )} pedidos" )
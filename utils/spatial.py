@@ -0,0 +1,203 @@
+# ================================
+# Índice espacial das coordenadas
+# ================================
+#
+# Os pontos são ordenados pela célula da grade geográfica (utils.grid). Como
+# o número da célula é linha * 2^nível + coluna, as células de uma mesma
+# linha da grade dentro de um retângulo formam um intervalo contínuo: uma
+# busca por raio faz uma busca binária por linha da grade que cruza o
+# retângulo envolvente do círculo e calcula a distância haversine apenas
+# para os pontos dessas células.
+#
+# OrderLocations junta um índice dos locais de entrega (um ponto por pedido)
+# e um dos restaurantes (um ponto por coordenada distinta) para o painel de
+# proximidade da página de restaurantes.
+
+import numpy as np
+import pandas as pd
+
+from utils import grid
+from utils.data import DATA_PATH, load_derived, map_categories
+from utils.geo import EARTH_RADIUS_KM, haversine_distance
+
+# Nível da grade do índice (células de ~5 km)
+INDEX_LEVEL = 12
+
+
+class SpatialIndex:
+    """
+        Índice de pontos por célula da grade para buscas por raio e vizinho
+        mais próximo
+
+        Input: arrays de latitude e longitude, nível da grade
+    """
+
+    def __init__( self, lat, lon, level=INDEX_LEVEL ):
+        lat = np.asarray( lat, dtype=np.float64 )
+        lon = np.asarray( lon, dtype=np.float64 )
+        validos = np.flatnonzero( grid.valid_points( lat, lon ) )
+        cells = grid.cell_ids( lat[validos], lon[validos], level )
+        ordem = np.argsort( cells, kind='stable' )
+
+        self.level = level
+        self.positions = validos[ordem]
+        self.cells = cells[ordem]
+        self.lat = lat[self.positions]
+        self.lon = lon[self.positions]
+
+    def __len__( self ):
+        return len( self.positions )
+
+    def _candidates( self, lat, lon, km ):
+        """
+            Posições no índice dos pontos nas células que cruzam o retângulo
+            envolvente do círculo
+        """
+        n = 2**self.level
+        dlat = np.degrees( km / EARTH_RADIUS_KM )
+        dlon = dlat / max( np.cos( np.radians( min( abs( lat ) + dlat, 89.9 ) ) ), 1e-6 )
+
+        row0, col0 = np.divmod( grid.cell_ids( lat - dlat, lon - dlon, self.level ), n )
+        row1, col1 = np.divmod( grid.cell_ids( lat + dlat, lon + dlon, self.level ), n )
+
+        rows = np.arange( row0, row1 + 1 )
+        inicio = np.searchsorted( self.cells, rows * n + col0, side='left' )
+        fim = np.searchsorted( self.cells, rows * n + col1, side='right' )
+
+        return np.concatenate( [np.arange( a, b ) for a, b in zip( inicio, fim )] )
+
+    def radius( self, lat, lon, km ):
+        """
+            Esta função tem a responsabilidade de encontrar os pontos a até km
+            quilômetros de uma coordenada
+
+            Input: latitude, longitude, raio em km
+            Output: (posições originais dos pontos, distâncias em km), em
+                    ordem de distância
+        """
+        idx = self._candidates( lat, lon, km )
+        dist = haversine_distance( lat, lon, self.lat[idx], self.lon[idx] )
+        dentro = dist <= km
+        idx, dist = idx[dentro], dist[dentro]
+        ordem = np.argsort( dist, kind='stable' )
+
+        return self.positions[idx[ordem]], dist[ordem]
+
+    def nearest( self, lat, lon, k=1, start_km=1.0 ):
+        """
+            Os k pontos mais próximos de uma coordenada
+
+            O raio de busca dobra até encontrar k pontos; o resultado é exato
+            porque todos os pontos dentro do raio final são comparados.
+
+            Input: latitude, longitude, quantidade k, raio inicial em km
+            Output: (posições originais dos pontos, distâncias em km)
+        """
+        k = min( k, len( self ) )
+        km = start_km
+        while True:
+            positions, dist = self.radius( lat, lon, km )
+            if len( positions ) >= k or km >= np.pi * EARTH_RADIUS_KM:
+                return positions[:k], dist[:k]
+            km *= 2
+
+
+class OrderLocations:
+    """
+        Índices espaciais dos locais de entrega e dos restaurantes
+
+        Input: Dataframe limpo (na mesma ordem de linhas do FilterIndex)
+    """
+
+    def __init__( self, df1 ):
+        self.size = len( df1 )
+        self.deliveries = SpatialIndex( df1['Delivery_location_latitude'], df1['Delivery_location_longitude'] )
+        self.time = df1['Time_taken(min)'].to_numpy( dtype=np.float64 )
+        self.distance = df1['distance'].to_numpy( dtype=np.float64 )
+
+        # Um restaurante por coordenada distinta, identificado pelo prefixo dos
+        # entregadores que atendem nele (INDORES13DEL02 -> INDORES13)
+        df_aux = df1.loc[:, ['Restaurant_latitude', 'Restaurant_longitude', 'City']]
+        df_aux['restaurant'] = map_categories( df1['Delivery_person_ID'], lambda s: s.str.split( 'DEL' ).str[0] )
+        grupos = df_aux.groupby( ['Restaurant_latitude', 'Restaurant_longitude'], sort=True )
+        restaurants = grupos.agg( restaurant=( 'restaurant', 'first' ), City=( 'City', 'first' ),
+                                  orders=( 'City', 'size' ) ).reset_index()
+        restaurants = restaurants.loc[grid.valid_points( restaurants['Restaurant_latitude'],
+                                                         restaurants['Restaurant_longitude'] )]
+        restaurants['label'] = ( restaurants['restaurant'] + ' ('
+                                 + restaurants['Restaurant_latitude'].round( 4 ).astype( str ) + ', '
+                                 + restaurants['Restaurant_longitude'].round( 4 ).astype( str ) + ')' )
+
+        self.restaurants = restaurants.sort_values( 'orders', ascending=False, ignore_index=True )
+        self.restaurant_index = SpatialIndex( self.restaurants['Restaurant_latitude'],
+                                              self.restaurants['Restaurant_longitude'] )
+
+    def mask( self, rows ):
+        """
+            Máscara booleana a partir das linhas do FilterIndex (slice ou posições)
+        """
+        if rows is None:
+            return np.ones( self.size, dtype=bool )
+        linhas = np.zeros( self.size, dtype=bool )
+        linhas[rows] = True
+        return linhas
+
+    def orders_near( self, lat, lon, km, rows=None ):
+        """
+            Pedidos entregues a até km quilômetros de uma coordenada
+
+            Input: latitude, longitude, raio em km, linhas dos filtros
+            Output: dicionário com orders, time_mean e distance_mean
+        """
+        positions, _ = self.deliveries.radius( lat, lon, km )
+        positions = positions[self.mask( rows )[positions]]
+
+        return { 'orders': len( positions ),
+                 'time_mean': self.time[positions].mean() if len( positions ) else np.nan,
+                 'distance_mean': self.distance[positions].mean() if len( positions ) else np.nan }
+
+    def nearest_restaurants( self, lat, lon, k=5 ):
+        """
+            Os k restaurantes mais próximos de uma coordenada
+
+            Output: Dataframe com restaurant, City, orders e distance_km
+        """
+        positions, dist = self.restaurant_index.nearest( lat, lon, k )
+        df_aux = self.restaurants.loc[positions, ['restaurant', 'City', 'orders', 'label']].reset_index( drop=True )
+        df_aux['distance_km'] = dist
+
+        return df_aux
+
+    def zones( self, level=10, rows=None ):
+        """
+            Esta função tem a responsabilidade de agregar os pedidos por zona
+            (célula da grade) do local de entrega
+
+            Input: nível da grade das zonas, linhas dos filtros
+            Output: Dataframe com zone, latitude, longitude, orders,
+                    time_mean e distance_mean, da zona com mais pedidos à
+                    com menos
+        """
+        idx = self.deliveries
+        linhas = self.mask( rows )[idx.positions]
+        zonas = grid.parent_ids( idx.cells[linhas], idx.level, level )
+        positions = idx.positions[linhas]
+
+        codigos, zona = np.unique( zonas, return_inverse=True )
+        orders = np.bincount( zona, minlength=len( codigos ) )
+        with np.errstate( invalid='ignore' ):
+            time_mean = np.bincount( zona, self.time[positions], len( codigos ) ) / orders
+            distance_mean = np.bincount( zona, self.distance[positions], len( codigos ) ) / orders
+
+        lat, lon = grid.cell_centers( codigos, level )
+        df_aux = pd.DataFrame( { 'zone': codigos, 'latitude': lat, 'longitude': lon, 'orders': orders,
+                                 'time_mean': time_mean, 'distance_mean': distance_mean } )
+
+        return df_aux.sort_values( ['orders', 'zone'], ascending=[False, True], ignore_index=True )
+
+
+def load_locations( path=DATA_PATH ):
+    """
+        OrderLocations do dataset atual, construído uma vez por versão do CSV
+    """
+    return load_derived( 'locations', OrderLocations, path )
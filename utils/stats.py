@@ -0,0 +1,165 @@
+# ================================
+# Estatísticas por grupo
+# ================================
+#
+# Médias e desvios padrão são guardados como acumuladores (n, média, M2), o
+# formato do algoritmo de Welford. Acumuladores de blocos, processos ou
+# células diferentes são combinados pela fórmula de Chan:
+#
+#   n = n_a + n_b
+#   média = (n_a * média_a + n_b * média_b) / n
+#   M2 = M2_a + M2_b + n_a * (média_a - média)^2 + n_b * (média_b - média)^2
+#
+# que é numericamente estável, ao contrário de soma e soma dos quadrados.
+#
+# O StatsEngine calcula de uma só vez todos os agrupamentos usados pelas
+# páginas para um estado dos filtros e guarda o resultado, de modo que cada
+# widget apenas lê a tabela já pronta.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Agrupamentos usados pelos widgets das páginas
+STAT_GROUPINGS = {
+    'total': [],
+    'traffic': ['Road_traffic_density'],
+    'weather': ['Weatherconditions'],
+    'festival': ['Festival'],
+    'city': ['City'],
+    'city_traffic': ['City', 'Road_traffic_density'],
+    'city_order': ['City', 'Type_of_order'],
+}
+
+
+def moments( df_aux, keys, values ):
+    """
+        Acumuladores (n, média, M2) por grupo
+        
+        Input: Dataframe, colunas do agrupamento, {nome da medida: coluna}
+        Output: Dataframe indexado pelas chaves com <medida>_n, <medida>_mean
+                e <medida>_m2
+    """
+    grupos = df_aux.groupby( keys, observed=True )
+    result = {}
+    for name, col in values.items():
+        serie = grupos[col]
+        n = serie.count()
+        result[f'{name}_n'] = n
+        result[f'{name}_mean'] = serie.mean()
+        result[f'{name}_m2'] = serie.var( ddof=0 ) * n
+    return pd.DataFrame( result )
+
+def combine( df_aux, keys, measures ):
+    """
+        Esta função tem a responsabilidade de combinar acumuladores (n, média,
+        M2) de várias linhas de um mesmo grupo pela fórmula de Chan
+        
+        Input: Dataframe de acumuladores, colunas do agrupamento ([] = total),
+               nomes das medidas
+        Output: Dataframe indexado pelas chaves com os acumuladores combinados
+    """
+    total_geral = not keys
+    if total_geral:
+        df_aux = df_aux.assign( _total=0 )
+        keys = ['_total']
+
+    grupos = df_aux.groupby( keys, observed=True, sort=True )
+    ids = grupos.ngroup().to_numpy()
+    index = grupos.size().index
+
+    # O total geral sempre tem uma linha, mesmo sem nenhum acumulador
+    if total_geral:
+        index = pd.Index( [0], name='_total' )
+
+    result = {}
+    for name in measures:
+        n = df_aux[f'{name}_n'].to_numpy( dtype=np.float64 )
+        mean = np.nan_to_num( df_aux[f'{name}_mean'].to_numpy( dtype=np.float64 ) )
+        m2 = np.nan_to_num( df_aux[f'{name}_m2'].to_numpy( dtype=np.float64 ) )
+
+        total = np.bincount( ids, weights=n, minlength=len( index ) )
+        with np.errstate( invalid='ignore', divide='ignore' ):
+            media = np.bincount( ids, weights=n * mean, minlength=len( index ) ) / total
+        delta = mean - np.nan_to_num( media )[ids]
+        soma_m2 = np.bincount( ids, weights=m2 + n * delta ** 2, minlength=len( index ) )
+
+        result[f'{name}_n'] = total
+        result[f'{name}_mean'] = media
+        result[f'{name}_m2'] = soma_m2
+
+    return pd.DataFrame( result, index=index )
+
+def finalize( df_aux, measures ):
+    """
+        Média e desvio padrão amostral (ddof=1, como no pandas) a partir dos
+        acumuladores
+        
+        Input: Dataframe de acumuladores, nomes das medidas
+        Output: Dataframe com <medida>_mean e <medida>_std adicionados
+    """
+    df_aux = df_aux.copy()
+    for name in measures:
+        n = df_aux[f'{name}_n']
+        df_aux[f'{name}_std'] = np.sqrt( df_aux[f'{name}_m2'] / ( n - 1 ) ).where( n > 1 )
+    return df_aux
+
+
+class StatsEngine:
+    """
+        Estatísticas de todos os agrupamentos das páginas, calculadas juntas
+        e guardadas por estado dos filtros
+        
+        Input: OrderCube, agrupamentos, quantidade de estados em cache
+    """
+
+    def __init__( self, cube, groupings=STAT_GROUPINGS, max_states=64 ):
+        self.cube = cube
+        self.groupings = groupings
+        self.max_states = max_states
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get( self, date_limit=None, traffic_options=None ):
+        """
+            Estatísticas para um estado dos filtros da barra lateral
+            
+            Input: data limite (exclusiva), valores de tráfego selecionados
+            Output: dicionário nome do agrupamento -> Dataframe com n, média e
+                    desvio padrão de cada medida
+        """
+        key = ( None if date_limit is None else pd.Timestamp( date_limit ),
+                None if traffic_options is None else tuple( sorted( traffic_options ) ) )
+
+        with self._lock:
+            if key in self._states:
+                self._states.move_to_end( key )
+                return self._states[key]
+
+        result = self.compute( date_limit, traffic_options )
+
+        with self._lock:
+            self._states[key] = result
+            while len( self._states ) > self.max_states:
+                self._states.popitem( last=False )
+
+        return result
+
+    def compute( self, date_limit=None, traffic_options=None ):
+        """
+            Uma passada pelas células filtradas gera a base com todas as
+            colunas de agrupamento; cada agrupamento é combinado a partir dela
+        """
+        from utils.cube import MEASURES
+
+        cells = self.cube.filter( date_limit, traffic_options ).cells
+        colunas = list( dict.fromkeys( col for keys in self.groupings.values() for col in keys ) )
+        base = combine( cells, colunas, MEASURES ).reset_index()
+
+        result = {}
+        for name, keys in self.groupings.items():
+            df_aux = finalize( combine( base, keys, MEASURES ), MEASURES )
+            result[name] = df_aux.reset_index( drop=not keys )
+        return result
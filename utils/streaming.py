@@ -0,0 +1,128 @@
+# ================================
+# Ingestão em blocos
+# ================================
+#
+# Para CSVs maiores que a memória disponível: o arquivo é lido em blocos de
+# tamanho limitado, cada bloco passa pelo clean_code e é agregado em um cubo
+# parcial, que é unido ao cubo acumulado (merge_cubes). Nenhum momento exige
+# o dataframe completo, e o cubo final é o mesmo da construção em memória.
+#
+# O tamanho do bloco é calculado a partir de um orçamento de memória. Se o
+# bloco em processamento somado ao cubo acumulado passar do orçamento, a
+# ingestão é interrompida com MemoryError em vez de crescer sem limite.
+#
+# Os limites da barra lateral (stream_domains) e a tabela de entregadores
+# (stream_couriers) também são montados bloco a bloco. Os cubos dos estados
+# com filtros de cidade, clima, veículo ou festival são construídos relendo
+# o CSV só com as linhas selecionadas de cada bloco (stream_cube com select).
+
+from utils.couriers import CourierTable
+from utils.cube import build_cube, merge_cubes
+from utils.data import DATA_PATH, clean_code, read_data
+from utils.filters import dataset_domains, merge_domains
+
+# Linhas lidas para estimar a memória ocupada por linha
+SAMPLE_ROWS = 1000
+
+# O clean_code mantém cópias intermediárias do bloco enquanto limpa
+CLEAN_OVERHEAD = 3
+
+
+def bytes_per_row( path=DATA_PATH ):
+    """
+        Estimativa da memória por linha durante a limpeza de um bloco
+        
+        Input: caminho do CSV
+        Output: bytes por linha
+    """
+    amostra = read_data( path, nrows=SAMPLE_ROWS )
+    return CLEAN_OVERHEAD * amostra.memory_usage( deep=True ).sum() / max( len( amostra ), 1 )
+
+def chunk_rows_for( max_memory_mb, path=DATA_PATH ):
+    """
+        Quantidade de linhas por bloco para metade do orçamento; a outra
+        metade fica para o cubo acumulado
+        
+        Input: orçamento em MB, caminho do CSV
+        Output: linhas por bloco
+    """
+    orcamento = max_memory_mb * 2**20 / 2
+    return max( int( orcamento / bytes_per_row( path ) ), 1 )
+
+def iter_clean_chunks( path=DATA_PATH, chunk_rows=100_000 ):
+    """
+        Blocos do CSV já limpos pelo clean_code
+        
+        Input: caminho do CSV, linhas por bloco
+        Output: iterador de Dataframes limpos
+    """
+    with read_data( path, chunksize=chunk_rows ) as reader:
+        for chunk in reader:
+            yield clean_code( chunk )
+
+def stream_cube( path=DATA_PATH, max_memory_mb=256, chunk_rows=None, select=None, **kwargs ):
+    """
+        Esta função tem a responsabilidade de construir o cubo de agregados
+        lendo o CSV em blocos
+        
+        Input: caminho do CSV, orçamento de memória em MB, linhas por bloco
+               (calculado pelo orçamento se omitido), função que recebe o
+               bloco limpo e devolve a máscara das linhas agregadas (None =
+               todas), argumentos do build_cube
+        Output: OrderCube
+    """
+    orcamento = max_memory_mb * 2**20
+    chunk_rows = chunk_rows or chunk_rows_for( max_memory_mb, path )
+
+    cube = None
+    for numero, df_chunk in enumerate( iter_clean_chunks( path, chunk_rows ), start=1 ):
+        uso = df_chunk.memory_usage( deep=True ).sum() * CLEAN_OVERHEAD
+        if cube is not None:
+            uso += cube.memory_usage()
+        if uso > orcamento:
+            raise MemoryError( f'bloco {numero} usa {uso / 2**20:.1f} MB, acima do limite de {max_memory_mb} MB' )
+
+        if select is not None:
+            df_chunk = df_chunk.loc[select( df_chunk )]
+        parcial = build_cube( df_chunk, **kwargs )
+        cube = parcial if cube is None else merge_cubes( [cube, parcial] )
+
+    if cube is None:
+        return build_cube( clean_code( read_data( path, nrows=0 ) ), **kwargs )
+
+    return cube
+
+def stream_domains( path=DATA_PATH, max_memory_mb=256, chunk_rows=None ):
+    """
+        Limites e valores dos filtros (utils.filters.dataset_domains) lendo o
+        CSV em blocos
+
+        Input: caminho do CSV, orçamento de memória em MB, linhas por bloco
+        Output: dicionário de dataset_domains
+    """
+    chunk_rows = chunk_rows or chunk_rows_for( max_memory_mb, path )
+
+    domains = None
+    for df_chunk in iter_clean_chunks( path, chunk_rows ):
+        if len( df_chunk ) == 0:
+            continue
+        parcial = dataset_domains( df_chunk )
+        domains = parcial if domains is None else merge_domains( domains, parcial )
+
+    return domains if domains is not None else dataset_domains( clean_code( read_data( path, nrows=0 ) ) )
+
+def stream_couriers( path=DATA_PATH, max_memory_mb=256, chunk_rows=None ):
+    """
+        CourierTable lendo o CSV em blocos: cada bloco é somado à tabela com
+        update, como as linhas novas do CSV
+
+        Input: caminho do CSV, orçamento de memória em MB, linhas por bloco
+        Output: CourierTable
+    """
+    chunk_rows = chunk_rows or chunk_rows_for( max_memory_mb, path )
+
+    couriers = CourierTable( clean_code( read_data( path, nrows=0 ) ) )
+    for df_chunk in iter_clean_chunks( path, chunk_rows ):
+        couriers.update( df_chunk )
+
+    return couriers
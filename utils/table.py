@@ -0,0 +1,117 @@
+# ================================
+# Tabelas paginadas no servidor
+# ================================
+#
+# As tabelas grandes (uma linha por entregador, por exemplo) ficam no
+# servidor, no cache de resultados. A busca e a ordenação geram uma "visão":
+# as posições das linhas que passam pela busca, na ordem pedida. A visão também
+# fica no cache, por estado dos filtros, então trocar de página só recorta as
+# posições e o navegador recebe apenas as linhas da página visível.
+#
+# paged_table desenha a tabela nas páginas: busca, coluna de ordenação,
+# ordem e página. É um fragmento do Streamlit, então mexer na tabela executa
+# só ela.
+
+import numpy as np
+import pandas as pd
+
+# Linhas por página
+PAGE_SIZE = 20
+
+
+def search_mask( df, search ):
+    """
+        Linhas com o texto buscado (sem diferenciar maiúsculas) em alguma
+        coluna de texto; nas categóricas a busca é feita só nas categorias
+
+        Input: Dataframe, texto buscado
+        Output: array booleano
+    """
+    linhas = np.zeros( len( df ), dtype=bool )
+    for col in df.columns:
+        serie = df[col]
+        if isinstance( serie.dtype, pd.CategoricalDtype ):
+            achou = serie.cat.categories.astype( str ).str.contains( search, case=False, regex=False )
+            linhas |= np.append( np.asarray( achou, dtype=bool ), False )[serie.cat.codes.to_numpy()]
+        elif pd.api.types.is_string_dtype( serie.dtype ) or serie.dtype == object:
+            linhas |= serie.astype( str ).str.contains( search, case=False, regex=False ).to_numpy( dtype=bool )
+
+    return linhas
+
+def table_view( df, search='', sort_by=None, descending=False ):
+    """
+        Esta função tem a responsabilidade de buscar e ordenar as linhas de
+        uma tabela sem copiá-la
+
+        A ordenação é estável e os valores vazios ficam no final.
+
+        Input: Dataframe, texto buscado, coluna de ordenação, ordem decrescente
+        Output: array com as posições das linhas, na ordem da tabela exibida
+    """
+    positions = np.arange( len( df ) )
+    if search:
+        positions = positions[search_mask( df, search )]
+
+    if sort_by:
+        valores = df[sort_by].iloc[positions]
+        ordem = valores.reset_index( drop=True ).sort_values( ascending=not descending, kind='stable',
+                                                              na_position='last' ).index.to_numpy()
+        positions = positions[ordem]
+
+    return positions
+
+def page_count( total, page_size=PAGE_SIZE ):
+    return max( 1, -( -total // page_size ) )
+
+def page_slice( df, positions, page=1, page_size=PAGE_SIZE ):
+    """
+        Linhas de uma página da visão (páginas a partir de 1)
+
+        Input: Dataframe, posições de table_view, página, linhas por página
+        Output: Dataframe com as linhas da página
+    """
+    page = min( max( int( page ), 1 ), page_count( len( positions ), page_size ) )
+    inicio = ( page - 1 ) * page_size
+    return df.iloc[positions[inicio:inicio + page_size]]
+
+
+# ===============================
+# Tabela nas páginas
+# ===============================
+def paged_table( context, name, key, page_size=PAGE_SIZE, **params ):
+    """
+        Esta função tem a responsabilidade de mostrar uma métrica em tabela
+        paginada, com busca e ordenação feitas no servidor
+
+        Input: FilterContext, nome da métrica, chave dos widgets, linhas por
+               página, opções da métrica
+    """
+    import streamlit as st
+
+    @st.fragment
+    def render( context ):
+        df_aux = context.query( name, **params )
+
+        col1, col2, col3 = st.columns( [3, 2, 1] )
+        search = col1.text_input( 'Buscar', key=f'{key}_search' )
+        sort_by = col2.selectbox( 'Ordenar por', ['-'] + df_aux.columns.tolist(), key=f'{key}_sort' )
+        descending = col3.toggle( 'Decrescente', key=f'{key}_desc' )
+
+        positions = context.table_view( name, search=search, sort_by='' if sort_by == '-' else sort_by,
+                                        descending=descending, **params )
+        paginas = page_count( len( positions ), page_size )
+
+        # A busca pode reduzir a quantidade de páginas abaixo da página atual
+        if st.session_state.get( f'{key}_page', 1 ) > paginas:
+            st.session_state[f'{key}_page'] = paginas
+
+        st.dataframe( page_slice( df_aux, positions, st.session_state.get( f'{key}_page', 1 ), page_size ),
+                      hide_index=True )
+
+        col4, col5 = st.columns( [1, 3] )
+        page = col4.number_input( 'Página', min_value=1, max_value=paginas, step=1, key=f'{key}_page' )
+        inicio = ( page - 1 ) * page_size
+        col5.caption( f'{min( inicio + 1, len( positions ) )}–{min( inicio + page_size, len( positions ) )} '
+                      f'de {len( positions )} linhas ({len( df_aux )} no total)' )
+
+    render( context )
@@ -0,0 +1,187 @@
+# ================================
+# Pré-cálculo das métricas em segundo plano
+# ================================
+#
+# As métricas de cada página (nome e opções) estão em utils.metrics.PAGE_METRICS;
+# register() acrescenta outras. A Home e as páginas iniciam a thread com
+# schedule(), e ela pré-calcula todas as páginas, inclusive as que ainda não
+# foram abertas. A thread calcula essas métricas para os estados de filtro
+# mais comuns e guarda os resultados no cache de resultados
+# (utils.cache), de modo que a primeira renderização desses estados é apenas
+# uma leitura do cache:
+#
+# - o estado padrão da barra lateral (06-04-2022, ou a data mais próxima dentro
+#   do período dos dados, todos os tráfegos e sem os demais filtros)
+# - cada virada de semana entre a primeira e a última data, com todos os tráfegos
+# - cada tipo de tráfego sozinho, na data padrão
+#
+# Primeiro vêm as métricas do cubo e das tabelas agregadas, baratas, em todos
+# os estados. As que usam os pedidos linha a linha (índice espacial e modelo
+# de tempo de entrega) vêm depois e só no estado padrão, para não disputarem
+# com a primeira renderização das páginas.
+#
+# A thread confere a versão do CSV a cada CURRY_WARMUP_POLL segundos (padrão:
+# 10). Quando o CSV muda, o trabalho pendente da versão anterior é cancelado e
+# o pré-cálculo recomeça para a versão nova, sem esperar uma página ser
+# aberta. CURRY_WARMUP=0 desativa.
+
+import os
+import threading
+
+import pandas as pd
+
+from utils.cube import load_cube
+from utils.data import DATA_PATH, file_key
+from utils.metrics import DEFAULT_DATE, DEFAULT_TRAFFIC, PAGE_METRICS, FilterContext, available, needs_rows
+
+WARMUP_ENABLED = os.environ.get( 'CURRY_WARMUP', '1' ) not in ( '0', 'false', 'no' )
+POLL_SECONDS = float( os.environ.get( 'CURRY_WARMUP_POLL', '10' ) )
+
+_registry = { page: list( metrics ) for page, metrics in PAGE_METRICS.items() }
+_registry_lock = threading.Lock()
+
+
+def register( page, metrics ):
+    """
+        Esta função tem a responsabilidade de registrar as métricas de uma página
+
+        Input: nome da página, lista de (nome da métrica, opções); uma opção
+               pode ser uma função que recebe o FilterContext do estado
+    """
+    with _registry_lock:
+        _registry[page] = list( metrics )
+
+def default_states( dates, traffic=DEFAULT_TRAFFIC ):
+    """
+        Estados de filtro pré-calculados
+
+        Input: datas disponíveis nos dados
+        Output: lista de (data limite, tráfegos), sem repetições
+    """
+    # A mesma data padrão da barra lateral (utils.filters.dataset_domains)
+    padrao = DEFAULT_DATE
+    if len( dates ):
+        padrao = min( max( DEFAULT_DATE, pd.Timestamp( min( dates ) ) ), pd.Timestamp( max( dates ) ) )
+
+    estados = [( padrao, tuple( traffic ) )]
+    if len( dates ):
+        for semana in pd.date_range( min( dates ), max( dates ), freq='W-SUN' ):
+            estados.append( ( semana, tuple( traffic ) ) )
+    for value in traffic:
+        estados.append( ( padrao, ( value, ) ) )
+
+    return list( dict.fromkeys( estados ) )
+
+
+class WarmupScheduler:
+    """
+        Thread que pré-calcula as métricas registradas para cada versão do CSV
+
+        Input: caminho do CSV, função que gera os estados de filtro a partir
+               das datas dos dados
+    """
+
+    def __init__( self, path=DATA_PATH, states=default_states ):
+        self.path = path
+        self.states = states
+        self._progress = { 'version': None, 'done': 0, 'total': 0, 'running': False,
+                           'cancelled': 0, 'errors': 0 }
+        self._warmed = set()      # (versão, página) já pré-calculadas
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def progress( self ):
+        """
+            Cópia do andamento do pré-cálculo, lida pela Home
+        """
+        with self._lock:
+            return dict( self._progress )
+
+    def _update( self, **values ):
+        # Alterações do andamento, feitas na thread de pré-cálculo
+        with self._lock:
+            for key, value in values.items():
+                self._progress[key] = value( self._progress[key] ) if callable( value ) else value
+
+    def schedule( self ):
+        """
+            Pede um pré-cálculo: inicia a thread na primeira chamada e, nas
+            seguintes, só a acorda (página nova registrada); a versão nova do
+            CSV a thread percebe sozinha
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread( target=self._run, name='curry-warmup', daemon=True )
+                self._thread.start()
+        self._wake.set()
+
+    def _pending( self, version ):
+        # Métricas indisponíveis com CURRY_MAX_MEMORY_MB ficam de fora
+        with _registry_lock:
+            return { page: [( name, params ) for name, params in metrics if available( name )]
+                     for page, metrics in _registry.items() if ( version, page ) not in self._warmed }
+
+    def _run( self ):
+        while True:
+            # Acorda com schedule() ou, sem ele, para conferir a versão do CSV
+            self._wake.wait( POLL_SECONDS )
+            self._wake.clear()
+
+            version = file_key( self.path )
+            pages = self._pending( version )
+            if pages:
+                self._warm( version, pages )
+
+    def _warm( self, version, pages ):
+        """
+            Calcula as métricas das páginas pendentes em todos os estados;
+            para assim que o CSV muda de versão
+        """
+        dates = load_cube( self.path ).cells['Order_Date'].unique()
+        estados = self.states( dates )
+        metricas = [( name, params ) for metrics in pages.values() for name, params in metrics]
+
+        # Métricas baratas em todos os estados; as que usam os pedidos, só no padrão
+        trabalho = [( estado, name, params ) for estado in estados
+                    for name, params in metricas if not needs_rows( name )]
+        trabalho += [( estados[0], name, params ) for name, params in metricas if needs_rows( name )]
+        self._update( version=version, done=0, total=len( trabalho ), running=True )
+
+        context, atual = None, None
+        try:
+            for estado, name, params in trabalho:
+                if file_key( self.path ) != version:
+                    # Versão nova: o resto do trabalho é descartado e a
+                    # thread recomeça com a versão atual
+                    self._update( cancelled=lambda n: n + 1 )
+                    self._wake.set()
+                    return
+
+                # O trabalho está agrupado por estado: um contexto de cada vez
+                if estado != atual:
+                    context, atual = FilterContext( *estado, self.path ), estado
+                try:
+                    context.query( name, **{ key: value( context ) if callable( value ) else value
+                                             for key, value in params.items() } )
+                except Exception:
+                    # A página calcula a métrica normalmente quando for exibida
+                    self._update( errors=lambda n: n + 1 )
+                self._update( done=lambda n: n + 1 )
+        finally:
+            self._update( running=False )
+
+        self._warmed.update( ( version, page ) for page in pages )
+
+
+# Agendador único do processo
+scheduler = WarmupScheduler()
+
+
+def schedule():
+    """
+        Agenda o pré-cálculo das métricas registradas, se estiver ativado
+    """
+    if WARMUP_ENABLED:
+        scheduler.schedule()